@@ -0,0 +1,102 @@
+# asset_fields.py
+"""
+Typed, indexed copies of the Datto device fields the app filters and reports on.
+
+Datto's antivirus and patch-management details are stored whole as JSON text
+(assets.antivirus_data and assets.patch_management_data). The handful of fields
+that are actually used are also written to their own columns by pull_datto as it
+syncs, so the assets table and reports can filter and group on them through an
+index instead of parsing JSON for every row of every request.
+"""
+import json
+
+from sync_state import ensure_column
+from text_compression import read_text
+
+# (column, type) of the typed fields, in the order extract_asset_fields returns them
+ASSET_FIELD_COLUMNS = [
+    ('antivirus_product', 'TEXT'),
+    ('antivirus_status', 'TEXT'),
+    ('patch_status', 'TEXT'),
+    ('patches_pending', 'INTEGER'),
+    ('patches_installed', 'INTEGER'),
+    ('reboot_required', 'BOOLEAN'),
+]
+ASSET_FIELD_INDEXES = {
+    'idx_assets_antivirus_status': ('antivirus_status', 'company_account_number'),
+    'idx_assets_patch_status': ('patch_status', 'company_account_number'),
+}
+
+# Datto's status codes and how they are shown
+ANTIVIRUS_STATUS_LABELS = {
+    'RunningAndUpToDate': 'Up to date',
+    'RunningAndNotUpToDate': 'Out of date',
+    'NotRunning': 'Not running',
+    'NotDetected': 'Not detected',
+}
+PATCH_STATUS_LABELS = {
+    'FullyPatched': 'Fully patched',
+    'ApprovedPending': 'Approved, pending',
+    'RebootRequired': 'Reboot required',
+    'InstallError': 'Install error',
+    'NoPolicy': 'No policy',
+    'NoData': 'No data',
+}
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_asset_fields(antivirus, patch_management, reboot_required=None):
+    """Returns the typed column values from a device's antivirus and patchManagement dicts and rebootRequired flag."""
+    antivirus = antivirus or {}
+    patch_management = patch_management or {}
+    return (
+        antivirus.get('antivirusProduct'),
+        antivirus.get('antivirusStatus'),
+        patch_management.get('patchStatus'),
+        _to_int(patch_management.get('patchesApprovedPending')),
+        _to_int(patch_management.get('patchesInstalled')),
+        reboot_required,
+    )
+
+
+def _from_json(text):
+    try:
+        value = json.loads(read_text(text)) if text else None
+    except (TypeError, ValueError):
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def backfill_asset_fields(cur):
+    """
+    Fills the typed columns from the stored JSON of every Datto asset. Returns the
+    number of rows. reboot_required is not part of the JSON and waits for the next sync.
+    """
+    cur.execute("SELECT id, antivirus_data, patch_management_data FROM assets WHERE datto_uid IS NOT NULL")
+    rows = [extract_asset_fields(_from_json(antivirus), _from_json(patch_management)) + (asset_id,)
+            for asset_id, antivirus, patch_management in cur.fetchall()]
+    setters = ', '.join(f"{column} = ?" for column, _ in ASSET_FIELD_COLUMNS)
+    cur.executemany(f"UPDATE assets SET {setters} WHERE id = ?", rows)
+    return len(rows)
+
+
+def ensure_asset_fields(cur):
+    """
+    Adds the typed columns and their indexes to databases built before they existed,
+    filling them from the JSON already stored so they are usable before the next sync.
+    """
+    cur.execute("PRAGMA table_info(assets)")
+    existing = {row[1] for row in cur.fetchall()}
+    missing = [(column, definition) for column, definition in ASSET_FIELD_COLUMNS if column not in existing]
+    for column, definition in missing:
+        ensure_column(cur, 'assets', column, definition)
+    for index_name, columns in ASSET_FIELD_INDEXES.items():
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON assets ({', '.join(columns)})")
+    if missing:
+        print(f"Filled the typed antivirus and patch columns of {backfill_asset_fields(cur)} assets.")
@@ -0,0 +1,143 @@
+# bulk_push.py
+"""
+Concurrent, idempotent pushes of one value per item to an external API.
+
+push_account_nums_to_datto and set_account_numbers each write an account number
+to many items. The values last pushed are kept in the pushed_values table (see
+sync_state), so the scripts only call the API for items whose desired value
+differs from what was pushed before; a re-run with nothing to change makes no
+write requests at all.
+
+Pusher.run calls a push function for each remaining item on a small worker
+pool. The push function makes its requests through Pusher.send(), which takes a
+token from the shared per-host rate limiter, waits out 429s and lets
+AdaptiveConcurrency shrink the number of requests in flight while the API is
+pushing back. Results come back to the calling thread, which owns the database
+connection, and PushSummary prints them as a diff.
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from job_metrics import record_api_call
+from job_runner import check_cancelled, submit_in_job_context
+from rate_limiter import AdaptiveConcurrency
+
+PUSH_WORKERS = 8 # Upper bound on concurrent pushes
+INITIAL_PUSH_WORKERS = 4
+RATE_LIMIT_RETRIES = 10 # 429s are waited out rather than failing the push
+
+# What a push did to an item
+CREATED = 'created'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+MISMATCH = 'mismatch' # Holds a different value that was left alone
+FAILED = 'failed'
+
+
+class PushResult:
+    """The outcome of one push: what happened, the value found before it and any error."""
+
+    def __init__(self, item, outcome, old_value=None, error=None):
+        self.item = item
+        self.outcome = outcome
+        self.old_value = old_value
+        self.error = error
+
+
+class Pusher:
+    """The rate limiter and concurrency cap shared by all requests of one bulk push."""
+
+    def __init__(self, limiter, max_workers=PUSH_WORKERS, initial_workers=INITIAL_PUSH_WORKERS):
+        self.limiter = limiter
+        self.max_workers = max_workers
+        self.concurrency = AdaptiveConcurrency(min(initial_workers, max_workers), maximum=max_workers)
+
+    def send(self, method, url, **kwargs):
+        """
+        Makes one request, waiting for the rate limiter and retrying 429s. Returns the
+        response; request errors and other HTTP errors are raised.
+        """
+        rate_limited = 0
+        while True:
+            check_cancelled()
+            self.limiter.acquire()
+            with self.concurrency:
+                response = requests.request(method, url, timeout=30, **kwargs)
+            record_api_call(response)
+            self.limiter.update_from_headers(response.headers)
+            if response.status_code == 429 and rate_limited < RATE_LIMIT_RETRIES:
+                retry_after = int(response.headers.get('Retry-After', 10))
+                rate_limited += 1
+                self.concurrency.on_rate_limited()
+                self.limiter.pause(retry_after)
+                continue
+            self.concurrency.on_success()
+            response.raise_for_status()
+            return response
+
+    def run(self, items, push):
+        """
+        Calls push(item) for every item on the worker pool and yields a PushResult per
+        item as it completes. push returns (outcome, old_value); an exception from it
+        is reported as a failed push of that item.
+        """
+        def attempt(item):
+            try:
+                outcome, old_value = push(item)
+                return PushResult(item, outcome, old_value)
+            except requests.exceptions.RequestException as e:
+                detail = getattr(e.response, 'text', '') if getattr(e, 'response', None) is not None else ''
+                return PushResult(item, FAILED, error=f"{e} {detail}".strip())
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [submit_in_job_context(executor, attempt, item) for item in items]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                # Stopped early (cancelled or failed): drop what has not started yet.
+                for future in futures:
+                    future.cancel()
+
+
+class PushSummary:
+    """Collects push results and prints them as a diff of what changed upstream."""
+
+    def __init__(self, label):
+        self.label = label
+        self.counts = {CREATED: 0, CHANGED: 0, UNCHANGED: 0, MISMATCH: 0, FAILED: 0}
+        self.skipped = 0 # Already recorded as pushed, so not sent at all
+        self.lines = []
+        self.started = time.monotonic()
+
+    def add(self, name, result, new_value):
+        self.counts[result.outcome] += 1
+        if result.outcome == CREATED:
+            self.lines.append((name, f"+ {name}: {new_value}"))
+        elif result.outcome == CHANGED:
+            self.lines.append((name, f"~ {name}: {result.old_value} -> {new_value}"))
+        elif result.outcome == MISMATCH:
+            self.lines.append((name, f"? {name}: {result.old_value} -> {new_value} (would change)"))
+        elif result.outcome == FAILED:
+            self.lines.append((name, f"! {name}: {result.error}"))
+
+    def print(self):
+        print(f"\n--- {self.label}: changes ---")
+        if self.lines:
+            for _, line in sorted(self.lines):
+                print(line)
+        else:
+            print("No changes.")
+        elapsed = time.monotonic() - self.started
+        mismatched = f"{self.counts[MISMATCH]} would change, " if self.counts[MISMATCH] else ""
+        print(f"\n{self.counts[CREATED]} created, {self.counts[CHANGED]} changed, {mismatched}"
+              f"{self.counts[UNCHANGED] + self.skipped} already up to date "
+              f"({self.skipped} skipped from the pushed-values record), "
+              f"{self.counts[FAILED]} failed in {elapsed:.1f}s.")
+        if self.counts[MISMATCH]:
+            print(f"{self.counts[MISMATCH]} items hold a different value and were left as they are; see the '?' lines above.")
+        if self.counts[FAILED]:
+            print(f"{self.counts[FAILED]} pushes failed; see the '!' lines above.", file=sys.stderr)
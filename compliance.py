@@ -0,0 +1,88 @@
+# compliance.py
+"""
+Per-client patch and antivirus compliance, kept up to date by pull_datto.
+
+client_compliance holds one row of counts per client: antivirus and patch states
+(from the typed asset columns, see asset_fields), devices offline for longer than
+STALE_OFFLINE_DAYS and devices waiting for a reboot. pull_datto refreshes a
+client's row right after writing that client's devices, and the rows of clients
+that lost devices in the sweep, so the clients dashboard reads one row per client
+instead of going through every asset.
+"""
+from datetime import datetime, timezone, timedelta
+
+from job_metrics import timed
+
+STALE_OFFLINE_DAYS = 30
+
+# Count column -> SQL condition over an asset row
+COMPLIANCE_COUNTS = {
+    'av_up_to_date': "antivirus_status = 'RunningAndUpToDate'",
+    'av_out_of_date': "antivirus_status = 'RunningAndNotUpToDate'",
+    'av_not_running': "antivirus_status = 'NotRunning'",
+    'av_not_detected': "antivirus_status = 'NotDetected' OR antivirus_status IS NULL",
+    'patch_fully_patched': "patch_status = 'FullyPatched'",
+    'patch_pending': "patch_status = 'ApprovedPending'",
+    'patch_install_error': "patch_status = 'InstallError'",
+    'patch_no_policy': "patch_status = 'NoPolicy'",
+    'patch_no_data': "patch_status = 'NoData' OR patch_status IS NULL",
+    'reboot_pending': "reboot_required = 1 OR patch_status = 'RebootRequired'",
+    'offline_stale': "NOT is_online AND last_seen < :stale_before",
+}
+
+
+def ensure_compliance_table(cur):
+    """
+    Creates the rollup table, and the index its refresh relies on, on databases built
+    before them. A new table is filled from the assets already synced.
+    """
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'client_compliance'")
+    exists = cur.fetchone() is not None
+    counts = ',\n            '.join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in COMPLIANCE_COUNTS)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS client_compliance (
+            company_account_number TEXT PRIMARY KEY,
+            total_assets INTEGER NOT NULL DEFAULT 0,
+            {counts},
+            updated_at TEXT NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_assets_company ON assets (company_account_number)")
+    if not exists:
+        print(f"Built the compliance rollup for {refresh_all_compliance(cur)} clients.")
+
+
+def refresh_client_compliance(cur, account_numbers):
+    """
+    Recounts the compliance row of each given client from its Datto assets. Clients
+    without any Datto assets left lose their row. The caller commits.
+    """
+    now = datetime.now(timezone.utc)
+    stale_before = (now - timedelta(days=STALE_OFFLINE_DAYS)).isoformat()
+    sums = ', '.join(f"COALESCE(SUM(CASE WHEN {condition} THEN 1 ELSE 0 END), 0)" for condition in COMPLIANCE_COUNTS.values())
+    columns = ['company_account_number', 'total_assets'] + list(COMPLIANCE_COUNTS) + ['updated_at']
+    setters = ', '.join(f"{column} = excluded.{column}" for column in columns[1:])
+    with timed('db_write_seconds'):
+        for account_number in set(account_numbers):
+            cur.execute(f"""
+                SELECT COUNT(*), {sums} FROM assets
+                WHERE company_account_number = :account_number AND datto_uid IS NOT NULL
+            """, {'account_number': account_number, 'stale_before': stale_before})
+            counts = cur.fetchone()
+            if not counts[0]:
+                cur.execute("DELETE FROM client_compliance WHERE company_account_number = ?", (account_number,))
+                continue
+            cur.execute(f"""
+                INSERT INTO client_compliance ({', '.join(columns)})
+                VALUES ({', '.join(['?'] * len(columns))})
+                ON CONFLICT(company_account_number) DO UPDATE SET {setters}
+            """, (account_number,) + tuple(counts) + (now.isoformat(timespec='seconds'),))
+
+
+def refresh_all_compliance(cur):
+    """Rebuilds the rollup for every client. Returns the number of clients with Datto assets."""
+    cur.execute("SELECT DISTINCT company_account_number FROM assets WHERE datto_uid IS NOT NULL AND company_account_number IS NOT NULL")
+    account_numbers = [row[0] for row in cur.fetchall()]
+    cur.execute("SELECT company_account_number FROM client_compliance")
+    refresh_client_compliance(cur, account_numbers + [row[0] for row in cur.fetchall()])
+    return len(account_numbers)
@@ -0,0 +1,123 @@
+# compress_text_columns.py
+"""
+One-time migration that switches compressed storage of the large text columns on
+(or, with --off, back off) and rewrites the values already stored.
+
+The columns are listed in text_compression.COMPRESSED_COLUMNS. With compression
+on, the sync jobs and the scheduler store new values compressed as well. The
+database is vacuumed afterwards so the freed pages are returned, and the bytes
+and pages saved are reported.
+"""
+import argparse
+import getpass
+import os
+import sys
+
+from text_compression import COMPRESSED_COLUMNS, COMPRESSION_SETTING, compress_text, read_text
+
+try:
+    from sqlcipher3 import dbapi2 as sqlite3
+except ImportError:
+    sys.exit("Error: sqlcipher3-wheels is not installed. Run: pip install sqlcipher3-wheels")
+
+# Configuration
+DB_FILE = "brainhair.db"
+BATCH_SIZE = 500 # Rows read and rewritten per statement
+
+def get_db_connection(db_path, password):
+    """Establishes a connection to the encrypted database."""
+    if not password:
+        raise ValueError("A database password is required.")
+    con = sqlite3.connect(db_path)
+    cur = con.cursor()
+    cur.execute(f"PRAGMA key = '{password}';")
+    return con, cur
+
+def stored_size(value):
+    if value is None:
+        return 0
+    return len(value) if isinstance(value, bytes) else len(value.encode('utf-8'))
+
+def database_pages(cur):
+    cur.execute("PRAGMA page_count")
+    page_count = cur.fetchone()[0]
+    cur.execute("PRAGMA page_size")
+    return page_count, page_count * cur.fetchone()[0]
+
+def rewrite_column(con, cur, table_name, key_column, column, compress):
+    """Rewrites one column in batches. Returns (bytes before, bytes after, rows changed)."""
+    before, after, changed, last_key = 0, 0, 0, None
+    while True:
+        if last_key is None:
+            cur.execute(f"SELECT {key_column}, {column} FROM {table_name} ORDER BY {key_column} LIMIT ?", (BATCH_SIZE,))
+        else:
+            cur.execute(f"SELECT {key_column}, {column} FROM {table_name} WHERE {key_column} > ? ORDER BY {key_column} LIMIT ?", (last_key, BATCH_SIZE))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        updates = []
+        for key, value in rows:
+            new_value = compress_text(read_text(value)) if compress else read_text(value)
+            before += stored_size(value)
+            after += stored_size(new_value)
+            if new_value != value:
+                updates.append((new_value, key))
+        cur.executemany(f"UPDATE {table_name} SET {column} = ? WHERE {key_column} = ?", updates)
+        con.commit()
+        changed += len(updates)
+        last_key = rows[-1][0]
+    return before, after, changed
+
+def migrate(password, compress):
+    if not os.path.exists(DB_FILE):
+        print(f"Error: Database file '{DB_FILE}' not found.", file=sys.stderr)
+        sys.exit(1)
+
+    con = None
+    try:
+        con, cur = get_db_connection(DB_FILE, password)
+        pages_before, file_before = database_pages(cur)
+
+        # Switched first, so values written by a job during the rewrite already use the new format
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES (?, ?)", (COMPRESSION_SETTING, '1' if compress else '0'))
+        con.commit()
+        print(f"Compressed storage is now {'on' if compress else 'off'}. Rewriting stored values...\n")
+
+        total_before, total_after = 0, 0
+        for table_name, key_column, column in COMPRESSED_COLUMNS:
+            before, after, changed = rewrite_column(con, cur, table_name, key_column, column, compress)
+            total_before += before
+            total_after += after
+            print(f"  {table_name}.{column}: {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB ({changed} values rewritten)")
+
+        print("\nVacuuming the database to release the freed pages...")
+        cur.execute("VACUUM")
+        pages_after, file_after = database_pages(cur)
+
+        print("\n--- Migration Complete ---")
+        print(f"Column data: {total_before / 1024 / 1024:.1f} MB -> {total_after / 1024 / 1024:.1f} MB")
+        print(f"Database: {pages_before} -> {pages_after} pages ({file_before / 1024 / 1024:.1f} MB -> {file_after / 1024 / 1024:.1f} MB)")
+        if file_after < file_before:
+            print(f"Saved {(file_before - file_after) / 1024 / 1024:.1f} MB ({100 * (file_before - file_after) / file_before:.0f}%).")
+        print("--------------------------")
+
+    except sqlite3.Error as e:
+        print(f"\n❌ An error occurred with the database: {e}", file=sys.stderr)
+        print("Please ensure the password is correct and the database is not corrupted.", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if con:
+            con.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Switch compressed storage of large text columns on or off and rewrite the stored values.")
+    parser.add_argument('--off', action='store_true', help="Store the columns as plain text again.")
+    args = parser.parse_args()
+
+    print("--- Text Column Compression ---")
+    master_password = os.environ.get('DB_MASTER_PASSWORD') or getpass.getpass("Enter the master password for the database: ")
+    if not master_password:
+        print("Error: Master password cannot be empty.", file=sys.stderr)
+        sys.exit(1)
+
+    migrate(master_password, compress=not args.off)
@@ -25,7 +25,8 @@ default_widget_layouts = {
         {"w": 6, "h": 4, "id": "notes-widget", "x": 0, "y": 10},
         {"w": 6, "h": 4, "id": "attachments-widget", "x": 6, "y": 10},
         {"w": 12, "h": 3, "id": "tracked-assets-widget", "x": 0, "y": 14},
-        {"w": 12, "h": 3, "id": "ticket-breakdown-widget", "x": 0, "y": 17}
+        {"w": 12, "h": 3, "id": "ticket-breakdown-widget", "x": 0, "y": 17},
+        {"w": 12, "h": 4, "id": "backup-trend-widget", "x": 0, "y": 20}
     ],
     "client_settings": [
         {"w": 6, "h": 5, "id": "client-details-widget", "x": 0, "y": 0},
@@ -41,7 +42,8 @@ default_widget_layouts = {
     ],
     "clients": [
         {"x": 0, "y": 0, "w": 12, "h": 8, "id": "clients-table-widget"},
-        {"w": 12, "h": 2, "id": "export-all-widget", "x": 0, "y": 8}
+        {"w": 12, "h": 2, "id": "export-all-widget", "x": 0, "y": 8},
+        {"w": 12, "h": 5, "id": "compliance-widget", "x": 0, "y": 10}
     ],
     "settings": [
         {"w": 12, "h": 2, "id": "import-export-widget", "x": 0, "y": 0},
@@ -0,0 +1,266 @@
+"""
+Sync throughput benchmarks against the offline API stand-in (mock_api_server.py).
+
+For every script and scale it starts a mock API sized for that scale, copies the
+database to a scratch directory with the synced tables emptied, and runs the sync
+twice in its own interpreter: a cold run that writes everything and a warm run
+that finds nothing changed. Each run reports its wall time, the API calls and
+429s, the seconds spent writing to the database and the rows written (from the
+script's METRICS line), and its peak RSS.
+
+Results are saved as JSON under benchmark_results/ together with the git revision,
+so two versions can be compared:
+
+    python debug/benchmark_sync.py --scale small --latency-ms 50
+    python debug/benchmark_sync.py --scale small --latency-ms 50 --compare benchmark_results/<earlier run>.json
+
+The database to copy (brainhair.db by default) must have been set up with init_db.py;
+its API keys are not used, as the scripts are pointed at the stand-in.
+"""
+import argparse
+import getpass
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    from sqlcipher3 import dbapi2 as sqlite3
+except ImportError:
+    sys.exit("Error: sqlcipher3-wheels is not installed. Run: pip install sqlcipher3-wheels")
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_SERVER = os.path.join(REPO_DIR, 'debug', 'mock_api_server.py')
+DB_FILE = "brainhair.db"
+RESULTS_DIR = "benchmark_results"
+# The scripts pace themselves at Freshservice's default quota until a response
+# says otherwise, so the stand-in always announces one. This one is high enough
+# that the scripts, not the quota, set the pace.
+DEFAULT_RATE_LIMIT = 60000
+
+# Tables the sync scripts write. They are emptied in the scratch copy so every cold
+# run starts from nothing.
+SYNCED_TABLES = [
+    'companies', 'client_locations', 'users', 'contacts', 'assets', 'asset_billing_overrides',
+    'asset_contact_links', 'ticket_details', 'ticket_details_shadow', 'freshservice_departments',
+    'sync_checkpoints', 'sync_state',
+]
+
+# Mock API sizes per script and scale. pull_datto scales with sites (one per
+# department), pull_freshservice with requesters and pull_ticket_details with tickets.
+SCALES = {
+    'pull_datto.py': {
+        'small': {'departments': 100, 'devices-per-site': 20, 'requesters': 0, 'tickets': 0},
+        'medium': {'departments': 500, 'devices-per-site': 20, 'requesters': 0, 'tickets': 0},
+        'large': {'departments': 2000, 'devices-per-site': 20, 'requesters': 0, 'tickets': 0},
+    },
+    'pull_freshservice.py': {
+        'small': {'departments': 100, 'requesters': 5000, 'devices-per-site': 0, 'tickets': 0},
+        'medium': {'departments': 500, 'requesters': 20000, 'devices-per-site': 0, 'tickets': 0},
+        'large': {'departments': 2000, 'requesters': 50000, 'devices-per-site': 0, 'tickets': 0},
+    },
+    'pull_ticket_details.py': {
+        'small': {'departments': 100, 'tickets': 10000, 'requesters': 0, 'devices-per-site': 0},
+        'medium': {'departments': 500, 'tickets': 50000, 'requesters': 0, 'devices-per-site': 0},
+        'large': {'departments': 2000, 'tickets': 200000, 'requesters': 0, 'devices-per-site': 0},
+    },
+}
+
+# --- Setup ---
+def prepare_database(source_db, password, workdir):
+    """Copies the database into workdir and empties the synced tables."""
+    target = os.path.join(workdir, DB_FILE)
+    shutil.copyfile(source_db, target)
+    con = sqlite3.connect(target)
+    cur = con.cursor()
+    cur.execute(f"PRAGMA key = '{password}';")
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    existing = {row[0] for row in cur.fetchall()}
+    for table in SYNCED_TABLES:
+        if table in existing:
+            cur.execute(f"DELETE FROM {table}")
+    con.commit()
+    con.close()
+
+def start_mock_server(sizes, args, workdir):
+    """Starts the API stand-in on a free port. Returns (process, base_url)."""
+    command = [sys.executable, MOCK_SERVER, '--port', '0', '--seed', str(args.seed),
+               '--latency-ms', str(args.latency_ms), '--rate-limit', str(args.rate_limit),
+               '--datto-rate-limit', str(args.datto_rate_limit)]
+    for option, value in sizes.items():
+        command += [f'--{option}', str(value)]
+    process = subprocess.Popen(command, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    for line in process.stdout:
+        match = re.search(r" on (http://\S+)", line)
+        if match:
+            return process, match.group(1)
+    process.wait()
+    raise RuntimeError("The mock API server did not start.")
+
+def stop_mock_server(process):
+    """Stops the stand-in and returns how many requests it served and answered with 429."""
+    process.terminate()
+    output = process.communicate(timeout=30)[0]
+    match = re.search(r"Served (\d+) requests \((\d+) answered with 429\)", output or '')
+    return (int(match.group(1)), int(match.group(2))) if match else (None, None)
+
+# --- Measuring ---
+def run_script(script, workdir, env):
+    """
+    Runs a sync script in its own interpreter. Returns (exit_code, wall_seconds,
+    peak_rss_mb, output). Peak RSS is only available where os.wait4 is (not on Windows).
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, script)], cwd=workdir, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                               encoding='utf-8', errors='replace')
+    output = process.stdout.read()
+    peak_rss_mb = None
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    else:
+        process.wait()
+    return process.returncode, time.perf_counter() - started, peak_rss_mb, output
+
+def parse_metrics(output):
+    """The counters from the script's METRICS line (the last one, if there are several)."""
+    metrics = {}
+    for line in output.splitlines():
+        if line.startswith("METRICS "):
+            try:
+                metrics = json.loads(line[len("METRICS "):])
+            except ValueError:
+                pass
+    return metrics
+
+def benchmark(script, scale, sizes, args, source_db, password):
+    """Runs one script at one scale, cold then warm. Returns a list of result dicts."""
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench_') as workdir:
+        prepare_database(source_db, password, workdir)
+        server, base_url = start_mock_server(sizes, args, workdir)
+        env = dict(os.environ, DB_MASTER_PASSWORD=password, FRESHSERVICE_BASE_URL=base_url,
+                   DATTO_API_ENDPOINT=base_url, PYTHONUNBUFFERED='1')
+        try:
+            for run in (['cold'] if args.cold_only else ['cold', 'warm']):
+                print(f"  {script} [{scale}] {run} run...", flush=True)
+                exit_code, wall, peak_rss_mb, output = run_script(script, workdir, env)
+                if exit_code != 0:
+                    print(f"    -> exited with {exit_code}. Last output:\n" + "\n".join(output.splitlines()[-15:]), file=sys.stderr)
+                metrics = parse_metrics(output)
+                results.append({
+                    'script': script,
+                    'scale': scale,
+                    'run': run,
+                    'sizes': sizes,
+                    'exit_code': exit_code,
+                    'wall_seconds': round(wall, 3),
+                    'api_calls': metrics.get('api_calls'),
+                    'rate_limited': metrics.get('rate_limited'),
+                    'db_write_seconds': metrics.get('db_write_seconds', 0.0 if metrics else None),
+                    'rows_inserted': metrics.get('rows_inserted'),
+                    'rows_updated': metrics.get('rows_updated'),
+                    'rows_unchanged': metrics.get('rows_unchanged'),
+                    'peak_rss_mb': round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+                })
+        finally:
+            served, rate_limited = stop_mock_server(server)
+            print(f"  Mock API served {served} requests ({rate_limited} answered with 429).")
+    return results
+
+# --- Reporting ---
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_value(value, suffix=''):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f"{value:.2f}{suffix}" if value < 10 else f"{value:.1f}{suffix}"
+    return f"{value}{suffix}"
+
+def print_table(results, baseline=None):
+    baseline_walls = {(r['script'], r['scale'], r['run']): r['wall_seconds'] for r in (baseline or [])}
+    header = f"{'Script':<24}{'Scale':<8}{'Run':<6}{'Wall':>10}{'vs base':>9}{'API calls':>11}{'429s':>6}{'DB write':>10}{'Inserted':>10}{'Updated':>9}{'Unchanged':>11}{'Peak RSS':>10}"
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        base = baseline_walls.get((r['script'], r['scale'], r['run']))
+        change = f"{(r['wall_seconds'] - base) / base * 100:+.0f}%" if base else '-'
+        print(f"{r['script']:<24}{r['scale']:<8}{r['run']:<6}{format_value(r['wall_seconds'], 's'):>10}{change:>9}"
+              f"{format_value(r['api_calls']):>11}{format_value(r['rate_limited']):>6}{format_value(r['db_write_seconds'], 's'):>10}"
+              f"{format_value(r['rows_inserted']):>10}{format_value(r['rows_updated']):>9}{format_value(r['rows_unchanged']):>11}"
+              f"{format_value(r['peak_rss_mb'], ' MB'):>10}")
+
+def save_results(results, args):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    revision = git_revision()
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    path = os.path.join(RESULTS_DIR, f"{stamp}_{revision or 'unknown'}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': revision,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {'latency_ms': args.latency_ms, 'rate_limit': args.rate_limit,
+                         'datto_rate_limit': args.datto_rate_limit, 'seed': args.seed},
+            'results': results,
+        }, f, indent=2)
+    return path
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sync scripts against the offline API stand-in.")
+    parser.add_argument('--scripts', default=','.join(SCALES), help="Comma-separated scripts to benchmark.")
+    parser.add_argument('--scale', default='small', help="small, medium, large, or a comma-separated list of them (or 'all').")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Mock API latency per request.")
+    parser.add_argument('--rate-limit', type=int, default=DEFAULT_RATE_LIMIT,
+                        help="Mock Freshservice calls per minute before 429s. Lower it to benchmark throttled runs.")
+    parser.add_argument('--datto-rate-limit', type=int, default=0, help="Mock Datto calls per minute before 429s (0 = unlimited).")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cold-only', action='store_true', help="Skip the warm (nothing changed) run.")
+    parser.add_argument('--db', default=DB_FILE, help="Initialised database to copy for each run.")
+    parser.add_argument('--compare', help="An earlier results file to compare wall times against.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"Error: Database file '{args.db}' not found. Please run init_db.py script first.")
+    password = os.environ.get('DB_MASTER_PASSWORD') or getpass.getpass("Please enter the database password: ")
+    scales = ['small', 'medium', 'large'] if args.scale == 'all' else [s.strip() for s in args.scale.split(',')]
+    scripts = [s.strip() for s in args.scripts.split(',')]
+    for script in scripts:
+        if script not in SCALES:
+            sys.exit(f"Error: no benchmark defined for '{script}'. Choose from: {', '.join(SCALES)}")
+        for scale in scales:
+            if scale not in SCALES[script]:
+                sys.exit(f"Error: unknown scale '{scale}'. Choose from: small, medium, large, all")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    results = []
+    for script in scripts:
+        for scale in scales:
+            results.extend(benchmark(script, scale, SCALES[script][scale], args, os.path.abspath(args.db), password))
+
+    print_table(results, baseline)
+    print(f"\nResults saved to {save_results(results, args)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""
+An offline stand-in for the Freshservice and Datto RMM APIs, for benchmarking and
+testing the sync scripts without live tenants.
+
+It serves the endpoints the scripts use (departments, requesters, tickets/filter,
+time_entries, Datto sites, devices and site variables) from a fixture set that is
+either generated (deterministic for a given --seed) or loaded from a JSON file with
+the same shape as --save-fixtures writes, e.g. responses recorded from a real tenant.
+Pagination, Link headers, the X-Ratelimit-* headers and 429s with Retry-After follow
+the real APIs closely enough for the scripts' paginator and rate limiter. Latency,
+page sizes and rate limits are configurable.
+
+Point the scripts at it with the endpoint overrides:
+
+    python debug/mock_api_server.py --port 8099 --rate-limit 400 --latency-ms 80
+    FRESHSERVICE_BASE_URL=http://127.0.0.1:8099 DATTO_API_ENDPOINT=http://127.0.0.1:8099 python pull_freshservice.py
+
+Both APIs share the one port: their paths do not overlap. The server does not check
+credentials, so the API keys in the database can be anything.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+# The custom field keys are the ones pull_freshservice reads, so every column it fills is exercised.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from freshservice_fields import ACCOUNT_NUMBER_FIELD, PHONE_NUMBER_FIELD, CLIENT_START_DATE_FIELD, BUSINESS_TYPE_FIELD, ADDRESS_FIELD
+
+FRESHSERVICE_MAX_PER_PAGE = 100
+DATTO_PAGE_SIZE = 250
+ACCOUNT_NUMBER_VARIABLE = "AccountNumber"
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn', 'Drew', 'Harper']
+LAST_NAMES = ['Smith', 'Garcia', 'Nguyen', 'Patel', 'Brown', 'Miller', 'Davis', 'Lopez', 'Wilson', 'Clark', 'Young', 'King']
+DEVICE_CATEGORIES = ['Desktop', 'Desktop', 'Desktop', 'Laptop', 'Laptop', 'Server']
+OPERATING_SYSTEMS = ['Microsoft Windows 11 Pro', 'Microsoft Windows 10 Pro', 'Microsoft Windows Server 2022 Standard', 'macOS 14']
+
+
+# --- Fixtures ---
+def iso(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def generate_fixtures(seed=1, departments=60, requesters=3000, tickets=4000, devices_per_site=40):
+    """Builds a fixture set shaped like the real API responses."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def recent(days):
+        return now - timedelta(seconds=rng.randint(0, days * 86400))
+
+    fixtures = {'departments': [], 'requesters': [], 'tickets': [], 'time_entries': {}, 'sites': [], 'devices': {}, 'variables': {}}
+    for i in range(1, departments + 1):
+        # A few departments have no account number yet, as in a real tenant.
+        account_number = str(100000 + i) if rng.random() > 0.1 else None
+        fixtures['departments'].append({
+            'id': 5000 + i,
+            'name': f"Client {i:03d} Holdings",
+            'description': None,
+            'head_name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'domains': [f"client{i:03d}.example.com"],
+            'custom_fields': {
+                ACCOUNT_NUMBER_FIELD: account_number,
+                PHONE_NUMBER_FIELD: f"555-{rng.randint(1000, 9999)}",
+                ADDRESS_FIELD: f"{rng.randint(1, 999)} Main Street",
+                'type_of_client': rng.choice(['Managed', 'Break Fix']),
+                'plan_selected': rng.choice(['MSP Basic', 'MSP Advanced', 'MSP Premium']),
+                'support_level': rng.choice(['All Inclusive', 'Billed Hourly']),
+                CLIENT_START_DATE_FIELD: iso(recent(2000))[:10],
+                BUSINESS_TYPE_FIELD: rng.choice(['For Profit', 'For Profit', 'Non-Profit']),
+            },
+            'created_at': iso(recent(2000)),
+            'updated_at': iso(recent(30)),
+        })
+    department_ids = [d['id'] for d in fixtures['departments']]
+
+    for i in range(1, requesters + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        fixtures['requesters'].append({
+            'id': 900000 + i,
+            'first_name': first,
+            'last_name': last,
+            'primary_email': f"{first.lower()}.{last.lower()}{i}@example.com",
+            'active': rng.random() > 0.05,
+            'department_ids': [rng.choice(department_ids)],
+            'job_title': rng.choice(['Manager', 'Assistant', 'Engineer', 'Owner', None]),
+            'work_phone_number': f"555-{rng.randint(1000, 9999)}",
+            'mobile_phone_number': None,
+            'other_emails': [],
+            'address': None,
+            'description': None,
+            'created_at': iso(recent(1500)),
+            'updated_at': iso(recent(400)),
+        })
+
+    for i in range(1, tickets + 1):
+        ticket_id = 70000 + i
+        fixtures['tickets'].append({
+            'id': ticket_id,
+            'subject': f"Support request {ticket_id}",
+            'department_id': rng.choice(department_ids),
+            'status': 5 if rng.random() > 0.2 else rng.choice([2, 3, 4]),
+            'created_at': iso(recent(400)),
+            'updated_at': iso(recent(365)),
+        })
+        fixtures['time_entries'][str(ticket_id)] = [
+            {'id': ticket_id * 10 + n, 'time_spent': f"{rng.randint(0, 2):02d}:{rng.choice([0, 15, 30, 45]):02d}"}
+            for n in range(rng.choice([0, 1, 1, 2, 3]))
+        ]
+
+    for i, department in enumerate(fixtures['departments'], 1):
+        site_uid = f"{seed:04x}{i:04x}-0000-4000-8000-{i:012x}"
+        fixtures['sites'].append({
+            'uid': site_uid,
+            'id': i,
+            'name': department['name'],
+            'portalUrl': f"https://mock.rmm.local/site/{site_uid}",
+            'devicesStatus': {'numberOfDevices': devices_per_site},
+        })
+        account_number = department['custom_fields'][ACCOUNT_NUMBER_FIELD]
+        fixtures['variables'][site_uid] = (
+            [{'id': i, 'name': ACCOUNT_NUMBER_VARIABLE, 'value': account_number, 'masked': False}]
+            if account_number and rng.random() > 0.1 else []
+        )
+        devices = []
+        for n in range(1, devices_per_site + 1):
+            category = rng.choice(DEVICE_CATEGORIES)
+            last_seen = recent(10)
+            devices.append({
+                'uid': f"{site_uid[:-6]}{n:06x}",
+                'siteUid': site_uid,
+                'hostname': f"C{i:03d}-{category[:3].upper()}-{n:03d}",
+                'description': None,
+                'deviceType': {'category': category, 'type': category},
+                'operatingSystem': rng.choice(OPERATING_SYSTEMS[2:3] if category == 'Server' else OPERATING_SYSTEMS[:2] + OPERATING_SYSTEMS[3:]),
+                'creationDate': int(recent(1500).timestamp() * 1000),
+                'intIpAddress': f"10.{i % 256}.0.{n % 256}",
+                'extIpAddress': f"203.0.113.{i % 256}",
+                'lastLoggedInUser': f"CLIENT{i:03d}\\user{n}",
+                'domain': f"CLIENT{i:03d}",
+                'a64Bit': True,
+                'online': rng.random() > 0.3,
+                'lastSeen': int(last_seen.timestamp() * 1000),
+                'lastReboot': int((last_seen - timedelta(days=rng.randint(0, 30))).timestamp() * 1000),
+                'lastAuditDate': int(last_seen.timestamp() * 1000),
+                'udf': {'udf6': str(rng.randint(0, 2 * 1024 ** 4)) if category == 'Server' else None,
+                        'udf7': 'VM' if category == 'Server' and rng.random() > 0.5 else None},
+                'antivirus': {'antivirusProduct': 'Mock Defender', 'antivirusStatus': rng.choice(['RunningAndUpToDate', 'RunningAndNotUpToDate', 'NotDetected'])},
+                'patchManagement': {'patchStatus': rng.choice(['FullyPatched', 'ApprovedPending', 'InstallError']),
+                                    'patchesApprovedPending': rng.randint(0, 5), 'patchesNotApproved': 0, 'patchesInstalled': rng.randint(50, 200)},
+                'portalUrl': f"https://mock.rmm.local/device/{site_uid}/{n}",
+                'webRemoteUrl': f"https://mock.rmm.local/remote/{site_uid}/{n}",
+            })
+        fixtures['devices'][site_uid] = devices
+    return fixtures
+
+def load_fixtures(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        fixtures = json.load(f)
+    for key in ('departments', 'requesters', 'tickets', 'sites'):
+        fixtures.setdefault(key, [])
+    for key in ('time_entries', 'devices', 'variables'):
+        fixtures.setdefault(key, {})
+    return fixtures
+
+
+# --- Rate limiting ---
+class WindowRateLimit:
+    """Freshservice-style quota: a number of calls per rolling minute window; 0 means unlimited."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.window_start = time.monotonic()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Returns (allowed, remaining, retry_after_seconds)."""
+        if not self.per_minute:
+            return True, None, 0
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start, self.used = now, 0
+            if self.used >= self.per_minute:
+                return False, 0, max(1, int(60 - (now - self.window_start)) + 1)
+            self.used += 1
+            return True, self.per_minute - self.used, 0
+
+
+# --- Server ---
+class MockApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fixtures, args):
+        super().__init__(address, MockApiHandler)
+        self.fixtures = fixtures
+        self.args = args
+        self.freshservice_limit = WindowRateLimit(args.rate_limit)
+        self.datto_limit = WindowRateLimit(args.datto_rate_limit)
+        self.data_lock = threading.Lock()
+        self.stats = {'requests': 0, 'rate_limited': 0}
+        self.stats_lock = threading.Lock()
+        self.departments_by_id = {d['id']: d for d in fixtures['departments']}
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+
+def query_since(query):
+    """Pulls the updated_at lower bound out of a Freshservice filter query."""
+    match = re.search(r"updated_at:>'([^']+)'", query or '')
+    return match.group(1) if match else None
+
+def query_status(query):
+    match = re.search(r"status:(\d+)", query or '')
+    return int(match.group(1)) if match else None
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.args.verbose:
+            super().log_message(format, *args)
+
+    # --- Plumbing ---
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return dict((k, v[0]) for k, v in parse_qs(raw.decode('utf-8')).items())
+
+    def simulate_latency(self):
+        args = self.server.args
+        delay = args.latency_ms + (random.uniform(0, args.jitter_ms) if args.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000.0)
+
+    def dispatch(self, method):
+        self.server.count('requests')
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+        self.simulate_latency()
+
+        is_datto = path.startswith('/auth/') or path.startswith('/api/v2/account') or path.startswith('/api/v2/site')
+        limit = self.server.datto_limit if is_datto else self.server.freshservice_limit
+        allowed, remaining, retry_after = limit.take()
+        headers = {}
+        if limit.per_minute:
+            headers = {'X-Ratelimit-Total': str(limit.per_minute), 'X-Ratelimit-Remaining': str(remaining)}
+        if not allowed:
+            self.server.count('rate_limited')
+            headers['Retry-After'] = str(retry_after)
+            return self.send_json(429, {'message': 'You have exceeded the limit of requests per minute'}, headers)
+        if self.server.args.error_rate and random.random() < self.server.args.error_rate:
+            return self.send_json(503, {'message': 'Simulated server error'}, headers)
+
+        for pattern, handler_method, name in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match and handler_method == method:
+                status, body, extra_headers = getattr(self, name)(params, *match.groups())
+                headers.update(extra_headers or {})
+                return self.send_json(status, body, headers)
+        self.send_json(404, {'message': f"No mock for {method} {path}"}, headers)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    # --- Freshservice ---
+    def freshservice_page(self, params, items, items_key, with_total=False):
+        per_page = min(int(params.get('per_page', 30)), self.server.args.max_per_page)
+        page = max(1, int(params.get('page', 1)))
+        start = (page - 1) * per_page
+        body = {items_key: items[start:start + per_page]}
+        headers = {}
+        if with_total:
+            body['total'] = len(items)
+        elif start + per_page < len(items):
+            next_params = dict(params, page=page + 1, per_page=per_page)
+            headers['Link'] = f'<http://{self.headers.get("Host")}{urlparse(self.path).path}?{urlencode(next_params)}>; rel="next"'
+        return 200, body, headers
+
+    def list_departments(self, params):
+        with self.server.data_lock:
+            departments = list(self.server.fixtures['departments'])
+        return self.freshservice_page(params, departments, 'departments')
+
+    def get_department(self, params, department_id):
+        department = self.server.departments_by_id.get(int(department_id))
+        if department is None:
+            return 404, {'message': 'Record not found'}, None
+        return 200, {'department': department}, None
+
+    def update_department(self, params, department_id):
+        body = self.read_json()
+        with self.server.data_lock:
+            department = self.server.departments_by_id.get(int(department_id))
+            if department is None:
+                return 404, {'message': 'Record not found'}, None
+            department['custom_fields'].update(body.get('custom_fields') or {})
+            department['updated_at'] = iso(datetime.now(timezone.utc))
+        return 200, {'department': department}, None
+
+    def list_requesters(self, params):
+        since = query_since(params.get('query'))
+        requesters = [r for r in self.server.fixtures['requesters'] if not since or r['updated_at'] > since]
+        return self.freshservice_page(params, requesters, 'requesters')
+
+    def filter_tickets(self, params):
+        query = params.get('query')
+        since, status = query_since(query), query_status(query)
+        tickets = [t for t in self.server.fixtures['tickets']
+                   if (not since or t['updated_at'] > since) and (status is None or t['status'] == status)]
+        return self.freshservice_page(params, tickets, 'tickets', with_total=True)
+
+    def list_time_entries(self, params, ticket_id):
+        entries = self.server.fixtures['time_entries'].get(ticket_id)
+        if entries is None:
+            return 404, {'message': 'Record not found'}, None
+        return 200, {'time_entries': entries}, None
+
+    # --- Datto RMM ---
+    def datto_token(self, params):
+        self.read_json()
+        return 200, {'access_token': 'mock-access-token', 'token_type': 'bearer', 'expires_in': 360000}, None
+
+    def datto_page(self, params, items, items_key):
+        page_size = self.server.args.datto_page_size
+        page = max(0, int(params.get('page', 0)))
+        start = page * page_size
+        next_page_url = None
+        if start + page_size < len(items):
+            next_page_url = f"http://{self.headers.get('Host')}{urlparse(self.path).path}?{urlencode({'page': page + 1, 'max': page_size})}"
+        return 200, {
+            'pageDetails': {'count': len(items[start:start + page_size]), 'totalCount': len(items), 'nextPageUrl': next_page_url},
+            items_key: items[start:start + page_size],
+        }, None
+
+    def list_sites(self, params):
+        return self.datto_page(params, self.server.fixtures['sites'], 'sites')
+
+    def list_devices(self, params, site_uid):
+        devices = self.server.fixtures['devices'].get(site_uid)
+        if devices is None:
+            return 404, {'message': 'Site not found'}, None
+        return self.datto_page(params, devices, 'devices')
+
+    def list_variables(self, params, site_uid):
+        with self.server.data_lock:
+            variables = list(self.server.fixtures['variables'].get(site_uid, []))
+        return 200, {'variables': variables}, None
+
+    def create_variable(self, params, site_uid):
+        body = self.read_json()
+        with self.server.data_lock:
+            variables = self.server.fixtures['variables'].setdefault(site_uid, [])
+            variable = {'id': sum(len(v) for v in self.server.fixtures['variables'].values()) + 1,
+                        'name': body.get('name'), 'value': body.get('value'), 'masked': bool(body.get('masked'))}
+            variables.append(variable)
+        return 200, variable, None
+
+    def update_variable(self, params, site_uid, variable_id):
+        body = self.read_json()
+        with self.server.data_lock:
+            for variable in self.server.fixtures['variables'].get(site_uid, []):
+                if str(variable['id']) == variable_id:
+                    variable.update({k: v for k, v in body.items() if k in ('name', 'value')})
+                    return 200, variable, None
+        return 404, {'message': 'Variable not found'}, None
+
+
+ROUTES = [
+    (r'/api/v2/departments', 'GET', 'list_departments'),
+    (r'/api/v2/departments/(\d+)', 'GET', 'get_department'),
+    (r'/api/v2/departments/(\d+)', 'PUT', 'update_department'),
+    (r'/api/v2/requesters', 'GET', 'list_requesters'),
+    (r'/api/v2/tickets/filter', 'GET', 'filter_tickets'),
+    (r'/api/v2/tickets/(\d+)/time_entries', 'GET', 'list_time_entries'),
+    (r'/auth/oauth/token', 'POST', 'datto_token'),
+    (r'/api/v2/account/sites', 'GET', 'list_sites'),
+    (r'/api/v2/site/([^/]+)/devices', 'GET', 'list_devices'),
+    (r'/api/v2/site/([^/]+)/variables', 'GET', 'list_variables'),
+    (r'/api/v2/site/([^/]+)/variable', 'PUT', 'create_variable'),
+    (r'/api/v2/site/([^/]+)/variable/(\d+)', 'POST', 'update_variable'),
+]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Freshservice and Datto RMM APIs.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--fixtures', help="Serve this fixture file instead of generated data.")
+    parser.add_argument('--save-fixtures', help="Write the fixture set to this file (e.g. to edit or replay it).")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for generated fixtures.")
+    parser.add_argument('--departments', type=int, default=60, help="Generated departments; each gets a Datto site.")
+    parser.add_argument('--requesters', type=int, default=3000)
+    parser.add_argument('--tickets', type=int, default=4000)
+    parser.add_argument('--devices-per-site', type=int, default=40)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Delay added to every response.")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="Random extra delay of up to this much.")
+    parser.add_argument('--rate-limit', type=int, default=0, help="Freshservice calls per minute before 429s (0 = unlimited).")
+    parser.add_argument('--datto-rate-limit', type=int, default=0, help="Datto calls per minute before 429s (0 = unlimited).")
+    parser.add_argument('--max-per-page', type=int, default=FRESHSERVICE_MAX_PER_PAGE, help="Largest Freshservice per_page honoured.")
+    parser.add_argument('--datto-page-size', type=int, default=DATTO_PAGE_SIZE)
+    parser.add_argument('--error-rate', type=float, default=0, help="Fraction of requests answered with a 503.")
+    parser.add_argument('--verbose', action='store_true', help="Log every request.")
+    return parser
+
+def create_server(args):
+    """Builds the server (not yet serving) from parsed arguments. Port 0 picks a free port."""
+    if args.fixtures:
+        fixtures = load_fixtures(args.fixtures)
+    else:
+        fixtures = generate_fixtures(args.seed, args.departments, args.requesters, args.tickets, args.devices_per_site)
+    if args.save_fixtures:
+        with open(args.save_fixtures, 'w', encoding='utf-8') as f:
+            json.dump(fixtures, f, indent=1)
+        print(f"Saved fixtures to {args.save_fixtures}.")
+    return MockApiServer((args.host, args.port), fixtures, args)
+
+def stop_on_sigterm(signum, frame):
+    # Stopping the server from another process (e.g. the benchmark harness) still prints the summary
+    raise KeyboardInterrupt
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    server = create_server(args)
+    fixtures = server.fixtures
+    url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    print(f"Mock API serving {len(fixtures['departments'])} departments, {len(fixtures['requesters'])} requesters, "
+          f"{len(fixtures['tickets'])} tickets, {len(fixtures['sites'])} sites and "
+          f"{sum(len(d) for d in fixtures['devices'].values())} devices on {url}")
+    print(f"Run the scripts with FRESHSERVICE_BASE_URL={url} DATTO_API_ENDPOINT={url}", flush=True)
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\nServed {server.stats['requests']} requests ({server.stats['rate_limited']} answered with 429).", flush=True)
+
+if __name__ == "__main__":
+    main()
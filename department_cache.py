@@ -0,0 +1,203 @@
+# department_cache.py
+"""
+A local copy of the Freshservice departments (companies) shared by the scripts.
+
+pull_freshservice refreshes the cache on every run while it pages through the
+departments anyway. The other scripts read it from the database instead of
+pulling every department again, and only go to the API when the cache is older
+than DEPARTMENT_CACHE_TTL_HOURS or a ticket names a department it has not seen.
+A department that turns out not to exist (404) is remembered for as long, so
+tickets of a deleted department do not cost a lookup on every run.
+Departments are returned in the same shape as the API returns them, so callers
+can treat cached and fetched departments alike.
+"""
+import sys
+from datetime import datetime, timezone, timedelta
+
+import requests
+
+from job_metrics import record_api_call
+from job_runner import check_cancelled
+from paginator import iter_pages, get_limiter
+from sync_state import get_watermark, set_watermark
+
+ACCOUNT_NUMBER_FIELD = "account_number"
+DEPARTMENTS_PER_PAGE = 100
+# pull_freshservice runs daily; the extra hours cover a late or slow run.
+DEPARTMENT_CACHE_TTL_HOURS = 26
+CACHE_JOB_NAME = "department_cache"
+
+
+def ensure_department_cache(cur):
+    """Creates the department cache table on databases built before it existed."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS freshservice_departments (
+            freshservice_id INTEGER PRIMARY KEY,
+            name TEXT,
+            account_number TEXT,
+            updated_at TEXT,
+            cached_at TEXT NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS freshservice_missing_departments (
+            freshservice_id INTEGER PRIMARY KEY,
+            checked_at TEXT NOT NULL
+        )
+    """)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def store_departments(cur, departments):
+    """Writes API departments into the cache. The caller commits."""
+    cached_at = _now()
+    cur.executemany("""
+        INSERT INTO freshservice_departments (freshservice_id, name, account_number, updated_at, cached_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(freshservice_id) DO UPDATE SET
+            name = excluded.name,
+            account_number = excluded.account_number,
+            updated_at = excluded.updated_at,
+            cached_at = excluded.cached_at
+    """, [(
+        d.get('id'),
+        d.get('name'),
+        None if not (d.get('custom_fields') or {}).get(ACCOUNT_NUMBER_FIELD) else str(d['custom_fields'][ACCOUNT_NUMBER_FIELD]),
+        d.get('updated_at'),
+        cached_at
+    ) for d in departments if d.get('id')])
+
+
+def start_refresh():
+    """Returns the timestamp a full refresh started at, for finish_refresh."""
+    return _now()
+
+
+def finish_refresh(cur, refresh_started):
+    """
+    Completes a full refresh: departments not written since it started were deleted
+    in Freshservice and are dropped, and the cache is marked fresh. The caller commits.
+    """
+    cur.execute("DELETE FROM freshservice_departments WHERE cached_at < ?", (refresh_started,))
+    set_watermark(cur, CACHE_JOB_NAME, 'refreshed_at', refresh_started)
+
+
+def set_cached_account_number(cur, department_id, account_number):
+    """Records an account number that a script has just written to Freshservice."""
+    cur.execute("UPDATE freshservice_departments SET account_number = ? WHERE freshservice_id = ?",
+                (str(account_number), department_id))
+
+
+def cache_is_fresh(cur, max_age_hours=DEPARTMENT_CACHE_TTL_HOURS):
+    refreshed_at = get_watermark(cur, CACHE_JOB_NAME, 'refreshed_at')
+    if not refreshed_at:
+        return False
+    return datetime.now(timezone.utc) - datetime.fromisoformat(refreshed_at) <= timedelta(hours=max_age_hours)
+
+
+def _as_department(row):
+    return {
+        'id': row[0],
+        'name': row[1],
+        'custom_fields': {ACCOUNT_NUMBER_FIELD: row[2]},
+        'updated_at': row[3],
+    }
+
+
+def fetch_all_departments(base_url, headers):
+    """Pulls every department from the API. Request errors are raised."""
+    all_departments = []
+    for _, departments_on_page in iter_pages(f"{base_url}/api/v2/departments", headers, 'departments', per_page=DEPARTMENTS_PER_PAGE):
+        all_departments.extend(departments_on_page)
+    return all_departments
+
+
+def get_departments(con, base_url, headers, max_age_hours=DEPARTMENT_CACHE_TTL_HOURS):
+    """
+    Returns all departments, from the cache while it is fresh. A stale or empty cache
+    is refreshed from the API first.
+    """
+    cur = con.cursor()
+    ensure_department_cache(cur)
+    if cache_is_fresh(cur, max_age_hours):
+        cur.execute("SELECT freshservice_id, name, account_number, updated_at FROM freshservice_departments")
+        departments = [_as_department(row) for row in cur.fetchall()]
+        if departments:
+            print(f"Loaded {len(departments)} departments from the local cache.")
+            return departments
+
+    print("Department cache is stale or empty. Refreshing it from the Freshservice API...")
+    refresh_started = start_refresh()
+    departments = fetch_all_departments(base_url, headers)
+    store_departments(cur, departments)
+    finish_refresh(cur, refresh_started)
+    con.commit()
+    print(f"Cached {len(departments)} departments.")
+    return departments
+
+
+def get_account_number_map(con, base_url, headers, max_age_hours=DEPARTMENT_CACHE_TTL_HOURS):
+    """
+    Returns {department id: account number} for every known department. Departments
+    without an account number map to None, so they are not looked up again.
+    """
+    return {
+        d['id']: d['custom_fields'].get(ACCOUNT_NUMBER_FIELD)
+        for d in get_departments(con, base_url, headers, max_age_hours)
+    }
+
+
+def known_missing_departments(cur, department_ids, max_age_hours=DEPARTMENT_CACHE_TTL_HOURS):
+    """The ids among department_ids that returned 404 within the last max_age_hours."""
+    if not department_ids:
+        return set()
+    since = (datetime.now(timezone.utc) - timedelta(hours=max_age_hours)).isoformat(timespec='seconds')
+    placeholders = ', '.join(['?'] * len(department_ids))
+    cur.execute(f"SELECT freshservice_id FROM freshservice_missing_departments WHERE checked_at >= ? AND freshservice_id IN ({placeholders})",
+                [since] + list(department_ids))
+    return {row[0] for row in cur.fetchall()}
+
+
+def fetch_missing_departments(con, base_url, headers, department_ids):
+    """
+    Fetches departments the cache does not know (e.g. created since the last refresh)
+    one by one, caches them and returns {department id: account number}. A department
+    that cannot be fetched is left out, so the next run tries again; one that does not
+    exist maps to None and is not looked up again until its negative entry expires.
+    """
+    cur = con.cursor()
+    ensure_department_cache(cur)
+    found = dict.fromkeys(known_missing_departments(cur, sorted(department_ids)))
+    to_fetch = sorted(set(department_ids) - set(found))
+    limiter = get_limiter(base_url)
+    try:
+        for department_id in to_fetch:
+            check_cancelled()
+            try:
+                limiter.acquire()
+                response = requests.get(f"{base_url}/api/v2/departments/{department_id}", headers=headers, timeout=30)
+                record_api_call(response)
+                if response.status_code == 404:
+                    found[department_id] = None
+                    cur.execute("INSERT OR REPLACE INTO freshservice_missing_departments (freshservice_id, checked_at) VALUES (?, ?)",
+                                (department_id, _now()))
+                    continue
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                print(f"  -> Could not fetch department {department_id}: {e}", file=sys.stderr)
+                continue
+            department = response.json().get('department', {})
+            store_departments(cur, [department])
+            found[department_id] = (department.get('custom_fields') or {}).get(ACCOUNT_NUMBER_FIELD)
+    finally:
+        # Also after a cancellation, so the departments looked up so far are kept.
+        con.commit()
+    known_missing = len(department_ids) - len(to_fetch)
+    if to_fetch:
+        print(f"Looked up {len(to_fetch)} departments missing from the cache.")
+    if known_missing:
+        print(f"Skipped {known_missing} departments already known not to exist in Freshservice.")
+    return {k: (str(v) if v else None) for k, v in found.items()}
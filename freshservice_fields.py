@@ -0,0 +1,12 @@
+# freshservice_fields.py
+"""
+Keys of the custom fields on Freshservice departments (companies) that the app
+reads. pull_freshservice maps them to company columns, and
+debug/mock_api_server serves its fixtures under the same keys. Kept free of
+imports so the debug server can use it without the sync scripts' dependencies.
+"""
+ACCOUNT_NUMBER_FIELD = "account_number"
+PHONE_NUMBER_FIELD = "company_main_number"
+CLIENT_START_DATE_FIELD = "company_start_date"
+BUSINESS_TYPE_FIELD = "profit_or_non_profit"
+ADDRESS_FIELD = "address"
@@ -6,6 +6,8 @@ import shutil
 import re
 import json
 from werkzeug.security import generate_password_hash
+from name_matcher import DEFAULT_NAME_ALIASES
+from asset_fields import backfill_asset_fields
 
 # This is provided by the sqlcipher3-wheels package
 try:
@@ -216,7 +218,16 @@ def import_data_to_new_db(con, data):
         'user_widget_layouts',
         'kb_categories',
         'kb_articles',
-        'kb_article_category_link'
+        'kb_article_category_link',
+        'sync_checkpoints',
+        'sync_state',
+        'pushed_values',
+        'freshservice_departments',
+        'job_runs',
+        'company_name_aliases',
+        'client_compliance',
+        'asset_telemetry_daily',
+        'client_backup_daily'
     ]
 
     for table_name in table_import_order:
@@ -298,7 +309,8 @@ def create_database(new_password, existing_data=None):
             domains TEXT,
             company_owner TEXT,
             business_type TEXT,
-            description TEXT
+            description TEXT,
+            row_hash TEXT
         )
     """)
     cur.execute("""
@@ -338,9 +350,20 @@ def create_database(new_password, existing_data=None):
             patch_management_data TEXT,
             portal_url TEXT,
             web_remote_url TEXT,
+            antivirus_product TEXT,
+            antivirus_status TEXT,
+            patch_status TEXT,
+            patches_pending INTEGER,
+            patches_installed INTEGER,
+            reboot_required BOOLEAN,
+            row_hash TEXT,
+            sync_generation INTEGER,
             FOREIGN KEY (company_account_number) REFERENCES companies (account_number)
         )
     """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_assets_antivirus_status ON assets (antivirus_status, company_account_number)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_assets_patch_status ON assets (patch_status, company_account_number)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_assets_company ON assets (company_account_number)")
     cur.execute("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY,
@@ -351,6 +374,8 @@ def create_database(new_password, existing_data=None):
             status TEXT,
             date_added TEXT,
             billing_type TEXT NOT NULL DEFAULT 'Regular',
+            row_hash TEXT,
+            sync_generation INTEGER,
             FOREIGN KEY (company_account_number) REFERENCES companies (account_number)
         )
     """)
@@ -369,6 +394,8 @@ def create_database(new_password, existing_data=None):
             other_emails TEXT,
             address TEXT,
             notes TEXT,
+            row_hash TEXT,
+            sync_generation INTEGER,
             FOREIGN KEY (company_account_number) REFERENCES companies (account_number) ON DELETE CASCADE
         )
     """)
@@ -448,8 +475,10 @@ def create_database(new_password, existing_data=None):
     cur.execute("CREATE TABLE IF NOT EXISTS user_billing_overrides (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER UNIQUE, billing_type TEXT, custom_cost REAL, employment_type TEXT, FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE)")
     cur.execute("CREATE TABLE IF NOT EXISTS manual_assets (id INTEGER PRIMARY KEY AUTOINCREMENT, company_account_number TEXT NOT NULL, hostname TEXT NOT NULL, device_type TEXT, billing_type TEXT, custom_cost REAL, FOREIGN KEY (company_account_number) REFERENCES companies (account_number) ON DELETE CASCADE)")
     cur.execute("CREATE TABLE IF NOT EXISTS manual_users (id INTEGER PRIMARY KEY AUTOINCREMENT, company_account_number TEXT NOT NULL, full_name TEXT NOT NULL, email TEXT, billing_type TEXT, custom_cost REAL, FOREIGN KEY (company_account_number) REFERENCES companies (account_number) ON DELETE CASCADE)")
-    cur.execute("CREATE TABLE IF NOT EXISTS ticket_details (ticket_id INTEGER PRIMARY KEY, company_account_number TEXT, subject TEXT, last_updated_at TEXT, closed_at TEXT, total_hours_spent REAL, FOREIGN KEY (company_account_number) REFERENCES companies (account_number))")
-    cur.execute("CREATE TABLE scheduler_jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, job_name TEXT NOT NULL UNIQUE, script_path TEXT NOT NULL, interval_minutes INTEGER NOT NULL, enabled BOOLEAN NOT NULL CHECK (enabled IN (0, 1)), last_run TEXT, next_run TEXT, last_status TEXT, last_run_log TEXT)")
+    cur.execute("CREATE TABLE IF NOT EXISTS ticket_details (ticket_id INTEGER PRIMARY KEY, company_account_number TEXT, subject TEXT, last_updated_at TEXT, closed_at TEXT, total_hours_spent REAL, time_entry_count INTEGER, fingerprint TEXT, FOREIGN KEY (company_account_number) REFERENCES companies (account_number))")
+    cur.execute("CREATE TABLE scheduler_jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, job_name TEXT NOT NULL UNIQUE, script_path TEXT NOT NULL, interval_minutes INTEGER NOT NULL, enabled BOOLEAN NOT NULL CHECK (enabled IN (0, 1)), last_run TEXT, next_run TEXT, last_status TEXT, last_run_log TEXT, run_in_subprocess BOOLEAN NOT NULL DEFAULT 0 CHECK (run_in_subprocess IN (0, 1)), depends_on TEXT, priority INTEGER NOT NULL DEFAULT 0)")
+    cur.execute("CREATE TABLE IF NOT EXISTS job_runs (id INTEGER PRIMARY KEY AUTOINCREMENT, job_id INTEGER NOT NULL, reason TEXT, started_at TEXT NOT NULL, duration_seconds REAL, status TEXT NOT NULL, api_calls INTEGER, rate_limited INTEGER, rows_inserted INTEGER, rows_updated INTEGER, rows_unchanged INTEGER, FOREIGN KEY (job_id) REFERENCES scheduler_jobs (id) ON DELETE CASCADE)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_runs_job_started ON job_runs (job_id, started_at)")
     cur.execute("CREATE TABLE IF NOT EXISTS billing_notes (id INTEGER PRIMARY KEY AUTOINCREMENT, company_account_number TEXT NOT NULL, note_content TEXT NOT NULL, created_at TEXT NOT NULL, author TEXT, FOREIGN KEY (company_account_number) REFERENCES companies (account_number) ON DELETE CASCADE)")
     cur.execute("CREATE TABLE IF NOT EXISTS client_attachments (id INTEGER PRIMARY KEY AUTOINCREMENT, company_account_number TEXT NOT NULL, original_filename TEXT NOT NULL, stored_filename TEXT NOT NULL UNIQUE, uploaded_at TEXT NOT NULL, file_size INTEGER, category TEXT, FOREIGN KEY (company_account_number) REFERENCES companies (account_number) ON DELETE CASCADE)")
     cur.execute("CREATE TABLE IF NOT EXISTS custom_line_items (id INTEGER PRIMARY KEY AUTOINCREMENT, company_account_number TEXT NOT NULL, name TEXT NOT NULL, monthly_fee REAL, one_off_fee REAL, one_off_month INTEGER, one_off_year INTEGER, yearly_fee REAL, yearly_bill_month INTEGER, yearly_bill_day INTEGER, FOREIGN KEY (company_account_number) REFERENCES companies (account_number) ON DELETE CASCADE)")
@@ -485,6 +514,14 @@ def create_database(new_password, existing_data=None):
             FOREIGN KEY (contact_id) REFERENCES contacts (id) ON DELETE CASCADE
         )
     """)
+    cur.execute("CREATE TABLE IF NOT EXISTS sync_checkpoints (job_name TEXT PRIMARY KEY, last_page INTEGER, last_item_id TEXT, watermark TEXT, updated_at TEXT NOT NULL)")
+    cur.execute("CREATE TABLE IF NOT EXISTS sync_state (job_name TEXT NOT NULL, resource TEXT NOT NULL, watermark TEXT, updated_at TEXT NOT NULL, PRIMARY KEY (job_name, resource))")
+    cur.execute("CREATE TABLE IF NOT EXISTS client_compliance (company_account_number TEXT PRIMARY KEY, total_assets INTEGER NOT NULL DEFAULT 0, av_up_to_date INTEGER NOT NULL DEFAULT 0, av_out_of_date INTEGER NOT NULL DEFAULT 0, av_not_running INTEGER NOT NULL DEFAULT 0, av_not_detected INTEGER NOT NULL DEFAULT 0, patch_fully_patched INTEGER NOT NULL DEFAULT 0, patch_pending INTEGER NOT NULL DEFAULT 0, patch_install_error INTEGER NOT NULL DEFAULT 0, patch_no_policy INTEGER NOT NULL DEFAULT 0, patch_no_data INTEGER NOT NULL DEFAULT 0, reboot_pending INTEGER NOT NULL DEFAULT 0, offline_stale INTEGER NOT NULL DEFAULT 0, updated_at TEXT NOT NULL)")
+    cur.execute("CREATE TABLE IF NOT EXISTS pushed_values (service TEXT NOT NULL, field TEXT NOT NULL, item_id TEXT NOT NULL, value TEXT, pushed_at TEXT NOT NULL, PRIMARY KEY (service, field, item_id))")
+    cur.execute("CREATE TABLE IF NOT EXISTS freshservice_departments (freshservice_id INTEGER PRIMARY KEY, name TEXT, account_number TEXT, updated_at TEXT, cached_at TEXT NOT NULL)")
+    cur.execute("CREATE TABLE IF NOT EXISTS company_name_aliases (id INTEGER PRIMARY KEY AUTOINCREMENT, alias TEXT NOT NULL UNIQUE, company_name TEXT NOT NULL)")
+    cur.execute("CREATE TABLE IF NOT EXISTS asset_telemetry_daily (day INTEGER NOT NULL, asset_id INTEGER NOT NULL, samples INTEGER NOT NULL, online_samples INTEGER NOT NULL, last_seen INTEGER, backup_bytes INTEGER NOT NULL, PRIMARY KEY (day, asset_id)) WITHOUT ROWID")
+    cur.execute("CREATE TABLE IF NOT EXISTS client_backup_daily (company_account_number TEXT NOT NULL, day INTEGER NOT NULL, backup_bytes INTEGER NOT NULL, backed_up_assets INTEGER NOT NULL, assets INTEGER NOT NULL, samples INTEGER NOT NULL, online_samples INTEGER NOT NULL, PRIMARY KEY (company_account_number, day)) WITHOUT ROWID")
     # --- New Knowledge Base Tables ---
     cur.execute("""
         CREATE TABLE IF NOT EXISTS kb_articles (
@@ -530,6 +567,14 @@ def create_database(new_password, existing_data=None):
         cur.executemany("INSERT OR IGNORE INTO feature_options (feature_type, option_name) VALUES (?, ?)", default_features)
         con.commit()
         print("Default features are up to date.")
+        # Databases from before the alias table existed get the aliases that used to be hard-coded
+        if not existing_data.get('company_name_aliases'):
+            cur.executemany("INSERT OR IGNORE INTO company_name_aliases (alias, company_name) VALUES (?, ?)", DEFAULT_NAME_ALIASES)
+            con.commit()
+        # Assets exported before the typed antivirus/patch columns existed only have the JSON
+        if any('antivirus_status' not in row for row in existing_data.get('assets') or []):
+            print(f"Filled the typed antivirus and patch columns of {backfill_asset_fields(cur)} assets.")
+            con.commit()
         # If api_keys were not in the export for some reason, we still need to ask for them.
         if 'api_keys' not in existing_data or not existing_data['api_keys']:
              print("\nCould not find existing API keys. Please enter them now.")
@@ -542,13 +587,16 @@ def create_database(new_password, existing_data=None):
         print("\nThis is a fresh install. Populating with default data...")
         print("Populating default job schedules...")
         default_jobs = [
-            ('Sync Billing Data (Companies & Users)', 'pull_freshservice.py', 1440, 1),
-            ('Sync Datto RMM Assets', 'pull_datto.py', 1440, 1),
-            ('Sync Ticket Details & Hours', 'pull_ticket_details.py', 1440, 1),
-            ('Assign Missing Freshservice Account Numbers', 'set_account_numbers.py', 1440, 0),
-            ('Push Account Numbers to Datto RMM', 'push_account_nums_to_datto.py', 1440, 0)
+            ('Sync Billing Data (Companies & Users)', 'pull_freshservice.py', 1440, 1, 'set_account_numbers.py', 40),
+            ('Sync Datto RMM Assets', 'pull_datto.py', 1440, 1, 'pull_freshservice.py,push_account_nums_to_datto.py', 20),
+            ('Sync Ticket Details & Hours', 'pull_ticket_details.py', 1440, 1, 'pull_freshservice.py', 30),
+            ('Assign Missing Freshservice Account Numbers', 'set_account_numbers.py', 1440, 0, '', 50),
+            ('Push Account Numbers to Datto RMM', 'push_account_nums_to_datto.py', 1440, 0, 'pull_freshservice.py,set_account_numbers.py', 30)
         ]
-        cur.executemany("INSERT INTO scheduler_jobs (job_name, script_path, interval_minutes, enabled) VALUES (?, ?, ?, ?)", default_jobs)
+        cur.executemany("INSERT INTO scheduler_jobs (job_name, script_path, interval_minutes, enabled, depends_on, priority) VALUES (?, ?, ?, ?, ?, ?)", default_jobs)
+
+        print("Populating default site name aliases...")
+        cur.executemany("INSERT INTO company_name_aliases (alias, company_name) VALUES (?, ?)", DEFAULT_NAME_ALIASES)
 
         print("Populating default application settings...")
         cur.execute("INSERT OR IGNORE INTO app_settings (key, value) VALUES ('session_timeout_minutes', '180')")
@@ -0,0 +1,85 @@
+# job_log.py
+"""
+Bounded on-disk logs for job runs.
+
+A RingLog keeps the output of one run in two segment files. When the current
+segment is full it replaces the previous one, so a chatty two-hour run keeps
+only its most recent output on disk and nothing in memory. Every byte written
+has a position (its offset since the run started), which lets readers tail the
+log from where they left off, even across rotations.
+"""
+import os
+import threading
+
+JOB_LOG_DIR = "job_logs"
+JOB_LOG_MAX_BYTES = 2 * 1024 * 1024 # Per run, across both segments
+
+
+class RingLog:
+    """An append-only line log on disk, bounded to about max_bytes."""
+
+    def __init__(self, name, max_bytes=JOB_LOG_MAX_BYTES, log_dir=JOB_LOG_DIR):
+        os.makedirs(log_dir, exist_ok=True)
+        self.path = os.path.join(log_dir, f"{name}.log")
+        self.previous_path = self.path + '.1'
+        self.segment_bytes = max(1, max_bytes // 2)
+        self.condition = threading.Condition()
+        if os.path.exists(self.previous_path):
+            os.remove(self.previous_path)
+        self.file = open(self.path, 'wb')
+        self.offset = 0 # Bytes written since the run started
+        self.segment_start = 0 # Offset of the first byte in the current segment
+        self.previous_start = None # Offset of the first byte in the previous segment
+        self.closed = False
+
+    def write_line(self, line):
+        data = (line if line.endswith('\n') else line + '\n').encode('utf-8', errors='replace')
+        with self.condition:
+            if self.closed:
+                return
+            if self.offset > self.segment_start and self.offset - self.segment_start + len(data) > self.segment_bytes:
+                self._rotate()
+            self.file.write(data)
+            self.file.flush()
+            self.offset += len(data)
+            self.condition.notify_all()
+
+    def _rotate(self):
+        self.file.close()
+        os.replace(self.path, self.previous_path)
+        self.previous_start = self.segment_start
+        self.segment_start = self.offset
+        self.file = open(self.path, 'wb')
+
+    def read_from(self, offset=0):
+        """
+        Returns (text, next_offset) with everything after offset that is still on
+        disk. Output that has already rotated out is skipped.
+        """
+        with self.condition:
+            chunks = []
+            earliest = self.previous_start if self.previous_start is not None else self.segment_start
+            start = max(offset, earliest)
+            if self.previous_start is not None and start < self.segment_start:
+                with open(self.previous_path, 'rb') as f:
+                    f.seek(start - self.previous_start)
+                    chunks.append(f.read(self.segment_start - start))
+                start = self.segment_start
+            if start < self.offset:
+                with open(self.path, 'rb') as f:
+                    f.seek(start - self.segment_start)
+                    chunks.append(f.read(self.offset - start))
+            return b''.join(chunks).decode('utf-8', errors='replace'), self.offset
+
+    def wait(self, offset, timeout):
+        """Blocks until there is output after offset, the log is closed, or timeout passes."""
+        with self.condition:
+            if self.offset <= offset and not self.closed:
+                self.condition.wait(timeout)
+
+    def close(self):
+        with self.condition:
+            if not self.closed:
+                self.closed = True
+                self.file.close()
+                self.condition.notify_all()
@@ -0,0 +1,125 @@
+# job_metrics.py
+"""
+Per-run performance counters for the sync scripts.
+
+The scripts count the API calls they make, the 429s they hit, the rows they
+insert, update or leave unchanged and the seconds spent writing to the database.
+When main() returns (or fails) the totals are printed as one structured line:
+
+    METRICS {"api_calls": 412, "rate_limited": 3, "rows_inserted": 10, ...}
+
+The job runner picks that line out of the job's output and stores it in the
+job_runs history, so the same mechanism works for jobs run in the server process
+and for jobs run in their own interpreter. Runs in the server process each get
+their own counters, so jobs running side by side do not mix their numbers.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import threading
+import time
+
+METRICS_PREFIX = "METRICS "
+METRIC_NAMES = ('api_calls', 'rate_limited', 'rows_inserted', 'rows_updated', 'rows_unchanged')
+
+
+class RunMetrics:
+    """Thread-safe counters for one run."""
+
+    def __init__(self):
+        self.counters = dict.fromkeys(METRIC_NAMES, 0)
+        self.lock = threading.Lock()
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def update(self, values):
+        with self.lock:
+            for name, amount in values.items():
+                if isinstance(amount, (int, float)):
+                    self.counters[name] = self.counters.get(name, 0) + amount
+
+    def as_dict(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+_process_metrics = RunMetrics()
+_current_metrics = contextvars.ContextVar('current_metrics', default=None)
+
+
+def current_metrics():
+    """The counters of the run in this context; the process-wide ones outside the job runner."""
+    return _current_metrics.get() or _process_metrics
+
+
+def use_metrics(metrics):
+    """Makes metrics the current run's counters. Returns a token for reset_metrics."""
+    return _current_metrics.set(metrics)
+
+
+def reset_metrics(token):
+    _current_metrics.reset(token)
+
+
+def record_api_call(response=None):
+    """Counts one API request, and a rate limit if its response was a 429."""
+    metrics = current_metrics()
+    metrics.add('api_calls')
+    if response is not None and response.status_code == 429:
+        metrics.add('rate_limited')
+
+
+def record_rows(counts):
+    """Adds an {'inserted', 'updated', 'unchanged'} dict (as upsert_changed_rows returns) to the row counters."""
+    current_metrics().update({f"rows_{name}": amount for name, amount in counts.items()})
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Adds the seconds spent in the with-block to a counter."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current_metrics().add(name, time.perf_counter() - started)
+
+
+def timed_commit(con):
+    """Commits, counting the time toward db_write_seconds."""
+    with timed('db_write_seconds'):
+        con.commit()
+
+
+def emit_metrics():
+    """Prints the current counters as a METRICS line and starts them again from zero."""
+    metrics = current_metrics()
+    with metrics.lock:
+        values = {name: round(value, 3) if isinstance(value, float) else value
+                  for name, value in metrics.counters.items()}
+        metrics.counters = dict.fromkeys(METRIC_NAMES, 0)
+    print(METRICS_PREFIX + json.dumps(values, sort_keys=True), flush=True)
+
+
+def reports_metrics(main):
+    """Decorates a script's main() so its METRICS line is printed however it ends."""
+    @functools.wraps(main)
+    def wrapper(*args, **kwargs):
+        try:
+            return main(*args, **kwargs)
+        finally:
+            emit_metrics()
+    return wrapper
+
+
+def parse_metrics_line(line):
+    """Returns the counters from a METRICS output line, or None for any other line."""
+    if not line.startswith(METRICS_PREFIX):
+        return None
+    try:
+        values = json.loads(line[len(METRICS_PREFIX):])
+    except ValueError:
+        return None
+    return values if isinstance(values, dict) else None
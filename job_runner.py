@@ -0,0 +1,264 @@
+# job_runner.py
+"""
+Runs the sync scripts inside the web server process.
+
+Every sync script exposes main(argv=None, password=None). JobRunner imports the
+script once and calls main() on a small worker pool, so a run pays no interpreter
+start-up or re-imports. Whatever a run prints (also from helper threads started
+through submit_in_job_context) is written line by line to that run's on-disk
+RingLog, where the settings page can tail it while the job is running. The
+METRICS line a script prints when it finishes (see job_metrics) is also kept on
+the run, for the job_runs history.
+
+Threads cannot be killed, so cancellation and timeouts are cooperative: the
+scripts call check_cancelled() at their commit points and before each request
+of the long fetch phases (Freshservice pages, ticket time entries, Datto
+requests, also from helper threads), and the run stops at the next such call with
+everything committed so far kept and its checkpoint intact. A request already in
+flight, or a wait for the rate limiter, still finishes first. A job can opt in to
+running in its own interpreter instead, where it is terminated outright.
+"""
+import contextvars
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from job_log import RingLog
+from job_metrics import RunMetrics, use_metrics, reset_metrics, parse_metrics_line
+
+JOB_WORKERS = 3 # Jobs that can run at the same time
+JOB_TIMEOUT_SECONDS = 7200
+
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a job by check_cancelled(). It derives from BaseException so the
+    scripts' own `except Exception` handlers do not turn it into a failure.
+    """
+
+
+_current_run = contextvars.ContextVar('current_run', default=None)
+
+
+class JobRun:
+    """One run of a job: its log, cancellation flag and outcome."""
+
+    def __init__(self, job_id, script_path, argv):
+        self.job_id = job_id
+        self.script_path = script_path
+        self.argv = list(argv or [])
+        self.log = RingLog(f"job_{job_id}")
+        self.partial_lines = {'stdout': '', 'stderr': ''}
+        self.output_lock = threading.Lock()
+        self.cancel_event = threading.Event()
+        self.cancel_status = None
+        self.metrics = RunMetrics() # Filled from the METRICS lines the script prints
+        self.started_at = None
+        self.finished_at = None
+
+    def write(self, stream_name, text):
+        """Writes output to the run's log a complete line at a time. stderr lines are marked."""
+        with self.output_lock:
+            buffered = self.partial_lines[stream_name] + text
+            *lines, self.partial_lines[stream_name] = buffered.split('\n')
+            for line in lines:
+                self._write_line(stream_name, line)
+        return len(text)
+
+    def _write_line(self, stream_name, line):
+        values = parse_metrics_line(line.rstrip('\r'))
+        if values is not None:
+            self.metrics.update(values)
+        self.log.write_line(f"[stderr] {line}" if stream_name == 'stderr' else line)
+
+    def cancel(self, status='Cancelled'):
+        if not self.cancel_event.is_set():
+            self.cancel_status = status
+            self.cancel_event.set()
+
+    def finish(self):
+        """Flushes unterminated lines and closes the log, which ends any live tails."""
+        with self.output_lock:
+            for stream_name, line in self.partial_lines.items():
+                if line:
+                    self._write_line(stream_name, line)
+                self.partial_lines[stream_name] = ''
+        self.log.close()
+
+    @property
+    def duration_seconds(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    def log_output(self):
+        """The run's log as stored in scheduler_jobs: whatever is still in the ring buffer."""
+        text, _ = self.log.read_from(0)
+        return text
+
+
+def check_cancelled():
+    """Stops the current job if it has been cancelled or has timed out. A no-op outside the runner."""
+    run = _current_run.get()
+    if run is not None and run.cancel_event.is_set():
+        raise JobCancelled(run.cancel_status)
+
+
+def submit_in_job_context(executor, fn, *args, **kwargs):
+    """executor.submit() that keeps the calling job's log and cancellation in the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class _RoutedStream:
+    """Stands in for sys.stdout/sys.stderr and sends writes from a job to that job's log."""
+
+    def __init__(self, fallback, stream_name):
+        self.fallback = fallback
+        self.stream_name = stream_name
+
+    def write(self, text):
+        run = _current_run.get()
+        if run is None:
+            return self.fallback.write(text)
+        return run.write(self.stream_name, text)
+
+    def flush(self):
+        if _current_run.get() is None:
+            self.fallback.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+
+def _install_output_routing():
+    if not isinstance(sys.stdout, _RoutedStream):
+        sys.stdout = _RoutedStream(sys.stdout, 'stdout')
+    if not isinstance(sys.stderr, _RoutedStream):
+        sys.stderr = _RoutedStream(sys.stderr, 'stderr')
+
+
+def load_job_function(script_path):
+    """Imports a sync script as a module and returns its main(), or None if it has none."""
+    module_name = os.path.splitext(os.path.basename(script_path))[0]
+    module = importlib.import_module(module_name)
+    job_function = getattr(module, 'main', None)
+    return job_function if callable(job_function) else None
+
+
+class JobRunner:
+    """A worker pool for sync jobs, with per-run cancellation, timeouts and log capture."""
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.active = {}
+        self.lock = threading.Lock()
+        _install_output_routing()
+
+    def submit(self, job_id, script_path, password, argv=None, isolated=False, timeout=JOB_TIMEOUT_SECONDS):
+        """Queues a run. Returns the JobRun and a future resolving to (status, log_output)."""
+        run = JobRun(job_id, script_path, argv)
+        target = self._run_subprocess if isolated else self._run_in_process
+        future = self.executor.submit(self._run, target, run, password, timeout)
+        return run, future
+
+    def cancel(self, job_id):
+        """Cancels every active run of a job. Returns True if there was one."""
+        with self.lock:
+            runs = [run for run in self.active.values() if run.job_id == job_id]
+        for run in runs:
+            run.cancel()
+        return bool(runs)
+
+    def is_running(self, job_id):
+        with self.lock:
+            return any(run.job_id == job_id for run in self.active.values())
+
+    def _run(self, target, run, password, timeout):
+        run.started_at = datetime.now()
+        with self.lock:
+            self.active[id(run)] = run
+        timer = threading.Timer(timeout, run.cancel, args=('Timeout',))
+        timer.daemon = True
+        timer.start()
+        try:
+            status = target(run, password, timeout)
+        finally:
+            timer.cancel()
+            run.finished_at = datetime.now()
+            run.finish()
+            with self.lock:
+                self.active.pop(id(run), None)
+        return status, run.log_output()
+
+    def _run_in_process(self, run, password, timeout):
+        token = _current_run.set(run)
+        metrics_token = use_metrics(RunMetrics()) # The script's own counters, printed when main() ends
+        try:
+            job_function = load_job_function(run.script_path)
+            if job_function is None:
+                # Scripts without a main() still work, in their own interpreter.
+                _current_run.reset(token)
+                token = None
+                return self._run_subprocess(run, password, timeout)
+            job_function(argv=run.argv, password=password)
+            return "Success"
+        except JobCancelled:
+            print(f"Job stopped: {run.cancel_status}.", file=sys.stderr)
+            return run.cancel_status
+        except SystemExit as e:
+            if e.code in (None, 0):
+                return "Success"
+            if isinstance(e.code, str):
+                print(e.code, file=sys.stderr)
+            return "Failure"
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+            return "Failure"
+        finally:
+            reset_metrics(metrics_token)
+            if token is not None:
+                _current_run.reset(token)
+
+    def _run_subprocess(self, run, password, timeout):
+        env = os.environ.copy()
+        env['DB_MASTER_PASSWORD'] = password
+        env['PYTHONUNBUFFERED'] = '1' # Otherwise piped output only arrives in 8 KB blocks
+        process = subprocess.Popen(
+            [sys.executable, run.script_path] + run.argv,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            encoding='utf-8', errors='replace', env=env
+        )
+        # Output is read line by line as it arrives, so it can be tailed while the job runs.
+        readers = [threading.Thread(target=self._pump, args=(run, stream, name), daemon=True)
+                   for stream, name in ((process.stdout, 'stdout'), (process.stderr, 'stderr'))]
+        for reader in readers:
+            reader.start()
+        while True:
+            try:
+                process.wait(timeout=1)
+                break
+            except subprocess.TimeoutExpired:
+                if run.cancel_event.is_set():
+                    process.terminate()
+                    process.wait()
+                    break
+        for reader in readers:
+            reader.join()
+        if run.cancel_event.is_set():
+            return run.cancel_status
+        return "Success" if process.returncode == 0 else "Failure"
+
+    @staticmethod
+    def _pump(run, stream, stream_name):
+        for line in stream:
+            run.write(stream_name, line)
+        stream.close()
+
+    def get_run(self, job_id):
+        """The active run of a job, or None."""
+        with self.lock:
+            return next((run for run in self.active.values() if run.job_id == job_id), None)
@@ -1,6 +1,8 @@
 import os
 import sys
 import getpass
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 try:
@@ -12,6 +14,8 @@ except ImportError:
 DB_FILE = "brainhair.db"
 UPLOAD_FOLDER = 'uploads'
 DEFAULT_CATEGORY = 'Recovered'
+STAT_WORKERS = 16 # Files stat'ed at the same time
+ORPHAN_REPORT_LIMIT = 100 # Missing files listed by name; the rest are counted
 
 def get_db_connection(db_path, password):
     """Establishes a connection to the encrypted database."""
@@ -22,10 +26,27 @@ def get_db_connection(db_path, password):
     cur.execute(f"PRAGMA key = '{password}';")
     return con, cur
 
+def scan_uploads(upload_folder):
+    """Returns {account_number: [DirEntry, ...]} for the files in each client directory."""
+    client_files = {}
+    with os.scandir(upload_folder) as client_dirs:
+        for client_dir in client_dirs:
+            if client_dir.is_dir():
+                with os.scandir(client_dir.path) as files:
+                    client_files[client_dir.name] = [entry for entry in files if entry.is_file()]
+    return client_files
+
+def stat_entry(entry):
+    """Returns (entry, stat result), or (entry, the error) if the file could not be read."""
+    try:
+        return entry, entry.stat()
+    except OSError as e:
+        return entry, e
+
 def relink_uploads(password):
     """
     Scans the uploads directory and links any orphaned files back to clients
-    in the database.
+    in the database. Also reports attachment records whose files are missing.
     """
     if not os.path.exists(DB_FILE):
         print(f"Error: Database file '{DB_FILE}' not found.", file=sys.stderr)
@@ -38,59 +59,67 @@ def relink_uploads(password):
     try:
         con, cur = get_db_connection(DB_FILE, password)
         print("Successfully connected to the database.")
-
-        total_files_scanned = 0
-        total_files_linked = 0
-
-        # Get a list of all client account numbers from the uploads folder
-        client_dirs = [d for d in os.listdir(UPLOAD_FOLDER) if os.path.isdir(os.path.join(UPLOAD_FOLDER, d))]
-
-        print(f"\nFound {len(client_dirs)} client directories in '{UPLOAD_FOLDER}'. Starting scan...")
-
-        for account_number in client_dirs:
-            client_path = os.path.join(UPLOAD_FOLDER, account_number)
-            print(f"\n--- Scanning for client: {account_number} ---")
-
-            # Check if this company exists in the database
-            cur.execute("SELECT 1 FROM companies WHERE account_number = ?", (account_number,))
-            if not cur.fetchone():
-                print(f"  -> Skipping: No company with account number '{account_number}' found in the database.")
+        started = time.monotonic()
+
+        # Everything the scan is compared against is loaded once, rather than queried per file.
+        cur.execute("SELECT account_number FROM companies")
+        known_companies = {row[0] for row in cur.fetchall()}
+        cur.execute("SELECT stored_filename, company_account_number FROM client_attachments")
+        linked_files = {row[0]: row[1] for row in cur.fetchall()}
+
+        client_files = scan_uploads(UPLOAD_FOLDER)
+        total_files_scanned = sum(len(files) for files in client_files.values())
+        print(f"\nFound {len(client_files)} client directories with {total_files_scanned} files in '{UPLOAD_FOLDER}'.")
+
+        to_link = []
+        seen_filenames = set(linked_files)
+        for account_number, files in sorted(client_files.items()):
+            if account_number not in known_companies:
+                print(f"  -> Skipping '{account_number}': No company with this account number in the database ({len(files)} files).")
                 continue
-
-            for stored_filename in os.listdir(client_path):
-                total_files_scanned += 1
-                file_path = os.path.join(client_path, stored_filename)
-
-                # Check if this file already has a record in the database
-                cur.execute("SELECT 1 FROM client_attachments WHERE stored_filename = ?", (stored_filename,))
-                if cur.fetchone():
-                    print(f"  -> Skipping: '{stored_filename}' already linked in the database.")
+            for entry in files:
+                # stored_filename is unique across all clients
+                if entry.name not in seen_filenames:
+                    seen_filenames.add(entry.name)
+                    to_link.append((account_number, entry))
+        print(f"{total_files_scanned - len(to_link)} files are already linked or belong to unknown clients; {len(to_link)} to relink.")
+
+        # Each stat is a round trip to the disk (or the file share), so they run side by side.
+        rows = []
+        with ThreadPoolExecutor(max_workers=STAT_WORKERS) as executor:
+            for (account_number, _), (entry, stat) in zip(to_link, executor.map(stat_entry, [entry for _, entry in to_link])):
+                if isinstance(stat, OSError):
+                    print(f"  -> ERROR linking '{entry.name}': {stat}", file=sys.stderr)
                     continue
-
-                # If not found, create a new record
-                try:
-                    # Extract original filename (part after the UUID and underscore)
-                    original_filename = '_'.join(stored_filename.split('_')[1:])
-                    file_size = os.path.getsize(file_path)
-                    creation_time = os.path.getctime(file_path)
-                    uploaded_at = datetime.fromtimestamp(creation_time, tz=timezone.utc).isoformat()
-
-                    print(f"  -> Relinking: '{original_filename}'")
-                    cur.execute("""
-                        INSERT INTO client_attachments
-                        (company_account_number, original_filename, stored_filename, uploaded_at, file_size, category)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (account_number, original_filename, stored_filename, uploaded_at, file_size, DEFAULT_CATEGORY))
-                    total_files_linked += 1
-
-                except Exception as e:
-                    print(f"  -> ERROR linking '{stored_filename}': {e}", file=sys.stderr)
-
+                # Extract original filename (part after the UUID and underscore)
+                original_filename = '_'.join(entry.name.split('_')[1:])
+                uploaded_at = datetime.fromtimestamp(stat.st_ctime, tz=timezone.utc).isoformat()
+                print(f"  -> Relinking: '{original_filename}' ({account_number})")
+                rows.append((account_number, original_filename, entry.name, uploaded_at, stat.st_size, DEFAULT_CATEGORY))
+
+        cur.executemany("""
+            INSERT INTO client_attachments
+            (company_account_number, original_filename, stored_filename, uploaded_at, file_size, category)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
         con.commit()
 
+        # Records whose file is no longer where the download route looks for it
+        present = {(account_number, entry.name) for account_number, files in client_files.items() for entry in files}
+        orphaned = sorted((account_number, stored_filename) for stored_filename, account_number in linked_files.items()
+                          if (account_number, stored_filename) not in present)
+        if orphaned:
+            print(f"\n--- {len(orphaned)} attachment records have no file ---")
+            for account_number, stored_filename in orphaned[:ORPHAN_REPORT_LIMIT]:
+                print(f"  -> Missing: {os.path.join(UPLOAD_FOLDER, account_number, stored_filename)}")
+            if len(orphaned) > ORPHAN_REPORT_LIMIT:
+                print(f"  -> ... and {len(orphaned) - ORPHAN_REPORT_LIMIT} more.")
+
         print("\n--- Scan Complete ---")
         print(f"Total files scanned: {total_files_scanned}")
-        print(f"New files linked to database: {total_files_linked}")
+        print(f"New files linked to database: {len(rows)}")
+        print(f"Records with missing files: {len(orphaned)}")
+        print(f"Finished in {time.monotonic() - started:.1f}s")
         print("---------------------")
 
     except sqlite3.Error as e:
@@ -111,7 +111,7 @@ def create_app():
                 exempt_endpoints = [
                     'clients.get_clients_partial', 'clients.get_notes_partial', 'clients.get_attachments_partial',
                     'assets.get_assets_partial', 'contacts.get_contacts_partial',
-                    'settings.save_layout', 'settings.get_log'
+                    'settings.save_layout', 'settings.get_log', 'settings.stream_log'
                 ]
                 if request.endpoint and request.endpoint not in exempt_endpoints:
                     log_page_view(response)
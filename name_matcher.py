@@ -0,0 +1,118 @@
+# name_matcher.py
+"""
+Finds which company a free-text name (such as a Datto site name) belongs to.
+
+NameMatcher is an Aho-Corasick automaton built once from many names. A lookup
+walks the text a single time, however many names there are, and returns the
+longest name that occurs anywhere in it, so "A-1 Movers" wins over "A" in
+"A-1 Movers - Main Office".
+
+CompanyMatcher puts the alias table in front of it: an alias is a keyword that
+maps any name containing it to a given company, for sites whose names do not
+contain the company's Freshservice name. Aliases are kept in the
+company_name_aliases table and are managed on the settings page.
+"""
+from collections import deque
+
+# Aliases every database starts with. They replace the mappings that used to be
+# hard-coded in push_account_nums_to_datto.
+DEFAULT_NAME_ALIASES = [
+    ("Redbarn", "Redbarn Cannabis"),
+]
+
+
+class NameMatcher:
+    """Longest-substring lookup of many names at once (Aho-Corasick)."""
+
+    def __init__(self, names):
+        self.goto = [{}]
+        self.fail = [0]
+        # Index into self.names of the longest name ending at each state, or None
+        self.longest = [None]
+        self.names = []
+        for name in names:
+            if name:
+                self._add(name)
+        self._link()
+
+    def _add(self, name):
+        state = 0
+        for char in name:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.longest.append(None)
+                self.goto[state][char] = next_state
+            state = next_state
+        if self.longest[state] is None: # The first of duplicate names wins
+            self.longest[state] = len(self.names)
+        self.names.append(name)
+
+    def _link(self):
+        """Sets the failure links breadth first and, with them, the longest name ending at each state."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                if self.longest[next_state] is None:
+                    # A state's own name is always longer than any name that is a proper suffix of it
+                    self.longest[next_state] = self.longest[self.fail[next_state]]
+
+    def longest_match(self, text):
+        """Returns the longest name occurring in text (the earliest added one on a tie), or None."""
+        state, best = 0, None
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            found = self.longest[state]
+            if found is not None and (best is None or len(self.names[found]) > len(self.names[best])
+                                      or (len(self.names[found]) == len(self.names[best]) and found < best)):
+                best = found
+        return None if best is None else self.names[best]
+
+
+class CompanyMatcher:
+    """Maps names to company names: aliases first, then the longest company name contained in the name."""
+
+    def __init__(self, company_names, aliases=()):
+        self.alias_targets = {}
+        for alias, company_name in aliases:
+            self.alias_targets.setdefault(alias, company_name)
+        self.aliases = NameMatcher(self.alias_targets)
+        self.companies = NameMatcher(company_names)
+
+    def match(self, name):
+        alias = self.aliases.longest_match(name)
+        if alias is not None:
+            return self.alias_targets[alias]
+        return self.companies.longest_match(name)
+
+
+def ensure_alias_table(cur):
+    """Creates the alias table, with the default aliases, on databases built before it existed."""
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'company_name_aliases'")
+    if cur.fetchone():
+        return
+    cur.execute("""
+        CREATE TABLE company_name_aliases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            alias TEXT NOT NULL UNIQUE,
+            company_name TEXT NOT NULL
+        )
+    """)
+    cur.executemany("INSERT INTO company_name_aliases (alias, company_name) VALUES (?, ?)", DEFAULT_NAME_ALIASES)
+
+
+def load_aliases(cur):
+    """Returns the (alias, company name) pairs from the alias table."""
+    ensure_alias_table(cur)
+    cur.execute("SELECT alias, company_name FROM company_name_aliases ORDER BY id")
+    return [(row[0], row[1]) for row in cur.fetchall()]
@@ -0,0 +1,107 @@
+# paginator.py
+"""
+Concurrent pagination for the Freshservice list endpoints.
+
+iter_pages yields the pages of a listing in order while the next few pages are
+already downloading. The first page is requested on its own, and the others only
+once it shows there is more (a 'total' beyond it, a rel="next" Link header or a
+full page), so an empty or single-page listing costs one request. If a response
+says how many items there are ('total' in the body of the filter endpoints), no
+page past the end is requested. Otherwise the listing ends at the first page
+without a rel="next" Link header (once the endpoint has sent one) or at the
+first empty page. Every request takes a token
+from the shared per-host limiter, so there are no fixed sleeps between pages.
+"""
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from rate_limiter import shared_limiter
+from job_runner import check_cancelled, submit_in_job_context
+from job_metrics import record_api_call
+
+FRESHSERVICE_RATE_PER_MINUTE = 100 # Starting quota; retuned from Freshservice's rate-limit headers
+DEFAULT_PREFETCH = 4 # Pages in flight at once
+MAX_RETRIES = 3
+RATE_LIMIT_RETRIES = 10 # 429s are waited out rather than counted against MAX_RETRIES
+
+
+def get_limiter(endpoint):
+    return shared_limiter(urlparse(endpoint).netloc, FRESHSERVICE_RATE_PER_MINUTE)
+
+
+def fetch_page(endpoint, headers, params, limiter, timeout=90):
+    """
+    Fetches one page, waiting out rate limits. Returns the response; request errors
+    are raised. A cancelled or timed-out job stops before each attempt.
+    """
+    retries, rate_limited = 0, 0
+    while True:
+        check_cancelled()
+        limiter.acquire()
+        try:
+            response = requests.get(endpoint, headers=headers, params=params, timeout=timeout)
+            record_api_call(response)
+        except requests.exceptions.RequestException:
+            retries += 1
+            if retries >= MAX_RETRIES:
+                raise
+            time.sleep(2 ** retries)
+            continue
+        limiter.update_from_headers(response.headers)
+        if response.status_code == 429 and rate_limited < RATE_LIMIT_RETRIES:
+            retry_after = int(response.headers.get('Retry-After', 10))
+            print(f"  -> Rate limit hit on page {params.get('page')}, waiting {retry_after}s...")
+            rate_limited += 1
+            limiter.pause(retry_after)
+            continue
+        response.raise_for_status()
+        return response
+
+
+def iter_pages(endpoint, headers, items_key, params=None, per_page=100, start_page=1, prefetch=DEFAULT_PREFETCH):
+    """
+    Yields (page, items) for each page of a list endpoint, in page order. Request
+    errors are raised; every page yielded before them is complete.
+    """
+    limiter = get_limiter(endpoint)
+    base_params = dict(params or {})
+
+    def fetch(page):
+        response = fetch_page(endpoint, headers, {**base_params, 'page': page, 'per_page': per_page}, limiter)
+        data = response.json()
+        return data.get(items_key, []), data.get('total'), 'rel="next"' in (response.headers.get('Link') or '')
+
+    last_page = None
+    saw_next_link = False
+    futures = {}
+    next_to_submit = page = start_page
+    in_flight = 1 # Until the first page shows there are more
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        try:
+            while True:
+                while len(futures) < in_flight and (last_page is None or next_to_submit <= last_page):
+                    futures[next_to_submit] = submit_in_job_context(executor, fetch, next_to_submit)
+                    next_to_submit += 1
+                if page not in futures:
+                    return
+                items, total, has_next = futures.pop(page).result()
+                if not items:
+                    return
+                if total is not None and last_page is None:
+                    # The pages before this one were full, so this page's size is the page size.
+                    last_page = max(page, math.ceil(int(total) / len(items)))
+                saw_next_link = saw_next_link or has_next
+                if saw_next_link and not has_next:
+                    last_page = page
+                if page == start_page and last_page is None and not has_next and len(items) < per_page:
+                    last_page = page # A short first page with nothing pointing past it is the whole listing
+                in_flight = prefetch
+                yield page, items
+                page += 1
+        finally:
+            for future in futures.values():
+                future.cancel()
@@ -5,8 +5,16 @@ import os
 import sys
 import time
 import getpass
-from datetime import datetime, timezone, date
+import argparse
+from datetime import datetime, timezone, date, timedelta
 from collections import defaultdict
+from paginator import iter_pages
+from job_runner import check_cancelled
+from job_metrics import reports_metrics, timed_commit
+from freshservice_fields import ACCOUNT_NUMBER_FIELD, PHONE_NUMBER_FIELD, CLIENT_START_DATE_FIELD, BUSINESS_TYPE_FIELD, ADDRESS_FIELD
+from department_cache import ensure_department_cache, store_departments, start_refresh, finish_refresh
+from sync_state import (ensure_sync_tables, ensure_column, get_watermark, set_watermark, upsert_changed_rows, format_counts,
+                        start_generation, stamp_generation, get_checkpoint, save_checkpoint, clear_checkpoint)
 
 try:
     from sqlcipher3 import dbapi2 as sqlite3
@@ -16,15 +24,18 @@ except ImportError:
 # --- Configuration & Utility Functions ---
 DB_FILE = "brainhair.db"
 FRESHSERVICE_DOMAIN = "integotecllc.freshservice.com"
-ACCOUNT_NUMBER_FIELD = "account_number"
-PHONE_NUMBER_FIELD = "company_main_number"
-CLIENT_START_DATE_FIELD = "company_start_date"
-BUSINESS_TYPE_FIELD = "profit_or_non_profit"
-ADDRESS_FIELD = "address"
 
 
 COMPANIES_PER_PAGE = 100
+USERS_PER_PAGE = 100
 MAX_RETRIES = 3
+JOB_NAME = "pull_freshservice"
+SYNCED_TABLES = ['companies', 'users', 'contacts']
+COMPANY_COLUMNS = ['account_number', 'name', 'freshservice_id', 'contract_type', 'billing_plan', 'support_level', 'phone_number', 'client_start_date', 'domains', 'company_owner', 'business_type']
+USER_COLUMNS = ['company_account_number', 'freshservice_id', 'full_name', 'email', 'status', 'date_added', 'billing_type']
+CONTACT_COLUMNS = ['company_account_number', 'first_name', 'last_name', 'email', 'title', 'work_phone', 'mobile_phone', 'employment_type', 'status', 'other_emails', 'address', 'notes']
+FULL_RECONCILE_DAYS = 7 # A full requester pull runs at most this far apart; other runs are incremental
+CHECKPOINT_MAX_AGE_HOURS = 12
 
 def get_db_connection(db_path, password):
     if not password: raise ValueError("A database password is required.")
@@ -43,50 +54,63 @@ def get_freshservice_api_key(db_password):
     return creds[0]
 
 # --- API Functions ---
-def get_all_companies(base_url, headers):
+def iter_company_pages(base_url, headers):
+    """Yields departments from Freshservice one page at a time."""
     print("Fetching companies from Freshservice...")
-    all_companies, page = [], 1
-    endpoint = f"{base_url}/api/v2/departments"
-    while True:
-        try:
-            params = {'page': page, 'per_page': COMPANIES_PER_PAGE}
-            response = requests.get(endpoint, headers=headers, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            companies_on_page = data.get('departments', [])
-            if not companies_on_page: break
-            all_companies.extend(companies_on_page)
-            page += 1
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching Freshservice companies: {e}", file=sys.stderr)
-            return None
-    print(f" Found {len(all_companies)} companies in Freshservice.")
-    return all_companies
-
-def get_all_users(base_url, headers):
-    print("\nFetching all users from Freshservice...")
-    all_users, page = [], 1
-    endpoint = f"{base_url}/api/v2/requesters"
-    while True:
-        params = {'page': page, 'per_page': 100}
-        try:
-            response = requests.get(endpoint, headers=headers, params=params, timeout=30)
-            if response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 5))
-                print(f"   -> Rate limit exceeded, waiting {retry_after}s...")
-                time.sleep(retry_after)
-                continue
-            response.raise_for_status()
-            data = response.json()
-            users_on_page = data.get('requesters', [])
-            if not users_on_page: break
-            all_users.extend(users_on_page)
-            page += 1
-        except requests.exceptions.RequestException as e:
-            print(f"   -> Error fetching users on page {page}: {e}", file=sys.stderr)
-            return None
-    print(f" Found {len(all_users)} total users in Freshservice.")
-    return all_users
+    for _, companies_on_page in iter_pages(f"{base_url}/api/v2/departments", headers, 'departments', per_page=COMPANIES_PER_PAGE):
+        yield companies_on_page
+
+def iter_user_pages(base_url, headers, updated_since=None, start_page=1):
+    """
+    Yields (page, requesters) from Freshservice one page at a time, so a caller can
+    write each page before the next one is fetched (a few pages are prefetched).
+    With updated_since (a date), only requesters changed after that day are returned
+    via the requester filter query. Request errors are raised; everything yielded
+    before them has been handled.
+    """
+    if updated_since:
+        print(f"\nFetching users updated since {updated_since.isoformat()} from Freshservice...")
+    else:
+        print("\nFetching all users from Freshservice...")
+    params = {}
+    if updated_since:
+        params['query'] = f"\"updated_at:>'{updated_since.isoformat()}'\""
+    try:
+        yield from iter_pages(f"{base_url}/api/v2/requesters", headers, 'requesters', params=params,
+                              per_page=USERS_PER_PAGE, start_page=start_page)
+    except requests.exceptions.RequestException as e:
+        print(f"   -> Error fetching users: {e}", file=sys.stderr)
+        raise
+
+def latest_updated_at(records):
+    """Returns the newest updated_at among API records, or None."""
+    return max((r.get('updated_at') for r in records if r.get('updated_at')), default=None)
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def get_requesters_since(cur, force_full):
+    """
+    Decides how far back the requester pull needs to go. Returns None for a full
+    reconcile (forced, first run, or the last one is FULL_RECONCILE_DAYS old),
+    otherwise the day before the requesters watermark. The filter only has day
+    granularity, so the overlap is deliberate and the upserts are idempotent.
+    """
+    if force_full:
+        return None
+    last_full = get_watermark(cur, JOB_NAME, 'requesters_full_reconcile')
+    watermark = get_watermark(cur, JOB_NAME, 'requesters')
+    if not last_full or not watermark:
+        return None
+    if datetime.now(timezone.utc) - parse_timestamp(last_full) > timedelta(days=FULL_RECONCILE_DAYS):
+        return None
+    return (parse_timestamp(watermark) - timedelta(days=1)).date()
+
+def changed_since(records, watermark):
+    """Filters API records down to those updated after the watermark (all of them if there is none)."""
+    if not watermark:
+        return list(records)
+    return [r for r in records if (r.get('updated_at') or '') > watermark]
 
 # --- Database Functions ---
 def populate_companies_database(db_connection, companies_data):
@@ -95,7 +119,6 @@ def populate_companies_database(db_connection, companies_data):
     locations_to_upsert = []
     start_of_year = date(date.today().year, 1, 1).isoformat()
 
-    print("\nProcessing and logging contract details for each company...")
     for c in companies_data:
         custom_fields = c.get('custom_fields', {}) or {}
         company_name = c.get('name', 'Unknown Company')
@@ -135,27 +158,11 @@ def populate_companies_database(db_connection, companies_data):
                 'address': address
             })
 
-    if not companies_to_insert: return
-
-    cur.executemany("""
-        INSERT INTO companies (account_number, name, freshservice_id, contract_type, billing_plan, support_level, phone_number, client_start_date, domains, company_owner, business_type)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(freshservice_id) DO UPDATE SET
-            name=excluded.name,
-            account_number=excluded.account_number,
-            contract_type=excluded.contract_type,
-            billing_plan=excluded.billing_plan,
-            support_level=excluded.support_level,
-            phone_number=excluded.phone_number,
-            client_start_date=excluded.client_start_date,
-            domains=excluded.domains,
-            company_owner=excluded.company_owner,
-            business_type=excluded.business_type
-    """, companies_to_insert)
-    print(f"\nSuccessfully inserted/updated {cur.rowcount} companies in the database.")
+    if not companies_to_insert: return empty_counts()
+
+    counts = upsert_changed_rows(cur, 'companies', 'freshservice_id', COMPANY_COLUMNS, companies_to_insert)
 
     if locations_to_upsert:
-        print("\nUpserting Main Office locations...")
         upsert_count = 0
         for loc in locations_to_upsert:
             # Check if the company exists before trying to insert a location
@@ -171,51 +178,43 @@ def populate_companies_database(db_connection, companies_data):
             else:
                 print(f"  - ⚠️  Skipping location for non-existent company account: {loc['account_number']}", file=sys.stderr)
 
-        print(f"Successfully upserted {upsert_count} Main Office locations.")
+        if upsert_count:
+            print(f"Upserted {upsert_count} Main Office locations.")
+
+    return counts
+
+
+def empty_counts():
+    return {'inserted': 0, 'updated': 0, 'unchanged': 0}
 
+def add_counts(totals, counts):
+    for key, value in counts.items():
+        totals[key] += value
 
 def populate_users_database(db_connection, users_to_insert):
-    if not users_to_insert: return
+    if not users_to_insert: return empty_counts()
     cur = db_connection.cursor()
-    cur.executemany("""
-        INSERT INTO users (company_account_number, freshservice_id, full_name, email, status, date_added, billing_type) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(freshservice_id) DO UPDATE SET
-            company_account_number=excluded.company_account_number, full_name=excluded.full_name, email=excluded.email, status=excluded.status, billing_type=excluded.billing_type
-    """, users_to_insert)
-    print(f"Successfully inserted/updated {cur.rowcount} users in the database.")
+    # date_added keeps the value from the first sync, so it is not in the update list
+    update_columns = [col for col in USER_COLUMNS if col not in ('freshservice_id', 'date_added')]
+    return upsert_changed_rows(cur, 'users', 'freshservice_id', USER_COLUMNS, users_to_insert, update_columns)
 
 def populate_contacts_database(db_connection, contacts_to_insert):
-    if not contacts_to_insert: return
+    if not contacts_to_insert: return empty_counts()
     cur = db_connection.cursor()
-    cur.executemany("""
-        INSERT INTO contacts (company_account_number, first_name, last_name, email, title, work_phone, mobile_phone, employment_type, status, other_emails, address, notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(email) DO UPDATE SET
-            company_account_number=excluded.company_account_number,
-            first_name=excluded.first_name,
-            last_name=excluded.last_name,
-            title=excluded.title,
-            work_phone=excluded.work_phone,
-            mobile_phone=excluded.mobile_phone,
-            employment_type=excluded.employment_type,
-            status=excluded.status,
-            other_emails=excluded.other_emails,
-            address=excluded.address,
-            notes=excluded.notes
-    """, contacts_to_insert)
-    print(f"Successfully inserted/updated {cur.rowcount} contacts in the database.")
+    return upsert_changed_rows(cur, 'contacts', 'email', CONTACT_COLUMNS, contacts_to_insert)
 
 def offboard_deactivated_users(db_connection, users_from_api):
     """
-    Identifies users who are inactive in the API response and deletes them from the local database.
+    Identifies users who are inactive in a page of the API response and deletes them
+    from the local database. Returns the number of users and contacts removed; the
+    caller commits with the rest of the page.
     """
     cur = db_connection.cursor()
 
     deactivated_users = {user['primary_email']: user['id'] for user in users_from_api if not user.get('active', False) and user.get('primary_email')}
 
     if not deactivated_users:
-        print("\nNo deactivated users found in Freshservice to offboard.")
-        return
+        return 0
 
     user_ids_to_delete = list(deactivated_users.values())
     emails_to_delete = list(deactivated_users.keys())
@@ -223,30 +222,102 @@ def offboard_deactivated_users(db_connection, users_from_api):
     user_id_tuples = [(user_id,) for user_id in user_ids_to_delete]
     email_tuples = [(email,) for email in emails_to_delete]
 
-
-    print(f"\nFound {len(deactivated_users)} deactivated users. Removing from local database...")
-
+    cur.execute("DROP TABLE IF EXISTS temp.ids_to_delete;")
     cur.execute("CREATE TEMP TABLE ids_to_delete (id INTEGER PRIMARY KEY);")
     cur.executemany("INSERT INTO ids_to_delete (id) VALUES (?)", user_id_tuples)
 
+    cur.execute("DROP TABLE IF EXISTS temp.emails_to_delete;")
     cur.execute("CREATE TEMP TABLE emails_to_delete (email TEXT PRIMARY KEY);")
     cur.executemany("INSERT INTO emails_to_delete (email) VALUES (?)", email_tuples)
 
     cur.execute("DELETE FROM users WHERE freshservice_id IN (SELECT id FROM ids_to_delete);")
+    deleted_count = cur.rowcount
     cur.execute("DELETE FROM contacts WHERE email IN (SELECT email FROM emails_to_delete);")
+    deleted_count += cur.rowcount
 
-    deleted_count = cur.rowcount
-    if deleted_count > 0:
-        print(f"Successfully removed {deleted_count} deactivated users from the local database.")
+    cur.execute("DROP TABLE temp.ids_to_delete;")
+    cur.execute("DROP TABLE temp.emails_to_delete;")
 
-    db_connection.commit()
+    return deleted_count
+
+def build_user_rows(users, company_id_to_account_map):
+    """
+    Turns a page of requesters into user and contact rows. A requester is linked to
+    the first of its departments that has an account number; inactive requesters and
+    requesters without an email are skipped.
+    """
+    user_rows, contact_rows = [], []
+    processed_emails = set()
+    for user in users:
+        if not user.get('active', False):
+            continue
+
+        email = user.get('primary_email')
+        if not email or email in processed_emails:
+            continue
+
+        for dept_id in (user.get('department_ids') or []):
+            if account_num := company_id_to_account_map.get(dept_id):
+                user_rows.append((
+                    str(account_num),
+                    user.get('id'),
+                    f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
+                    email,
+                    'Active',
+                    user.get('created_at', datetime.now(timezone.utc).isoformat()),
+                    'Regular'
+                ))
+                contact_rows.append((
+                    str(account_num),
+                    user.get('first_name'),
+                    user.get('last_name'),
+                    email,
+                    user.get('job_title'),
+                    user.get('work_phone_number'),
+                    user.get('mobile_phone_number'),
+                    'Full Time', # Assuming full-time, can be changed later
+                    'Active',
+                    ', '.join(user.get('other_emails', [])),
+                    user.get('address'),
+                    user.get('description')
+                ))
+                processed_emails.add(email)
+                break
+    return user_rows, contact_rows
+
+def sweep_unseen_users(db_connection, generation):
+    """
+    Deactivates synced users and contacts that a full reconcile did not see, i.e. that
+    were deleted in Freshservice or lost their company. They are soft-deleted (billing
+    only counts Active users) and their row_hash is cleared so they come back to life
+    if they reappear. Contacts that were never stamped by a sync were added by hand and
+    are left alone.
+    """
+    cur = db_connection.cursor()
+    cur.execute("""
+        UPDATE users SET status = 'Inactive', row_hash = NULL
+        WHERE freshservice_id IS NOT NULL AND status = 'Active'
+          AND (sync_generation IS NULL OR sync_generation < ?)
+    """, (generation,))
+    users_swept = cur.rowcount
+    cur.execute("""
+        UPDATE contacts SET status = 'Inactive', row_hash = NULL
+        WHERE status = 'Active' AND sync_generation IS NOT NULL AND sync_generation < ?
+    """, (generation,))
+    contacts_swept = cur.rowcount
+    print(f"Sweep: deactivated {users_swept} users and {contacts_swept} contacts no longer present in Freshservice.")
 
 
 # --- Main Execution ---
-if __name__ == "__main__":
+@reports_metrics
+def main(argv=None, password=None):
+    parser = argparse.ArgumentParser(description="Sync companies and users from Freshservice.")
+    parser.add_argument('--full', action='store_true', help="Pull every department and requester instead of only those changed since the last run.")
+    args = parser.parse_args(argv)
+
     print("--- Running Freshservice Data Sync Script ---")
 
-    DB_MASTER_PASSWORD = os.environ.get('DB_MASTER_PASSWORD')
+    DB_MASTER_PASSWORD = password or os.environ.get('DB_MASTER_PASSWORD')
     if not DB_MASTER_PASSWORD:
         print("DB_MASTER_PASSWORD environment variable not set.")
         try:
@@ -260,65 +331,108 @@ if __name__ == "__main__":
 
     try:
         API_KEY = get_freshservice_api_key(DB_MASTER_PASSWORD)
-        base_url = f"https://{FRESHSERVICE_DOMAIN}"
+        base_url = os.environ.get('FRESHSERVICE_BASE_URL') or f"https://{FRESHSERVICE_DOMAIN}" # e.g. debug/mock_api_server.py
         auth_str = f"{API_KEY}:X"
         encoded_auth = base64.b64encode(auth_str.encode()).decode()
         headers = {"Content-Type": "application/json", "Authorization": f"Basic {encoded_auth}"}
 
-        companies = get_all_companies(base_url, headers)
-        users = get_all_users(base_url, headers)
-
-        if not companies or users is None:
-            sys.exit("Could not fetch company or user data from Freshservice. Aborting sync.")
-
         con = get_db_connection(DB_FILE, DB_MASTER_PASSWORD)
+        cur = con.cursor()
+        ensure_sync_tables(cur)
+        ensure_department_cache(cur)
+        for table_name in SYNCED_TABLES:
+            ensure_column(cur, table_name, 'row_hash', 'TEXT')
+        for table_name in ('users', 'contacts'):
+            ensure_column(cur, table_name, 'sync_generation', 'INTEGER')
+
+        # Departments are written page by page and only the id -> account number map is
+        # kept, which is all the requester pass needs. The departments endpoint has no
+        # updated-since filter, so only the writes are incremental. Every page also
+        # refreshes the department cache the other scripts read.
+        departments_watermark = None if args.full else get_watermark(cur, JOB_NAME, 'departments')
+        company_id_to_account_map = {}
+        company_totals = empty_counts()
+        newest_department = None
+        refresh_started = start_refresh()
+        for companies_on_page in iter_company_pages(base_url, headers):
+            check_cancelled()
+            store_departments(cur, companies_on_page)
+            for c in companies_on_page:
+                if account_number := (c.get('custom_fields') or {}).get(ACCOUNT_NUMBER_FIELD):
+                    company_id_to_account_map[c.get('id')] = account_number
+            newest_department = max(filter(None, [newest_department, latest_updated_at(companies_on_page)]), default=None)
+            add_counts(company_totals, populate_companies_database(con, changed_since(companies_on_page, departments_watermark)))
+            timed_commit(con)
+        if not company_id_to_account_map:
+            sys.exit("Could not fetch company data from Freshservice. Aborting sync.")
+        print(f" Found {len(company_id_to_account_map)} companies with an account number. Companies: {format_counts(company_totals)}.")
+        finish_refresh(cur, refresh_started)
+        if newest_department:
+            set_watermark(cur, JOB_NAME, 'departments', newest_department)
+        con.commit()
 
-        offboard_deactivated_users(con, users)
-
-        active_users_to_insert = []
-        contacts_to_insert = []
-        company_id_to_account_map = {c.get('id'): (c.get('custom_fields') or {}).get(ACCOUNT_NUMBER_FIELD) for c in companies}
-        processed_emails = set()
-
-        for user in users:
-            if not user.get('active', False):
-                continue
-
-            email = user.get('primary_email')
-            if not email or email in processed_emails:
-                continue
-
-            for dept_id in (user.get('department_ids') or []):
-                if account_num := company_id_to_account_map.get(dept_id):
-                    active_users_to_insert.append((
-                        str(account_num),
-                        user.get('id'),
-                        f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
-                        email,
-                        'Active',
-                        user.get('created_at', datetime.now(timezone.utc).isoformat()),
-                        'Regular'
-                    ))
-                    contacts_to_insert.append((
-                        str(account_num),
-                        user.get('first_name'),
-                        user.get('last_name'),
-                        email,
-                        user.get('job_title'),
-                        user.get('work_phone_number'),
-                        user.get('mobile_phone_number'),
-                        'Full Time', # Assuming full-time, can be changed later
-                        'Active',
-                        ', '.join(user.get('other_emails', [])),
-                        user.get('address'),
-                        user.get('description')
-                    ))
-                    processed_emails.add(email)
-                    break
-
-        populate_companies_database(con, companies)
-        populate_users_database(con, active_users_to_insert)
-        populate_contacts_database(con, contacts_to_insert)
+        # An interrupted requester pull resumes after its last committed page, in the
+        # same mode (and sweep generation) it started with.
+        checkpoint = None if args.full else get_checkpoint(cur, JOB_NAME, max_age_hours=CHECKPOINT_MAX_AGE_HOURS)
+        if checkpoint:
+            requesters_since = date.fromisoformat(checkpoint['watermark']) if checkpoint['watermark'] else None
+            start_page = checkpoint['last_page'] + 1
+            print(f"\nFound checkpoint from {checkpoint['updated_at']}. Resuming requesters at page {start_page}...")
+        else:
+            requesters_since = get_requesters_since(cur, args.full)
+            start_page = 1
+        full_reconcile = requesters_since is None
+        if full_reconcile:
+            print("\nRunning a full requester reconcile.")
+            generation = start_generation(cur, JOB_NAME, resuming=checkpoint is not None)
+        run_started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+        user_totals, contact_totals = empty_counts(), empty_counts()
+        offboarded = 0
+        requesters_seen = 0
+        requesters_watermark = get_watermark(cur, JOB_NAME, 'requesters_pending') if checkpoint else None
+        start_time = time.time()
+        for page, users_on_page in iter_user_pages(base_url, headers, requesters_since, start_page):
+            check_cancelled()
+            offboarded += offboard_deactivated_users(con, users_on_page)
+            user_rows, contact_rows = build_user_rows(users_on_page, company_id_to_account_map)
+            add_counts(user_totals, populate_users_database(con, user_rows))
+            add_counts(contact_totals, populate_contacts_database(con, contact_rows))
+            if full_reconcile:
+                stamp_generation(cur, 'users', 'freshservice_id', [u[1] for u in user_rows], generation)
+                stamp_generation(cur, 'contacts', 'email', [c[3] for c in contact_rows], generation)
+
+            # Pages are not ordered by updated_at, so the newest value is only
+            # promoted to the requesters watermark once the whole pull is done.
+            requesters_watermark = max(filter(None, [requesters_watermark, latest_updated_at(users_on_page)]), default=None)
+            if requesters_watermark:
+                set_watermark(cur, JOB_NAME, 'requesters_pending', requesters_watermark)
+            save_checkpoint(cur, JOB_NAME, last_page=page,
+                            watermark=requesters_since.isoformat() if requesters_since else None)
+            timed_commit(con)
+
+            requesters_seen += len(users_on_page)
+            print(f"   -> Page {page}: {len(users_on_page)} requesters, {len(user_rows)} active users written "
+                  f"({requesters_seen} requesters in {time.time() - start_time:.1f}s).")
+
+        print(f"\nUsers: {format_counts(user_totals)}.")
+        print(f"Contacts: {format_counts(contact_totals)}.")
+        if offboarded:
+            print(f"Removed {offboarded} deactivated users and contacts from the local database.")
+
+        # Only a full reconcile sees every requester, so only it may sweep.
+        if full_reconcile:
+            cur.execute("SELECT COUNT(*) FROM users WHERE sync_generation = ?", (generation,))
+            if cur.fetchone()[0]:
+                sweep_unseen_users(con, generation)
+            else:
+                print("Sweep skipped: the full reconcile returned no active users.")
+        if requesters_watermark:
+            set_watermark(cur, JOB_NAME, 'requesters', requesters_watermark)
+        if full_reconcile:
+            set_watermark(cur, JOB_NAME, 'requesters_full_reconcile', run_started)
+        cur.execute("DELETE FROM sync_state WHERE job_name = ? AND resource = 'requesters_pending'", (JOB_NAME,))
+        clear_checkpoint(cur, JOB_NAME)
 
         con.commit()
         con.close()
@@ -327,3 +441,6 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"\nAn error occurred during data sync: {e}", file=sys.stderr)
         sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,16 @@ import sys
 import time
 import getpass
 import argparse
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from rate_limiter import AdaptiveConcurrency
+from paginator import iter_pages, get_limiter
+from job_runner import check_cancelled, submit_in_job_context
+from job_metrics import record_api_call, record_rows, reports_metrics, timed, timed_commit
+from department_cache import get_account_number_map, fetch_missing_departments
+from sync_state import ensure_sync_tables, ensure_column, get_checkpoint, save_checkpoint, clear_checkpoint, get_watermark, set_watermark
 
 try:
     from sqlcipher3 import dbapi2 as sqlite3
@@ -18,6 +27,18 @@ FRESHSERVICE_DOMAIN = "integotecllc.freshservice.com"
 ACCOUNT_NUMBER_FIELD = "account_number"
 MAX_RETRIES = 3
 DEFAULT_TICKET_HOURS = 0.25 # 15 minutes
+BATCH_SIZE = 50 # Tickets written (and checkpointed) per transaction
+MAX_WORKERS = 8 # Upper bound on concurrent time-entry requests
+INITIAL_WORKERS = 4
+RATE_LIMIT_RETRIES = 10 # 429s are waited out rather than counted against MAX_RETRIES
+CHECKPOINT_MAX_AGE_HOURS = 12 # Older checkpoints are ignored and the run starts over from the watermark
+VERIFY_SLICE_SIZE = 25 # Stored tickets whose time entries each incremental run fetches again
+JOB_NAME = "pull_ticket_details"
+FULL_SYNC_JOB_NAME = "pull_ticket_details --full-sync"
+WATERMARK_RESOURCE = "tickets"
+VERIFY_RESOURCE = "verified_through_ticket_id" # Where reverify_stored_tickets continues from
+LIVE_TABLE = "ticket_details"
+SHADOW_TABLE = "ticket_details_shadow" # Filled by --full-sync and swapped in when the run completes
 
 def get_db_connection(db_path, password):
     if not password: raise ValueError("A database password is required.")
@@ -35,102 +56,60 @@ def get_freshservice_api_key(db_password):
     if not creds: raise ValueError("Freshservice credentials not found in the database.")
     return creds[0]
 
-def get_latest_ticket_timestamp(cur):
-    """Gets the timestamp of the most recently updated ticket in the local DB."""
-    cur.execute("SELECT MAX(last_updated_at) as latest_timestamp FROM ticket_details")
-    result = cur.fetchone()
-    if result and result['latest_timestamp']:
-        return datetime.fromisoformat(result['latest_timestamp'].replace('Z', '+00:00')) + timedelta(seconds=1)
+def get_ticket_watermark(cur):
+    """Gets the incremental sync start time from the persistent ticket watermark."""
+    watermark = get_watermark(cur, JOB_NAME, WATERMARK_RESOURCE)
+    if watermark:
+        return datetime.fromisoformat(watermark.replace('Z', '+00:00')) + timedelta(seconds=1)
     else:
-        print("No existing tickets found. Performing initial sync for the past year.")
+        print("No ticket watermark found. Performing initial sync for the past year.")
         return datetime.now(timezone.utc) - timedelta(days=365)
 
-# --- THIS IS THE FIX ---
-def get_fs_company_map_from_api(base_url, headers):
-    """Fetches all companies from Freshservice and returns a map of fs_id to account_number."""
-    all_companies = []
-    page = 1
-    print("Fetching company map directly from Freshservice API to ensure data integrity...")
-    while True:
-        params = {'page': page, 'per_page': 100}
-        try:
-            response = requests.get(f"{base_url}/api/v2/departments", headers=headers, params=params, timeout=90)
-            if response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 10))
-                print(f"  -> Rate limit hit, waiting {retry_after}s...")
-                time.sleep(retry_after)
-                continue
-            response.raise_for_status()
-            data = response.json()
-            companies_on_page = data.get('departments', [])
-            if not companies_on_page: break
-            all_companies.extend(companies_on_page)
-            page += 1
-            time.sleep(0.5)
-        except requests.exceptions.RequestException as e:
-            print(f"FATAL error fetching companies for mapping: {e}", file=sys.stderr)
-            return None
-
-    if all_companies is None:
-        return {}
-
-    fs_id_to_account_map = {}
-    for company in all_companies:
-        fs_id = company.get('id')
-        custom_fields = company.get('custom_fields', {}) or {}
-        account_number = custom_fields.get(ACCOUNT_NUMBER_FIELD)
-        if fs_id and account_number:
-            fs_id_to_account_map[fs_id] = str(account_number)
-
-    print(f"Successfully built a map of {len(fs_id_to_account_map)} companies with account numbers.")
-    return fs_id_to_account_map
-# --- END OF FIX ---
-
 # --- API Functions ---
 def get_updated_tickets(base_url, headers, since_timestamp):
     all_tickets = []
     since_str = since_timestamp.strftime('%Y-%m-%dT%H:%M:%SZ')
     query = f"(updated_at:>'{since_str}' AND status:5)"
-    page = 1
     print(f"Fetching CLOSED tickets updated since {since_str}...")
 
-    while True:
-        params = {'query': f'"{query}"', 'page': page, 'per_page': 100}
-        try:
-            response = requests.get(f"{base_url}/api/v2/tickets/filter", headers=headers, params=params, timeout=90)
-            if response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 10))
-                print(f"  -> Rate limit hit, waiting {retry_after}s...")
-                time.sleep(retry_after)
-                continue
-            response.raise_for_status()
-            data = response.json()
-            tickets_on_page = data.get('tickets', [])
-            if not tickets_on_page: break
+    try:
+        for page, tickets_on_page in iter_pages(f"{base_url}/api/v2/tickets/filter", headers, 'tickets', params={'query': f'"{query}"'}):
             all_tickets.extend(tickets_on_page)
             print(f"  -> Fetched page {page}, total tickets so far: {len(all_tickets)}")
-            page += 1
-            time.sleep(1)
-        except requests.exceptions.RequestException as e:
-            print(f"FATAL error fetching tickets: {e}", file=sys.stderr)
-            return None
+    except requests.exceptions.RequestException as e:
+        print(f"FATAL error fetching tickets: {e}", file=sys.stderr)
+        return None
     return all_tickets
 
-def get_time_entries_for_ticket(base_url, headers, ticket_id):
+def get_time_entries_for_ticket(base_url, headers, ticket_id, limiter=None, concurrency=None):
+    """
+    Returns (total_hours, entry_count) for a ticket, or None if the entries could not
+    be fetched. Runs on the worker pool; a cancelled or timed-out job stops before
+    each attempt and the JobCancelled reaches process_tickets through the future.
+    """
     total_hours = 0
     endpoint = f"{base_url}/api/v2/tickets/{ticket_id}/time_entries"
-    retries = 0
-    while retries < MAX_RETRIES:
+    retries, rate_limited = 0, 0
+    while retries < MAX_RETRIES and rate_limited < RATE_LIMIT_RETRIES:
+        check_cancelled()
         try:
+            if limiter: limiter.acquire()
             response = requests.get(endpoint, headers=headers, timeout=60)
+            record_api_call(response)
+            if limiter: limiter.update_from_headers(response.headers)
             if response.status_code == 429:
                 retry_after = int(response.headers.get('Retry-After', 10))
                 print(f"    [!] Rate limit on ticket #{ticket_id}. Retrying in {retry_after}s...")
-                time.sleep(retry_after)
-                retries += 1
+                rate_limited += 1
+                if concurrency: concurrency.on_rate_limited()
+                if limiter:
+                    limiter.pause(retry_after)
+                else:
+                    time.sleep(retry_after)
                 continue
+            if concurrency: concurrency.on_success()
             if response.status_code == 404:
-                return 0
+                return 0, 0
             response.raise_for_status()
             data = response.json()
             time_entries = data.get('time_entries', [])
@@ -144,39 +123,279 @@ def get_time_entries_for_ticket(base_url, headers, ticket_id):
                     if len(parts) == 3:
                         h, m, s = parts
                         total_hours += h + m / 60.0 + s / 3600.0
-            return total_hours
+            return total_hours, len(time_entries)
         except requests.exceptions.RequestException as e:
             print(f"  -> WARN: Could not fetch time for ticket {ticket_id}: {e}", file=sys.stderr)
             retries += 1
             time.sleep(5)
-    print(f"  -> ERROR: Failed to fetch time for ticket {ticket_id} after {MAX_RETRIES} retries.", file=sys.stderr)
-    return 0
+    print(f"  -> ERROR: Failed to fetch time for ticket {ticket_id} after {retries + rate_limited} attempts.", file=sys.stderr)
+    return None
 
-def upsert_ticket_details(db_connection, ticket_data_to_upsert):
+def upsert_ticket_details(db_connection, ticket_data_to_upsert, table_name=LIVE_TABLE):
     if not ticket_data_to_upsert:
-        print("\nNo new or updated ticket data to insert.")
-        return
+        return 0
     cur = db_connection.cursor()
-    cur.executemany("""
-        INSERT INTO ticket_details (ticket_id, company_account_number, subject, last_updated_at, closed_at, total_hours_spent)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ON CONFLICT(ticket_id) DO UPDATE SET
-            company_account_number = excluded.company_account_number,
-            subject = excluded.subject,
-            last_updated_at = excluded.last_updated_at,
-            closed_at = excluded.closed_at,
-            total_hours_spent = excluded.total_hours_spent
-    """, ticket_data_to_upsert)
-    print(f"\nSuccessfully inserted/updated details for {cur.rowcount} tickets.")
+    with timed('db_write_seconds'):
+        cur.executemany(f"""
+            INSERT INTO {table_name} (ticket_id, company_account_number, subject, last_updated_at, closed_at, total_hours_spent, time_entry_count, fingerprint)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(ticket_id) DO UPDATE SET
+                company_account_number = excluded.company_account_number,
+                subject = excluded.subject,
+                last_updated_at = excluded.last_updated_at,
+                closed_at = excluded.closed_at,
+                total_hours_spent = excluded.total_hours_spent,
+                time_entry_count = excluded.time_entry_count,
+                fingerprint = excluded.fingerprint
+        """, ticket_data_to_upsert)
+    return cur.rowcount
+
+def ticket_fingerprint(ticket, account_number):
+    """
+    Fingerprint of what the ticket list tells us about a ticket. It assumes logging
+    time on a ticket bumps its updated_at, so an unchanged fingerprint means the
+    stored hours are still correct and /time_entries does not need to be called
+    again. The ticket list has no field that shows time entries directly, so a
+    ticket whose time changed without its updated_at moving is not seen here (nor
+    by the incremental filter); reverify_stored_tickets catches those a slice per
+    run by comparing the stored entry count and hours, and --full-sync refetches
+    everything.
+    """
+    raw = f"{ticket.get('updated_at')}|{account_number}|{ticket.get('subject')}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def get_stored_fingerprints(cur, ticket_ids):
+    if not ticket_ids:
+        return {}
+    placeholders = ', '.join(['?'] * len(ticket_ids))
+    cur.execute(f"SELECT ticket_id, fingerprint FROM {LIVE_TABLE} WHERE ticket_id IN ({placeholders})", list(ticket_ids))
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+def copy_live_tickets(cur, ticket_ids, table_name):
+    """
+    Carries rows over from the live table into the shadow table: on a full sync, the
+    stored rows of tickets whose time entries could not be fetched.
+    """
+    if not ticket_ids or table_name == LIVE_TABLE:
+        return
+    placeholders = ', '.join(['?'] * len(ticket_ids))
+    cur.execute(f"INSERT OR REPLACE INTO {table_name} SELECT * FROM {LIVE_TABLE} WHERE ticket_id IN ({placeholders})", list(ticket_ids))
+
+def create_shadow_table(cur):
+    """
+    (Re)creates the shadow table from the live table's own definition, so it keeps
+    the same columns and constraints as whatever schema version this database has.
+    """
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (LIVE_TABLE,))
+    live_sql = cur.fetchone()[0]
+    cur.execute(f"DROP TABLE IF EXISTS {SHADOW_TABLE}")
+    cur.execute(re.sub(rf"\b{LIVE_TABLE}\b", SHADOW_TABLE, live_sql, count=1))
+
+def shadow_table_exists(cur):
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SHADOW_TABLE,))
+    return cur.fetchone() is not None
+
+def swap_in_shadow_table(con, failed_watermark=None):
+    """
+    Replaces the live table with the completed shadow table. The drop, rename, index
+    rebuild and watermark update happen in one transaction, so readers see either the
+    old data or the new data and never an empty table. With failed_watermark (some
+    tickets could not be fetched), the watermark is set to it instead of the newest
+    ticket so the next incremental run fetches them again.
+    """
+    cur = con.cursor()
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (LIVE_TABLE,))
+    index_sql = [row[0] for row in cur.fetchall()]
+
+    if con.in_transaction:
+        con.commit()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(f"SELECT MAX(last_updated_at) FROM {SHADOW_TABLE}")
+        newest = cur.fetchone()[0]
+        cur.execute(f"DROP TABLE {LIVE_TABLE}")
+        cur.execute(f"ALTER TABLE {SHADOW_TABLE} RENAME TO {LIVE_TABLE}")
+        for sql in index_sql:
+            cur.execute(sql)
+        if failed_watermark or newest:
+            set_watermark(cur, JOB_NAME, WATERMARK_RESOURCE, failed_watermark or newest)
+        clear_checkpoint(cur, FULL_SYNC_JOB_NAME)
+        cur.execute("COMMIT")
+    except Exception:
+        cur.execute("ROLLBACK")
+        raise
+
+def ticket_cursor(ticket):
+    """Sort key and checkpoint cursor for a ticket: updated_at first, ticket id as the tie-breaker."""
+    return f"{ticket.get('updated_at') or ''}|{ticket['id']:012d}"
+
+def retry_watermark(ticket):
+    """
+    A watermark from which the next incremental run fetches this ticket again:
+    get_ticket_watermark adds a second and the ticket filter is strictly after it.
+    """
+    updated_at = datetime.fromisoformat(ticket['updated_at'].replace('Z', '+00:00'))
+    return (updated_at - timedelta(seconds=2)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def build_ticket_row(base_url, headers, ticket, account_number, limiter=None, concurrency=None):
+    """Returns the row to store for a ticket, or None if its time entries could not be fetched."""
+    ticket_id = ticket['id']
+
+    if concurrency:
+        with concurrency:
+            result = get_time_entries_for_ticket(base_url, headers, ticket_id, limiter, concurrency)
+    else:
+        result = get_time_entries_for_ticket(base_url, headers, ticket_id, limiter)
+
+    # Not written at all, so the hours already stored for the ticket are kept.
+    if result is None:
+        return None
+    fingerprint = ticket_fingerprint(ticket, account_number)
+    total_hours, entry_count = result
+
+    if total_hours == 0:
+        total_hours = DEFAULT_TICKET_HOURS
+        print(f"    -> Ticket #{ticket_id}: no time entries found. Assigning default {DEFAULT_TICKET_HOURS} hours.")
+
+    closed_date = ticket.get('updated_at')
+
+    return (
+        ticket_id,
+        account_number,
+        ticket.get('subject', 'No Subject'),
+        ticket.get('updated_at'),
+        closed_date,
+        total_hours,
+        entry_count,
+        fingerprint
+    )
+
+def process_tickets(con, base_url, headers, tickets, fs_id_to_account_map, job_name, since_str, resume_after=None, table_name=LIVE_TABLE):
+    """
+    Fetches time entries concurrently and writes tickets in batches of BATCH_SIZE.
+    Each batch is committed together with the checkpoint so an interrupted run
+    resumes after the last ticket written. When writing to the shadow table every
+    ticket's time entries are fetched again, whatever its fingerprint, and the
+    watermark is left alone; it moves when the shadow table is swapped in.
+
+    Tickets whose time entries could not be fetched keep their stored row, and the
+    checkpoint and watermark stop before the first of them so the next run retries
+    it. Returns (tickets written, retry watermark or None).
+    """
+    cur = con.cursor()
+    pending = sorted(tickets, key=ticket_cursor)
+    if resume_after:
+        pending = [t for t in pending if ticket_cursor(t) > resume_after]
+        print(f"Resuming after checkpoint; {len(pending)} of {len(tickets)} tickets left to process.")
+
+    limiter = get_limiter(base_url)
+    concurrency = AdaptiveConcurrency(INITIAL_WORKERS, maximum=MAX_WORKERS)
+    started = time.monotonic()
+    total_written, total_unchanged, total_failed = 0, 0, 0
+    checkpoint_cursor, failed_watermark = None, None # Both fixed at the first failed ticket
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for start in range(0, len(pending), BATCH_SIZE):
+            check_cancelled()
+            batch = pending[start:start + BATCH_SIZE]
+            # A full sync refetches every ticket, which is how stored hours that are wrong get corrected.
+            stored_fingerprints = {} if table_name == SHADOW_TABLE else get_stored_fingerprints(cur, [t['id'] for t in batch])
+            futures, unchanged_ids = [], []
+            for ticket in batch:
+                account_number = fs_id_to_account_map.get(ticket.get('department_id'))
+                if not account_number:
+                    continue
+                if stored_fingerprints.get(ticket['id']) == ticket_fingerprint(ticket, account_number):
+                    unchanged_ids.append(ticket['id'])
+                    continue
+                futures.append((ticket, submit_in_job_context(executor, build_ticket_row, base_url, headers, ticket, account_number, limiter, concurrency)))
+            results = [(ticket, future.result()) for ticket, future in futures]
+            rows = [row for _, row in results if row is not None]
+            failed = [ticket for ticket, row in results if row is None]
+
+            total_unchanged += len(unchanged_ids)
+            total_failed += len(failed)
+            copy_live_tickets(cur, [t['id'] for t in failed], table_name)
+            total_written += upsert_ticket_details(con, rows, table_name)
+            inserted = sum(1 for row in rows if row[0] not in stored_fingerprints)
+            record_rows({'inserted': inserted, 'updated': len(rows) - inserted, 'unchanged': len(unchanged_ids)})
+            if failed and failed_watermark is None:
+                # Futures are in batch order, so failed[0] is the earliest failure of the run.
+                position = pending.index(failed[0])
+                checkpoint_cursor = ticket_cursor(pending[position - 1]) if position else resume_after
+                failed_watermark = retry_watermark(failed[0])
+                if table_name == LIVE_TABLE:
+                    set_watermark(cur, JOB_NAME, WATERMARK_RESOURCE, failed_watermark)
+            if failed_watermark is None:
+                # Tickets are sorted by updated_at, so the last one in the batch is the new high-water mark.
+                if table_name == LIVE_TABLE and batch[-1].get('updated_at'):
+                    set_watermark(cur, JOB_NAME, WATERMARK_RESOURCE, batch[-1]['updated_at'])
+                save_checkpoint(cur, job_name, last_item_id=ticket_cursor(batch[-1]), watermark=since_str)
+            else:
+                save_checkpoint(cur, job_name, last_item_id=checkpoint_cursor, watermark=since_str)
+            timed_commit(con)
+
+            done = min(start + BATCH_SIZE, len(pending))
+            elapsed = time.monotonic() - started
+            print(f"  -> Committed {done}/{len(pending)} tickets "
+                  f"({done / elapsed if elapsed else 0:.1f} tickets/s, concurrency {concurrency.limit}, "
+                  f"quota {limiter.rate_per_minute:.0f}/min, {concurrency.rate_limited} rate limits hit).")
+
+    if total_unchanged:
+        print(f"Skipped time-entry lookups for {total_unchanged} tickets whose fingerprint was unchanged.")
+    if total_failed:
+        print(f"Could not fetch time entries for {total_failed} tickets; their stored hours were kept and the next run retries them.", file=sys.stderr)
+    return total_written, failed_watermark
+
+def reverify_stored_tickets(con, base_url, headers, limit=VERIFY_SLICE_SIZE):
+    """
+    Fetches the time entries of the next `limit` stored tickets again, walking the
+    table by ticket id over successive runs, and corrects rows whose entry count or
+    hours no longer match. A mismatch means time changed without the ticket's
+    updated_at moving, which the fingerprint and watermark cannot see. Returns the
+    number of tickets corrected.
+    """
+    cur = con.cursor()
+    after = int(get_watermark(cur, JOB_NAME, VERIFY_RESOURCE) or 0)
+    cur.execute(f"SELECT ticket_id, total_hours_spent, time_entry_count FROM {LIVE_TABLE} WHERE ticket_id > ? ORDER BY ticket_id LIMIT ?",
+                (after, limit))
+    stored_rows = cur.fetchall()
+    limiter = get_limiter(base_url)
+    corrected = 0
+    for ticket_id, stored_hours, stored_count in stored_rows:
+        result = get_time_entries_for_ticket(base_url, headers, ticket_id, limiter)
+        if result is None:
+            break # Retried from this ticket on the next run
+        total_hours, entry_count = result
+        total_hours = total_hours or DEFAULT_TICKET_HOURS
+        if (entry_count, round(total_hours, 4)) != (stored_count, round(stored_hours or 0, 4)):
+            # Rows written before the count was stored only get their count filled in.
+            if stored_count is not None:
+                print(f"    -> Ticket #{ticket_id}: {entry_count} time entries ({total_hours:.2f}h) where {stored_count} "
+                      f"({stored_hours or 0:.2f}h) were stored, though its updated_at did not change. Correcting it.")
+                corrected += 1
+            with timed('db_write_seconds'):
+                cur.execute(f"UPDATE {LIVE_TABLE} SET total_hours_spent = ?, time_entry_count = ? WHERE ticket_id = ?",
+                            (total_hours, entry_count, ticket_id))
+        after = ticket_id
+    else:
+        if len(stored_rows) < limit:
+            after = 0 # Reached the end of the table; the next run starts over
+    set_watermark(cur, JOB_NAME, VERIFY_RESOURCE, str(after))
+    timed_commit(con)
+    if corrected:
+        print(f"Corrected the stored time of {corrected} tickets whose time entries changed without an updated_at change.")
+    return corrected
 
 # --- Main Execution ---
-if __name__ == "__main__":
+@reports_metrics
+def main(argv=None, password=None):
     parser = argparse.ArgumentParser(description="Sync ticket details from Freshservice.")
     parser.add_argument('--full-sync', action='store_true', help="Force a full sync of all tickets from the past year.")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    print("--- Running Ticket Details Sync Script (Last Ticket Timestamp Method) ---")
-    DB_MASTER_PASSWORD = os.environ.get('DB_MASTER_PASSWORD')
+    print("--- Running Ticket Details Sync Script (Persistent Watermark Method) ---")
+    DB_MASTER_PASSWORD = password or os.environ.get('DB_MASTER_PASSWORD')
     if not DB_MASTER_PASSWORD:
         try:
             DB_MASTER_PASSWORD = getpass.getpass("Please enter the database password: ")
@@ -186,63 +405,75 @@ if __name__ == "__main__":
 
     try:
         API_KEY = get_freshservice_api_key(DB_MASTER_PASSWORD)
-        base_url = f"https://{FRESHSERVICE_DOMAIN}"
+        base_url = os.environ.get('FRESHSERVICE_BASE_URL') or f"https://{FRESHSERVICE_DOMAIN}" # e.g. debug/mock_api_server.py
         auth_str = f"{API_KEY}:X"
         encoded_auth = base64.b64encode(auth_str.encode()).decode()
         headers = {"Content-Type": "application/json", "Authorization": f"Basic {encoded_auth}"}
 
-        fs_id_to_account_map = get_fs_company_map_from_api(base_url, headers)
-        if not fs_id_to_account_map:
-            sys.exit("Could not build company map from Freshservice API. Aborting ticket sync.")
-
         con, cur = get_db_connection(DB_FILE, DB_MASTER_PASSWORD)
+        ensure_sync_tables(cur)
+        fs_id_to_account_map = get_account_number_map(con, base_url, headers)
+        if not any(fs_id_to_account_map.values()):
+            sys.exit("Could not build company map from the department cache. Aborting ticket sync.")
+        ensure_column(cur, 'ticket_details', 'time_entry_count', 'INTEGER')
+        ensure_column(cur, 'ticket_details', 'fingerprint', 'TEXT')
 
-        if args.full_sync:
-            print("Full sync flag detected. Clearing all existing ticket data...")
-            cur.execute("DELETE FROM ticket_details;")
+        job_name = FULL_SYNC_JOB_NAME if args.full_sync else JOB_NAME
+        target_table = SHADOW_TABLE if args.full_sync else LIVE_TABLE
+        checkpoint = get_checkpoint(cur, job_name, max_age_hours=CHECKPOINT_MAX_AGE_HOURS)
+        if checkpoint and args.full_sync and not shadow_table_exists(cur):
+            checkpoint = None
+        resume_after = None
+
+        if checkpoint and checkpoint['watermark']:
+            print(f"Found checkpoint from {checkpoint['updated_at']}. Resuming interrupted run...")
+            last_sync_time = datetime.fromisoformat(checkpoint['watermark'].replace('Z', '+00:00'))
+            resume_after = checkpoint['last_item_id']
+        elif args.full_sync:
+            print("Full sync flag detected. Building a fresh copy of the ticket data in a shadow table...")
+            print("The current ticket data stays in place until the new copy is complete.")
+            create_shadow_table(cur)
             print("Fetching all closed tickets from the past year.")
             last_sync_time = datetime.now(timezone.utc) - timedelta(days=365)
         else:
-            last_sync_time = get_latest_ticket_timestamp(cur)
+            last_sync_time = get_ticket_watermark(cur)
+
+        since_str = last_sync_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+        # Record the run's starting watermark before any slow work so it survives an interruption.
+        if not checkpoint:
+            save_checkpoint(cur, job_name, watermark=since_str)
+            con.commit()
 
         tickets = get_updated_tickets(base_url, headers, last_sync_time)
         if tickets is None: sys.exit("Aborting due to ticket fetch failure.")
 
-        ticket_details_to_upsert = []
+        unknown_departments = {t['department_id'] for t in tickets or [] if t.get('department_id') and t['department_id'] not in fs_id_to_account_map}
+        if unknown_departments:
+            fs_id_to_account_map.update(fetch_missing_departments(con, base_url, headers, unknown_departments))
+
+        written, failed_watermark = 0, None
         if tickets:
             print("\nProcessing tickets and fetching their total time entries...")
-            for ticket in tickets:
-                department_id = ticket.get('department_id')
-                account_number = fs_id_to_account_map.get(department_id)
-                if not account_number:
-                    continue
-
-                ticket_id = ticket['id']
-                print(f"  -> Processing Ticket #{ticket_id}...")
-
-                total_hours = get_time_entries_for_ticket(base_url, headers, ticket_id)
+            written, failed_watermark = process_tickets(con, base_url, headers, tickets, fs_id_to_account_map, job_name, since_str, resume_after, target_table)
 
-                if total_hours == 0:
-                    total_hours = DEFAULT_TICKET_HOURS
-                    print(f"    -> No time entries found. Assigning default {DEFAULT_TICKET_HOURS} hours.")
-
-                closed_date = ticket.get('updated_at')
-
-                ticket_details_to_upsert.append((
-                    ticket_id,
-                    account_number,
-                    ticket.get('subject', 'No Subject'),
-                    ticket.get('updated_at'),
-                    closed_date,
-                    total_hours
-                ))
-
-        upsert_ticket_details(con, ticket_details_to_upsert)
+        if written:
+            print(f"\nSuccessfully inserted/updated details for {written} tickets.")
+        else:
+            print("\nNo new or updated ticket data to insert.")
 
-        con.commit()
+        if args.full_sync:
+            print("Swapping the completed shadow table in for the live ticket data...")
+            swap_in_shadow_table(con, failed_watermark)
+        else:
+            clear_checkpoint(cur, job_name)
+            con.commit()
+            reverify_stored_tickets(con, base_url, headers)
         con.close()
         print("\n--- Ticket Details Sync Successful ---")
 
     except Exception as e:
         print(f"\nAn error occurred during ticket sync: {e}", file=sys.stderr)
         sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# rate_limiter.py
+"""
+Client-side rate limiting for the sync scripts.
+
+TokenBucket spaces requests so that we stay inside the API quota, and retunes
+itself from the rate-limit headers Freshservice returns on every response.
+AdaptiveConcurrency caps how many requests are in flight at once, halving the
+cap whenever a 429 comes back and growing it again while requests succeed.
+shared_limiter hands out one bucket per API host and configured rate. The bucket
+is a SharedTokenBucket kept in a lock file, so jobs running side by side in
+separate processes stay inside the quota together instead of tripping each
+other's 429s.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Freshservice reports the per-minute quota of the account's plan and what is left of it.
+RATE_LIMIT_TOTAL_HEADER = 'X-Ratelimit-Total'
+RATE_LIMIT_REMAINING_HEADER = 'X-Ratelimit-Remaining'
+# Leave some of the quota for the web UI and other jobs.
+QUOTA_SAFETY_FACTOR = 0.9
+# Holds one bucket state file per API host, shared by every job process.
+RATE_LIMIT_STATE_DIR = ".rate_limits"
+
+
+class TokenBucket:
+    """A thread-safe token bucket refilled at rate_per_minute."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_minute = float(rate_per_minute)
+        self.capacity = float(capacity or max(1, rate_per_minute / 6))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_minute / 60.0)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a token is available, then takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) * 60.0 / self.rate_per_minute
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stops handing out tokens for the given number of seconds (e.g. after a 429)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+    def update_from_headers(self, headers):
+        """Retunes the bucket from the quota and remaining-call headers of a response."""
+        total = headers.get(RATE_LIMIT_TOTAL_HEADER)
+        remaining = headers.get(RATE_LIMIT_REMAINING_HEADER)
+        with self.lock:
+            try:
+                if total:
+                    rate = max(1.0, int(total) * QUOTA_SAFETY_FACTOR)
+                    if rate != self.rate_per_minute:
+                        self.rate_per_minute = rate
+                        self.capacity = max(1.0, rate / 6)
+                if remaining is not None:
+                    self.tokens = min(self.tokens, max(0.0, int(remaining) * QUOTA_SAFETY_FACTOR))
+            except (TypeError, ValueError):
+                pass
+
+
+class AdaptiveConcurrency:
+    """
+    A resizable semaphore. The limit is halved on every rate-limit response and
+    raised by one after `increase_after` consecutive successes (AIMD).
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, increase_after=20):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.increase_after = increase_after
+        self.in_flight = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+        return False
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.increase_after and self.limit < self.maximum:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+
+    def on_rate_limited(self):
+        with self.condition:
+            self.rate_limited += 1
+            self.successes = 0
+            self.limit = max(self.minimum, self.limit // 2)
+
+
+
+class SharedTokenBucket:
+    """
+    A token bucket whose state lives in a lock file, so every process talking to the
+    same API host (scheduled jobs, run-now triggers, manual runs) draws from one
+    budget. It has the same interface as TokenBucket; a 429 seen by one process
+    pauses all of them. The configured rate is part of the file name, so a caller
+    configured with another quota for the same host (Freshservice and Datto behind
+    one debug server) gets its own bucket instead of the first caller's rate.
+    """
+
+    def __init__(self, host, rate_per_minute, capacity=None, state_dir=RATE_LIMIT_STATE_DIR):
+        os.makedirs(state_dir, exist_ok=True)
+        self.path = os.path.join(state_dir, f"{re.sub(r'[^A-Za-z0-9.-]', '_', host)}-{float(rate_per_minute):g}.json")
+        self.default_rate = float(rate_per_minute)
+        self.default_capacity = capacity
+        self.rate_per_minute = self.default_rate
+        self.thread_lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        """Yields the bucket state under an exclusive lock and writes it back afterwards."""
+        with self.thread_lock, open(self.path, 'a+') as f:
+            _lock_file(f)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or '{}')
+                except ValueError:
+                    state = {}
+                if 'rate_per_minute' not in state:
+                    capacity = float(self.default_capacity or max(1, self.default_rate / 6))
+                    state = {'rate_per_minute': self.default_rate, 'capacity': capacity, 'tokens': capacity,
+                             'updated': time.time(), 'paused_until': 0.0}
+                yield state
+                self.rate_per_minute = state['rate_per_minute']
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                _unlock_file(f)
+
+    @staticmethod
+    def _refill(state, now):
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(state['capacity'], state['tokens'] + elapsed * state['rate_per_minute'] / 60.0)
+        state['updated'] = now
+
+    def acquire(self):
+        """Blocks until a token is available, then takes it."""
+        while True:
+            with self._state() as state:
+                now = time.time()
+                self._refill(state, now)
+                if now < state['paused_until']:
+                    wait = state['paused_until'] - now
+                elif state['tokens'] >= 1:
+                    state['tokens'] -= 1
+                    return
+                else:
+                    wait = (1 - state['tokens']) * 60.0 / state['rate_per_minute']
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stops handing out tokens to every process for the given number of seconds."""
+        with self._state() as state:
+            state['paused_until'] = max(state['paused_until'], time.time() + seconds)
+            state['tokens'] = 0
+
+    def update_from_headers(self, headers):
+        """Retunes the shared bucket from the quota and remaining-call headers of a response."""
+        total = headers.get(RATE_LIMIT_TOTAL_HEADER)
+        remaining = headers.get(RATE_LIMIT_REMAINING_HEADER)
+        if not total and remaining is None:
+            return
+        with self._state() as state:
+            try:
+                if total:
+                    rate = max(1.0, int(total) * QUOTA_SAFETY_FACTOR)
+                    state['rate_per_minute'] = rate
+                    state['capacity'] = max(1.0, rate / 6)
+                if remaining is not None:
+                    self._refill(state, time.time())
+                    state['tokens'] = min(state['tokens'], max(0.0, int(remaining) * QUOTA_SAFETY_FACTOR))
+            except (TypeError, ValueError):
+                pass
+
+
+def _lock_file(f):
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f):
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# One bucket per API host and rate, shared by every caller in the process.
+_shared_buckets = {}
+_shared_buckets_lock = threading.Lock()
+
+
+def shared_limiter(host, rate_per_minute):
+    """
+    Returns the bucket for an API host and rate, creating it on first use. The
+    bucket is shared with other processes through a lock file; if the state
+    directory cannot be written, it falls back to a bucket local to this process.
+    """
+    key = (host, float(rate_per_minute))
+    with _shared_buckets_lock:
+        if key not in _shared_buckets:
+            try:
+                _shared_buckets[key] = SharedTokenBucket(host, rate_per_minute)
+            except OSError as e:
+                print(f"Warning: cannot share the rate limit for {host} between jobs ({e}).", file=sys.stderr)
+                _shared_buckets[key] = TokenBucket(rate_per_minute)
+        return _shared_buckets[key]
@@ -2,6 +2,7 @@
 from flask import Blueprint, render_template, session, request
 from database import query_db, get_user_widget_layout, default_widget_layouts
 from utils import role_required
+from asset_fields import ANTIVIRUS_STATUS_LABELS, PATCH_STATUS_LABELS
 
 assets_bp = Blueprint('assets', __name__)
 
@@ -15,6 +16,8 @@ ASSETS_COLUMNS = {
     'external_ip': {'label': 'External IP', 'default': False},
     'last_user': {'label': 'Last Logged In User', 'default': True},
     'last_seen': {'label': 'Last Seen', 'default': False},
+    'antivirus': {'label': 'Antivirus', 'default': False},
+    'patch_status': {'label': 'Patch Status', 'default': False},
     'status': {'label': 'Status', 'default': True},
     'actions': {'label': 'Actions', 'default': True}
 }
@@ -28,6 +31,8 @@ def assets():
     default_layout = default_widget_layouts.get('assets')
     return render_template('assets.html',
         columns=ASSETS_COLUMNS,
+        antivirus_labels=ANTIVIRUS_STATUS_LABELS,
+        patch_labels=PATCH_STATUS_LABELS,
         visible_columns=session['assets_cols'],
         layout=layout,
         default_layout=default_layout
@@ -41,6 +46,8 @@ def get_assets_partial():
     search_query = request.args.get('search', '')
     sort_by = request.args.get('sort_by', 'hostname')
     sort_order = request.args.get('sort_order', 'asc')
+    antivirus_status = request.args.get('antivirus_status', '')
+    patch_status = request.args.get('patch_status', '')
 
     base_query = """
         FROM assets a
@@ -62,6 +69,14 @@ def get_assets_partial():
         search_param = f'%{search_query}%'
         params.extend([search_param] * 7)
 
+    # Typed, indexed columns filled at sync time (see asset_fields), so no JSON is parsed here
+    if antivirus_status:
+        where_clauses.append("a.antivirus_status = ?")
+        params.append(antivirus_status)
+    if patch_status:
+        where_clauses.append("a.patch_status = ?")
+        params.append(patch_status)
+
     if where_clauses:
         base_query += " WHERE " + " AND ".join(where_clauses)
 
@@ -79,6 +94,8 @@ def get_assets_partial():
         'internal_ip': 'a.internal_ip',
         'external_ip': 'a.external_ip',
         'last_seen': 'a.last_seen',
+        'antivirus': 'a.antivirus_status',
+        'patch_status': 'a.patch_status',
         'associated_contacts': 'linked_contacts.contacts'
     }
     sort_column = allowed_sort_columns.get(sort_by, 'a.hostname')
@@ -103,5 +120,7 @@ def get_assets_partial():
         search_query=search_query,
         sort_by=sort_by,
         sort_order=sort_order,
+        antivirus_labels=ANTIVIRUS_STATUS_LABELS,
+        patch_labels=PATCH_STATUS_LABELS,
         visible_columns=session.get('assets_cols', {k: v['default'] for k, v in ASSETS_COLUMNS.items()})
     )
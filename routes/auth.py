@@ -4,6 +4,7 @@ from database import query_db, get_db_connection, log_and_execute
 from threading import Lock
 from datetime import datetime, timezone, timedelta
 from werkzeug.security import check_password_hash, generate_password_hash
+from sync_state import ensure_sync_tables, ensure_column
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -18,14 +19,32 @@ def login():
         try:
             # Test the password by trying to connect
             with get_db_connection(password_attempt) as con:
+                cur = con.cursor()
+                # Databases created before the sync bookkeeping tables existed get them here
+                ensure_sync_tables(cur)
+                ensure_column(cur, 'scheduler_jobs', 'run_in_subprocess', 'BOOLEAN NOT NULL DEFAULT 0')
+                ensure_column(cur, 'scheduler_jobs', 'depends_on', 'TEXT')
+                ensure_column(cur, 'scheduler_jobs', 'priority', 'INTEGER NOT NULL DEFAULT 0')
+                from scheduler import apply_default_job_graph, ensure_job_runs_table
+                apply_default_job_graph(cur)
+                ensure_job_runs_table(cur)
+                from name_matcher import ensure_alias_table
+                ensure_alias_table(cur)
+                from asset_fields import ensure_asset_fields
+                ensure_asset_fields(cur)
+                from compliance import ensure_compliance_table
+                ensure_compliance_table(cur)
+                from telemetry import ensure_telemetry_tables
+                ensure_telemetry_tables(cur)
                  # Start scheduler only if it's not already running
                 if not scheduler.running:
                     print("--- First successful login. Starting background scheduler. ---")
-                    jobs = con.execute("SELECT id, script_path, interval_minutes FROM scheduler_jobs WHERE enabled = 1").fetchall()
-                    for job in jobs:
-                        from scheduler import run_job
-                        # Use replace_existing=True to avoid errors on app restart in debug mode
-                        scheduler.add_job(run_job, 'interval', minutes=job['interval_minutes'], args=[job['id'], job['script_path'], password_attempt], id=str(job['id']), replace_existing=True, next_run_time=datetime.now() + timedelta(seconds=10))
+                    from scheduler import run_due_jobs, run_refresh_cycle, SCHEDULE_TICK_SECONDS
+                    # The first run of every job is one refresh cycle, ordered by the job dependencies
+                    scheduler.add_job(run_refresh_cycle, args=[password_attempt], id='refresh_cycle', replace_existing=True, next_run_time=datetime.now() + timedelta(seconds=10))
+                    # After that a single tick queues the jobs that are due together, so they keep that order.
+                    # Use replace_existing=True to avoid errors on app restart in debug mode
+                    scheduler.add_job(run_due_jobs, 'interval', seconds=SCHEDULE_TICK_SECONDS, args=[password_attempt], id='due_jobs', replace_existing=True)
                     scheduler.start()
 
             current_app.config['DB_PASSWORD'] = password_attempt
@@ -1,6 +1,6 @@
 # routes/clients.py
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, Response, send_from_directory, current_app
-from database import query_db, log_and_execute, get_user_widget_layout, default_widget_layouts, save_user_widget_layout, delete_user_widget_layout, log_read_action
+from database import get_db, query_db, log_and_execute, get_user_widget_layout, default_widget_layouts, save_user_widget_layout, delete_user_widget_layout, log_read_action
 from billing import get_billing_dashboard_data, get_client_breakdown_data
 from datetime import datetime, timezone, timedelta
 import os
@@ -11,6 +11,8 @@ import zipfile
 from werkzeug.utils import secure_filename
 from collections import defaultdict
 from utils import role_required
+from compliance import STALE_OFFLINE_DAYS
+from telemetry import forecast_backup_overage, monthly_backup_history
 
 clients_bp = Blueprint('clients', __name__)
 
@@ -53,7 +55,19 @@ def billing_dashboard():
         layout = get_user_widget_layout(session['user_id'], 'clients')
         default_layout = default_widget_layouts.get('clients')
 
+        # One precomputed row per client, maintained by pull_datto (see compliance.py)
+        compliance = query_db("""
+            SELECT cc.*, c.name,
+                   cc.av_out_of_date + cc.av_not_running + cc.av_not_detected AS av_issues,
+                   cc.patch_pending + cc.patch_install_error + cc.reboot_pending AS patch_issues
+            FROM client_compliance cc
+            JOIN companies c ON c.account_number = cc.company_account_number
+            ORDER BY av_issues + patch_issues + cc.offline_stale DESC, c.name
+        """)
+
         return render_template('clients.html',
+            compliance=compliance,
+            stale_offline_days=STALE_OFFLINE_DAYS,
             month_options=month_options,
             current_year=today.year,
             current_month=today.month,
@@ -206,6 +220,12 @@ def client_billing_details(account_number):
              month_options.append({'year': today.year if i <= today.month else today.year -1, 'month': i, 'name': datetime(today.year, i, 1).strftime('%B %Y')})
         selected_billing_period = datetime(year, month, 1).strftime('%B %Y')
 
+        # Read from the daily backup rollup kept by pull_datto, not from the assets
+        rates = breakdown_data['effective_rates']
+        telemetry_cur = get_db().cursor()
+        backup_forecast = forecast_backup_overage(telemetry_cur, account_number, rates.get('backup_included_tb', 1), rates.get('backup_per_tb_fee', 0))
+        backup_history = monthly_backup_history(telemetry_cur, account_number)
+
         layout = get_user_widget_layout(session['user_id'], 'client_details')
         default_layout = default_widget_layouts.get('client_details')
 
@@ -228,6 +248,8 @@ def client_billing_details(account_number):
             sort_by=sort_by,
             sort_order=sort_order,
             search_query=search_query,
+            backup_forecast=backup_forecast,
+            backup_history=backup_history,
             layout=layout,
             default_layout=default_layout
         )
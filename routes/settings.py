@@ -1,10 +1,9 @@
 # routes/settings.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
-from database import query_db, log_and_execute, get_user_widget_layout, default_widget_layouts, get_db_connection, save_user_widget_layout, delete_user_widget_layout
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app, Response
+from database import query_db, log_and_execute, get_user_widget_layout, default_widget_layouts, get_db, get_db_connection, save_user_widget_layout, delete_user_widget_layout
 from collections import OrderedDict, defaultdict
 import json
 import re
-import time
 from routes.auth import active_sessions
 # Import column definitions from other blueprints
 from .clients import CLIENTS_COLUMNS
@@ -12,6 +11,7 @@ from .assets import ASSETS_COLUMNS
 from .contacts import CONTACTS_COLUMNS
 from werkzeug.security import generate_password_hash
 from utils import role_required
+from sync_state import DATA_WATERMARKS
 
 
 settings_bp = Blueprint('settings', __name__)
@@ -142,6 +142,12 @@ def billing_settings():
         grouped_plans[plan_name] = grouped_plans_unsorted[plan_name]
 
     scheduler_jobs = query_db("SELECT * FROM scheduler_jobs ORDER BY id")
+    from scheduler import job_state, job_run_trends
+    job_states = {job['id']: job_state(job['id']) for job in scheduler_jobs}
+    job_trends = job_run_trends(get_db())
+    sync_watermarks = [mark for mark in query_db("SELECT * FROM sync_state ORDER BY job_name, resource")
+                       if (mark['job_name'], mark['resource']) in DATA_WATERMARKS]
+    name_aliases = query_db("SELECT * FROM company_name_aliases ORDER BY alias")
     app_users = query_db("SELECT * FROM app_users ORDER BY username")
     custom_links = query_db("SELECT * FROM custom_links ORDER BY link_order")
 
@@ -162,6 +168,10 @@ def billing_settings():
     return render_template('settings.html',
         grouped_plans=grouped_plans,
         scheduler_jobs=scheduler_jobs,
+        job_states=job_states,
+        job_trends=job_trends,
+        sync_watermarks=sync_watermarks,
+        name_aliases=name_aliases,
         app_users=app_users,
         custom_links=custom_links,
         session_timeout_minutes=session_timeout_minutes,
@@ -480,8 +490,14 @@ def add_billing_plan():
 def update_scheduler_job(job_id):
     is_enabled = 1 if 'enabled' in request.form else 0
     interval = int(request.form.get('interval_minutes', 1))
-    log_and_execute("UPDATE scheduler_jobs SET enabled = ?, interval_minutes = ? WHERE id = ?", (is_enabled, interval, job_id))
-    flash(f"Job {job_id} updated. Restart app for changes to take effect.", 'success')
+    run_in_subprocess = 1 if 'run_in_subprocess' in request.form else 0
+    priority = int(request.form.get('priority', 0))
+    depends_on = ','.join(sorted(name.strip() for name in request.form.get('depends_on', '').split(',') if name.strip()))
+    log_and_execute("UPDATE scheduler_jobs SET enabled = ?, interval_minutes = ?, run_in_subprocess = ?, priority = ?, depends_on = ? WHERE id = ?",
+                    (is_enabled, interval, run_in_subprocess, priority, depends_on, job_id))
+    # The scheduler's tick reads the interval and enabled flag, and the queue the rest,
+    # from scheduler_jobs, so nothing else needs to change here.
+    flash(f"Job {job_id} updated. The changes apply from its next run.", 'success')
     return redirect(url_for('settings.billing_settings'))
 
 @settings_bp.route('/scheduler/run_now/<int:job_id>', methods=['POST'])
@@ -492,12 +508,88 @@ def run_now(job_id):
     password = current_app.config.get('DB_PASSWORD')
     job = query_db("SELECT script_path FROM scheduler_jobs WHERE id = ?", [job_id], one=True)
     if job and scheduler.running:
-        scheduler.add_job(run_job, args=[job_id, job['script_path'], password], id=f"manual_run_{job_id}_{time.time()}", misfire_grace_time=None, coalesce=False)
-        flash(f"Job '{job['script_path']}' has been triggered to run now.", 'success')
+        if run_job(job_id, job['script_path'], password, reason='manual'):
+            flash(f"Job '{job['script_path']}' has been queued to run now.", 'success')
+        else:
+            flash(f"Job '{job['script_path']}' is already queued or running.", 'error')
     return redirect(url_for('settings.billing_settings'))
 
+@settings_bp.route('/scheduler/cancel/<int:job_id>', methods=['POST'])
+@role_required(['Admin'])
+def cancel_job(job_id):
+    from scheduler import cancel_job as cancel_running_job
+    if cancel_running_job(job_id):
+        flash(f"Job {job_id} will stop after its current batch.", 'success')
+    else:
+        flash(f"Job {job_id} is not running.", 'error')
+    return redirect(url_for('settings.billing_settings'))
+
+@settings_bp.route('/scheduler/watermark/reset', methods=['POST'])
+@role_required(['Admin'])
+def reset_watermark():
+    job_name = request.form.get('job_name')
+    resource = request.form.get('resource')
+    if (job_name, resource) not in DATA_WATERMARKS:
+        flash(f"'{job_name}' ({resource}) is not a watermark that can be reset.", 'error')
+    else:
+        log_and_execute("DELETE FROM sync_state WHERE job_name = ? AND resource = ?", (job_name, resource))
+        flash(f"Watermark for '{job_name}' ({resource}) has been reset. The next run will re-sync from the beginning.", 'success')
+    return redirect(url_for('settings.billing_settings'))
+
+@settings_bp.route('/scheduler/aliases/add', methods=['POST'])
+@role_required(['Admin'])
+def add_name_alias():
+    alias = request.form.get('alias', '').strip()
+    company_name = request.form.get('company_name', '').strip()
+    if alias and company_name:
+        try:
+            log_and_execute("INSERT INTO company_name_aliases (alias, company_name) VALUES (?, ?)", (alias, company_name))
+            flash(f"Sites containing '{alias}' will be matched to '{company_name}'.", 'success')
+        except Exception as e:
+            flash(f"Could not add alias: {e}", 'error')
+    return redirect(url_for('settings.billing_settings'))
+
+@settings_bp.route('/scheduler/aliases/delete/<int:alias_id>', methods=['POST'])
+@role_required(['Admin'])
+def delete_name_alias(alias_id):
+    log_and_execute("DELETE FROM company_name_aliases WHERE id = ?", (alias_id,))
+    flash("Alias deleted.", 'success')
+    return redirect(url_for('settings.billing_settings'))
+
+@settings_bp.route('/scheduler/log/<int:job_id>/stream')
+@role_required(['Admin'])
+def stream_log(job_id):
+    """Server-Sent Events tail of a running job's log. Ends with an 'end' event when the run finishes."""
+    from scheduler import job_runner
+    run = job_runner.get_run(job_id)
+    try:
+        offset = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        offset = 0
+
+    def events():
+        nonlocal offset
+        if run is None:
+            yield "event: end\ndata: not running\n\n"
+            return
+        while True:
+            finished = run.log.closed
+            text, offset = run.log.read_from(offset)
+            if text:
+                data = ''.join(f"data: {line}\n" for line in text.rstrip('\n').split('\n'))
+                yield f"id: {offset}\n{data}\n"
+            elif finished:
+                yield "event: end\ndata: finished\n\n"
+                return
+            else:
+                yield ": keep-alive\n\n"
+            run.log.wait(offset, timeout=15)
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @settings_bp.route('/scheduler/log/<int:job_id>')
 @role_required(['Admin'])
 def get_log(job_id):
     log_data = query_db("SELECT last_run_log FROM scheduler_jobs WHERE id = ?", [job_id], one=True)
-    return jsonify({'log': log_data['last_run_log'] if log_data and log_data['last_run_log'] else 'No log found.'})
+    from text_compression import read_text
+    return jsonify({'log': read_text(log_data['last_run_log']) if log_data and log_data['last_run_log'] else 'No log found.'})
@@ -1,34 +1,299 @@
-import os
+import heapq
+import itertools
+import math
 import sys
-import subprocess
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from database import get_db_connection
+from text_compression import compression_enabled, compress_text
+from job_runner import JobRunner, JOB_WORKERS, JOB_TIMEOUT_SECONDS
 
-def run_job(job_id, script_path, password):
-    """Runs a sync script as a subprocess and logs the result."""
-    print(f"[{datetime.now()}] SCHEDULER: Running job '{job_id}': {script_path}")
-    log_output, status = "", "Failure"
-    try:
-        python_executable = sys.executable
-        env = os.environ.copy()
-        env['DB_MASTER_PASSWORD'] = password
-        result = subprocess.run(
-            [python_executable, script_path],
-            capture_output=True, text=True, check=False, timeout=7200,
-            encoding='utf-8', errors='replace', env=env
-        )
-        log_output = f"--- STDOUT ---\n{result.stdout}\n\n--- STDERR ---\n{result.stderr}"
-        if result.returncode == 0:
-            status = "Success"
-        print(f"[{datetime.now()}] SCHEDULER: Finished job '{job_id}' with status: {status}")
-    except Exception as e:
-        log_output = f"Scheduler failed to run script: {e}"
-        print(f"[{datetime.now()}] SCHEDULER: FATAL ERROR running job '{job_id}': {e}", file=sys.stderr)
-    finally:
+# Sync jobs run on this pool inside the web server process.
+job_runner = JobRunner()
+
+# At most this many jobs run at once; the rest wait in the queue.
+MAX_CONCURRENT_JOBS = JOB_WORKERS
+
+# How often the scheduler looks for jobs whose interval has passed.
+SCHEDULE_TICK_SECONDS = 60
+
+# Runs kept per job in job_runs, and how many of them the settings page plots.
+JOB_RUN_HISTORY_LIMIT = 500
+JOB_TREND_RUNS = 30
+
+# Dependencies and priorities of the stock jobs, applied to databases created
+# before scheduler_jobs had these columns. A job waits for the jobs it depends on
+# whenever they are queued or running; higher priority jobs are started first.
+DEFAULT_JOB_GRAPH = {
+    'set_account_numbers.py': ('', 50),
+    'pull_freshservice.py': ('set_account_numbers.py', 40),
+    'push_account_nums_to_datto.py': ('pull_freshservice.py,set_account_numbers.py', 30),
+    'pull_ticket_details.py': ('pull_freshservice.py', 30),
+    'pull_datto.py': ('pull_freshservice.py,push_account_nums_to_datto.py', 20),
+}
+
+def apply_default_job_graph(cur):
+    """Fills in the stock dependencies and priorities for jobs that have none."""
+    for script_path, (depends_on, priority) in DEFAULT_JOB_GRAPH.items():
+        cur.execute("UPDATE scheduler_jobs SET depends_on = ?, priority = ? WHERE script_path = ? AND depends_on IS NULL",
+                    (depends_on, priority, script_path))
+
+def parse_dependencies(depends_on):
+    return {name.strip() for name in (depends_on or '').split(',') if name.strip()}
+
+
+class JobQueue:
+    """
+    A priority queue in front of the job runner. A job is never queued or run twice
+    at the same time, waits while any job it depends on is queued or running, and
+    no more than MAX_CONCURRENT_JOBS jobs run at once.
+    """
+
+    def __init__(self, runner, max_concurrent=MAX_CONCURRENT_JOBS):
+        self.runner = runner
+        self.max_concurrent = max_concurrent
+        self.heap = []
+        self.queued = {}
+        self.running = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def enqueue(self, job, password, reason):
+        """Queues a job (a scheduler_jobs row). Returns False if it is already queued or running."""
+        queued = self._add(job, password, reason)
+        self._dispatch()
+        return queued
+
+    def enqueue_all(self, jobs, password, reason):
+        """Queues several jobs before starting any, so their dependencies are all seen."""
+        for job in jobs:
+            self._add(job, password, reason)
+        self._dispatch()
+
+    def _add(self, job, password, reason):
+        with self.lock:
+            if job['id'] in self.queued or job['id'] in self.running:
+                print(f"[{datetime.now()}] SCHEDULER: Job '{job['id']}' is already queued or running; skipping {reason} run.")
+                return False
+            entry = {
+                'id': job['id'],
+                'script_path': job['script_path'],
+                'depends_on': parse_dependencies(job['depends_on']),
+                'isolated': bool(job['run_in_subprocess']),
+                'password': password,
+                'reason': reason,
+            }
+            self.queued[job['id']] = entry
+            heapq.heappush(self.heap, (-(job['priority'] or 0), next(self.counter), job['id']))
+        print(f"[{datetime.now()}] SCHEDULER: Queued job '{job['id']}' ({job['script_path']}, {reason}).")
+        return True
+
+    def dequeue(self, job_id):
+        """Drops a job that is waiting in the queue. Returns True if it was queued."""
+        with self.lock:
+            return self.queued.pop(job_id, None) is not None
+
+    def state(self, job_id):
+        with self.lock:
+            if job_id in self.running:
+                return 'Running'
+            if job_id in self.queued:
+                return 'Queued'
+        return None
+
+    def _blocked(self, entry):
+        busy = {e['script_path'] for e in self.queued.values() if e['id'] != entry['id']}
+        busy |= {e['script_path'] for e in self.running.values()}
+        return entry['depends_on'] & busy
+
+    def _dispatch(self):
+        """Starts every queued job that is free to run, in priority order."""
+        to_start = []
+        with self.lock:
+            waiting = []
+            while self.heap and len(self.running) < self.max_concurrent:
+                item = heapq.heappop(self.heap)
+                entry = self.queued.get(item[2])
+                if entry is None:
+                    continue # Removed from the queue
+                if self._blocked(entry):
+                    waiting.append(item)
+                    continue
+                del self.queued[entry['id']]
+                self.running[entry['id']] = entry
+                to_start.append(entry)
+            if waiting and not self.running and not to_start:
+                # Nothing is running, so the waiting jobs depend on each other. Break the
+                # cycle by starting the highest priority one.
+                item = waiting.pop(0)
+                entry = self.queued.pop(item[2])
+                print(f"[{datetime.now()}] SCHEDULER: Dependency cycle between queued jobs; starting '{entry['id']}' first.", file=sys.stderr)
+                self.running[entry['id']] = entry
+                to_start.append(entry)
+            for item in waiting:
+                heapq.heappush(self.heap, item)
+
+        for entry in to_start:
+            print(f"[{datetime.now()}] SCHEDULER: Running job '{entry['id']}': {entry['script_path']}")
+            run, future = self.runner.submit(entry['id'], entry['script_path'], entry['password'],
+                                             isolated=entry['isolated'], timeout=JOB_TIMEOUT_SECONDS)
+            future.add_done_callback(lambda f, entry=entry, run=run: self._finished(entry, run, f))
+
+    def _finished(self, entry, run, future):
         try:
-            with get_db_connection(password) as con:
-                con.execute("UPDATE scheduler_jobs SET last_run = ?, last_status = ?, last_run_log = ? WHERE id = ?",
-                            (datetime.now().isoformat(timespec='seconds'), status, log_output, job_id))
-                con.commit()
+            status, log_output = future.result()
         except Exception as e:
-            print(f"[{datetime.now()}] SCHEDULER: Failed to log job result to DB: {e}", file=sys.stderr)
+            status, log_output = "Failure", f"Scheduler failed to run script: {e}"
+            print(f"[{datetime.now()}] SCHEDULER: FATAL ERROR running job '{entry['id']}': {e}", file=sys.stderr)
+        print(f"[{datetime.now()}] SCHEDULER: Finished job '{entry['id']}' with status: {status}")
+        record_result(entry['id'], entry['password'], status, log_output, run, entry['reason'])
+        with self.lock:
+            self.running.pop(entry['id'], None)
+        self._dispatch()
+
+
+job_queue = JobQueue(job_runner)
+
+def ensure_job_runs_table(cur):
+    """Creates the job run history table on databases built before it existed."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS job_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            reason TEXT,
+            started_at TEXT NOT NULL,
+            duration_seconds REAL,
+            status TEXT NOT NULL,
+            api_calls INTEGER,
+            rate_limited INTEGER,
+            rows_inserted INTEGER,
+            rows_updated INTEGER,
+            rows_unchanged INTEGER,
+            FOREIGN KEY (job_id) REFERENCES scheduler_jobs (id) ON DELETE CASCADE
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_runs_job_started ON job_runs (job_id, started_at)")
+
+def record_result(job_id, password, status, log_output, run=None, reason=None):
+    """Stores a run's outcome on its job and, with its timings and metrics, in the job_runs history."""
+    try:
+        with get_db_connection(password) as con:
+            if compression_enabled(con.cursor()):
+                log_output = compress_text(log_output)
+            con.execute("UPDATE scheduler_jobs SET last_run = ?, last_status = ?, last_run_log = ? WHERE id = ?",
+                        (datetime.now().isoformat(timespec='seconds'), status, log_output, job_id))
+            if run is not None and run.started_at is not None:
+                metrics = run.metrics.as_dict()
+                con.execute("""
+                    INSERT INTO job_runs (job_id, reason, started_at, duration_seconds, status, api_calls, rate_limited,
+                                          rows_inserted, rows_updated, rows_unchanged)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (job_id, reason, run.started_at.isoformat(timespec='seconds'), run.duration_seconds, status,
+                      metrics['api_calls'], metrics['rate_limited'], metrics['rows_inserted'],
+                      metrics['rows_updated'], metrics['rows_unchanged']))
+                # Keep the history bounded
+                con.execute("""
+                    DELETE FROM job_runs WHERE job_id = ? AND id NOT IN (
+                        SELECT id FROM job_runs WHERE job_id = ? ORDER BY started_at DESC LIMIT ?
+                    )
+                """, (job_id, job_id, JOB_RUN_HISTORY_LIMIT))
+            con.commit()
+    except Exception as e:
+        print(f"[{datetime.now()}] SCHEDULER: Failed to log job result to DB: {e}", file=sys.stderr)
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers, or None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def job_run_trends(con, sample_size=JOB_TREND_RUNS):
+    """
+    Returns {job_id: trend} for the settings page, where a trend holds the durations
+    of the job's last sample_size runs (oldest first), their p95, and the latest run's metrics.
+    """
+    rows = con.execute("""
+        SELECT job_id, started_at, duration_seconds, status, api_calls, rate_limited,
+               rows_inserted, rows_updated, rows_unchanged
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY job_id ORDER BY started_at DESC) AS recency
+            FROM job_runs
+        )
+        WHERE recency <= ?
+        ORDER BY job_id, started_at
+    """, (sample_size,)).fetchall()
+    trends = {}
+    for row in rows:
+        trend = trends.setdefault(row['job_id'], {'durations': [], 'statuses': []})
+        trend['durations'].append(round(row['duration_seconds'] or 0, 1))
+        trend['statuses'].append(row['status'])
+        trend['latest'] = dict(row)
+    for trend in trends.values():
+        trend['p95'] = percentile(trend['durations'], 0.95)
+    return trends
+
+def _load_jobs(password, where, args=()):
+    with get_db_connection(password) as con:
+        return con.execute(f"SELECT id, script_path, interval_minutes, depends_on, priority, run_in_subprocess FROM scheduler_jobs WHERE {where}", args).fetchall()
+
+# When each job was last queued by the schedule (the refresh cycle or run_due_jobs).
+_last_scheduled = {}
+_schedule_lock = threading.Lock()
+
+def due_jobs(jobs, last_scheduled, now):
+    """
+    The jobs whose interval has passed since they were last scheduled. A job not
+    scheduled before (newly enabled) is not due yet; its interval starts now.
+    """
+    due = []
+    for job in jobs:
+        last = last_scheduled.setdefault(job['id'], now)
+        if now - last >= timedelta(minutes=job['interval_minutes']):
+            due.append(job)
+    return due
+
+def run_due_jobs(password):
+    """
+    Called every SCHEDULE_TICK_SECONDS. Queues every enabled job whose interval has
+    passed in one go, like the refresh cycle, so jobs that fall due together run in
+    dependency order. Intervals are read from scheduler_jobs each time, so edited
+    schedules apply without touching the scheduler.
+    """
+    now = datetime.now()
+    jobs = _load_jobs(password, "enabled = 1")
+    with _schedule_lock:
+        due = due_jobs(jobs, _last_scheduled, now)
+        for job in due:
+            _last_scheduled[job['id']] = now
+    if due:
+        job_queue.enqueue_all(due, password, 'scheduled')
+
+def run_job(job_id, script_path, password, reason='manual'):
+    """Queues a job now. Called by the Run Now button; returns False for a duplicate."""
+    jobs = _load_jobs(password, "id = ?", (job_id,))
+    if not jobs:
+        print(f"[{datetime.now()}] SCHEDULER: Job '{job_id}' ({script_path}) no longer exists.", file=sys.stderr)
+        return False
+    return job_queue.enqueue(jobs[0], password, reason)
+
+def run_refresh_cycle(password):
+    """
+    Queues every enabled job at once, so each waits for the jobs it depends on and
+    independent jobs run side by side. The jobs' intervals are counted from here.
+    """
+    jobs = _load_jobs(password, "enabled = 1")
+    with _schedule_lock:
+        now = datetime.now()
+        for job in jobs:
+            _last_scheduled[job['id']] = now
+    job_queue.enqueue_all(jobs, password, 'refresh cycle')
+
+def cancel_job(job_id):
+    """Removes a job from the queue, or asks its active run to stop at its next commit point."""
+    dequeued = job_queue.dequeue(job_id)
+    return job_runner.cancel(job_id) or dequeued
+
+def job_state(job_id):
+    """'Running', 'Queued' or None."""
+    return job_queue.state(job_id)
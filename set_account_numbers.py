@@ -1,10 +1,14 @@
 import requests
 import base64
-import json
 import os
 import sys
-import time
 import random
+from department_cache import get_departments, set_cached_account_number
+from paginator import get_limiter
+from job_runner import check_cancelled
+from job_metrics import reports_metrics, timed_commit
+from sync_state import ensure_sync_tables, load_pushed_values, record_pushed_values
+from bulk_push import Pusher, PushSummary, CREATED, FAILED
 
 try:
     from sqlcipher3 import dbapi2 as sqlite3
@@ -17,9 +21,10 @@ DB_FILE = "brainhair.db"
 FRESHSERVICE_DOMAIN = "integotecllc.freshservice.com"
 BASE_URL = f"https://{FRESHSERVICE_DOMAIN}"
 ACCOUNT_NUMBER_FIELD = "account_number"
-COMPANIES_PER_PAGE = 100
-MAX_RETRIES = 3
-RETRY_DELAY = 5 # seconds
+# New numbers must not collide with existing ones, so only a recently refreshed cache is trusted.
+CACHE_MAX_AGE_HOURS = 1
+PUSH_SERVICE = "freshservice" # Key of this script's rows in pushed_values
+RECORD_BATCH_SIZE = 100 # Pushed numbers recorded per commit
 
 # --- Utility Functions ---
 def get_db_connection(db_path, password):
@@ -47,38 +52,8 @@ def get_freshservice_api_key(db_password):
 
 
 # --- API Functions ---
-def get_all_companies(base_url, headers):
-    """Fetches all companies (departments) from the Freshservice API."""
-    all_companies = []
-    page = 1
-    endpoint = f"{base_url}/api/v2/departments"
-    print(f"Fetching all companies from: {endpoint}")
-
-    while True:
-        params = {'page': page, 'per_page': COMPANIES_PER_PAGE}
-        try:
-            response = requests.get(endpoint, headers=headers, params=params, timeout=30)
-            if response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', RETRY_DELAY))
-                print(f"Rate limit exceeded. Waiting {retry_after} seconds...")
-                time.sleep(retry_after)
-                continue
-            response.raise_for_status()
-            data = response.json()
-            companies_on_page = data.get('departments', [])
-            if not companies_on_page:
-                break
-            all_companies.extend(companies_on_page)
-            if len(companies_on_page) < COMPANIES_PER_PAGE:
-                break
-            page += 1
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching companies: {e}", file=sys.stderr)
-            return None
-    return all_companies
-
-def update_company_account_number(base_url, headers, company_id, account_number):
-    """Updates a single company with a new account number."""
+def update_company_account_number(pusher, base_url, headers, company_id, account_number):
+    """Updates a single company with a new account number. Returns (outcome, previous value)."""
     endpoint = f"{base_url}/api/v2/departments/{company_id}"
 
     payload = {
@@ -87,25 +62,21 @@ def update_company_account_number(base_url, headers, company_id, account_number)
         }
     }
 
-    try:
-        response = requests.put(endpoint, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        return True
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to update company ID {company_id}: {e}", file=sys.stderr)
-        if hasattr(e, 'response'):
-            print(f"Response: {e.response.text}", file=sys.stderr)
-        return False
+    # The pusher shares the Freshservice quota with any sync job running at the same time
+    pusher.send('PUT', endpoint, headers=headers, json=payload)
+    return CREATED, None
 
 # --- Main Execution ---
-if __name__ == "__main__":
+@reports_metrics
+def main(argv=None, password=None):
     print(" Freshservice Account Number Setter")
     print("==========================================")
 
-    DB_MASTER_PASSWORD = os.environ.get('DB_MASTER_PASSWORD')
+    DB_MASTER_PASSWORD = password or os.environ.get('DB_MASTER_PASSWORD')
     if not DB_MASTER_PASSWORD:
         sys.exit("Error: The DB_MASTER_PASSWORD environment variable must be set.")
 
+    base_url = os.environ.get('FRESHSERVICE_BASE_URL') or BASE_URL # e.g. debug/mock_api_server.py
     API_KEY = get_freshservice_api_key(DB_MASTER_PASSWORD)
     auth_str = f"{API_KEY}:X"
     encoded_auth = base64.b64encode(auth_str.encode()).decode()
@@ -114,15 +85,22 @@ if __name__ == "__main__":
         "Authorization": f"Basic {encoded_auth}"
     }
 
-    # 1. Fetch all companies
-    companies = get_all_companies(BASE_URL, headers)
-    if companies is None:
+    # 1. Load all companies from the department cache
+    con = get_db_connection(DB_FILE, DB_MASTER_PASSWORD)
+    cur = con.cursor()
+    try:
+        companies = get_departments(con, base_url, headers, max_age_hours=CACHE_MAX_AGE_HOURS)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching companies: {e}", file=sys.stderr)
         print("Could not fetch companies. Aborting.", file=sys.stderr)
+        con.close()
         sys.exit(1)
 
     print(f"\nFound {len(companies)} total companies in Freshservice.")
 
     # 2. Find existing account numbers and companies that need one
+    ensure_sync_tables(cur)
+    pushed = load_pushed_values(cur, PUSH_SERVICE, ACCOUNT_NUMBER_FIELD)
     existing_numbers = set()
     companies_to_update = []
 
@@ -140,32 +118,49 @@ if __name__ == "__main__":
 
     if not companies_to_update:
         print("\nAll companies already have an account number. Nothing to do.")
+        con.close()
         sys.exit(0)
 
-    # 3. Generate and assign unique numbers
-    print("\n--- Assigning New Account Numbers ---")
-    updated_count = 0
+    # 3. Generate unique numbers. A company that was given a number by an earlier run
+    # (whose PUT went through but never reached the cache) is pushed that number again
+    # instead of a new one, so re-runs do not renumber anybody.
+    recorded = {company['id']: int(pushed[str(company['id'])]) for company in companies_to_update if pushed.get(str(company['id']))}
+    reserved = set(recorded.values())
+    assignments = []
     for company in companies_to_update:
-        new_number = None
-        while new_number is None or new_number in existing_numbers:
-            new_number = random.randint(100000, 999999)
-
-        company_id = company['id']
-        company_name = company['name']
-
-        print(f"Updating '{company_name}' (ID: {company_id}) with new account number: {new_number}")
-
-        # 4. Update the company in Freshservice
-        success = update_company_account_number(BASE_URL, headers, company_id, new_number)
-
-        if success:
-            existing_numbers.add(new_number)
-            updated_count += 1
-            # Be respectful of API rate limits
-            time.sleep(0.5)
-        else:
-            print(f"Skipping '{company_name}' due to update failure.")
+        new_number = recorded.get(company['id'])
+        if new_number is None or new_number in existing_numbers:
+            new_number = None
+            while new_number is None or new_number in existing_numbers or new_number in reserved:
+                new_number = random.randint(100000, 999999)
+        existing_numbers.add(new_number)
+        assignments.append((company, new_number))
+
+    # 4. Update the companies in Freshservice, several at a time
+    print("\n--- Assigning New Account Numbers ---")
+    pusher = Pusher(get_limiter(base_url))
+    summary = PushSummary("Freshservice account numbers")
+    pushed_since_commit = 0
+    try:
+        for result in pusher.run(assignments, lambda item: update_company_account_number(pusher, base_url, headers, item[0]['id'], item[1])):
+            check_cancelled()
+            company, new_number = result.item
+            summary.add(f"{company['name']} (ID: {company['id']})", result, new_number)
+            if result.outcome == FAILED:
+                print(f"Skipping '{company['name']}' due to update failure.", file=sys.stderr)
+                continue
+            set_cached_account_number(cur, company['id'], new_number)
+            record_pushed_values(cur, PUSH_SERVICE, ACCOUNT_NUMBER_FIELD, [(company['id'], new_number)])
+            pushed_since_commit += 1
+            if pushed_since_commit >= RECORD_BATCH_SIZE:
+                timed_commit(con)
+                pushed_since_commit = 0
+    finally:
+        timed_commit(con)
+        con.close()
 
-    print("\n-----------------------------------------")
-    print(f" Successfully updated {updated_count} companies.")
+    summary.print()
     print("\nScript finished.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# sync_state.py
+"""
+Shared bookkeeping for the sync scripts.
+
+A checkpoint records how far an in-flight run got (last page fetched, last item
+written and the watermark the run started from) so that a killed or failed run
+can resume where it stopped instead of starting over.
+
+A watermark is the committed high-water mark of a job for one resource (for
+example the newest ticket updated_at that has been written). It is advanced in
+the same transaction as the rows it covers, so it never runs ahead of the data.
+
+Synced tables carry a row_hash of the values last written from the API, which
+lets upsert_changed_rows skip rows whose content has not changed, and a
+sync_generation stamped on every row a run sees. After a complete run, rows
+with an older generation are gone upstream and can be swept in one statement.
+
+The pushed_values table records the last value written to each item of an
+external service (such as a Datto site variable), so push scripts can skip
+items that are already in the desired state.
+"""
+import hashlib
+import json
+import time
+from datetime import datetime, timezone, timedelta
+
+from job_metrics import record_rows, timed
+from text_compression import compress_text
+
+# Keeps IN (...) lists below SQLite's host parameter limit
+SQL_CHUNK_SIZE = 500
+
+# The watermarks that record how far a job has synced a resource from the API.
+# Only these can be reset from the settings page; the other sync_state rows are
+# the jobs' own bookkeeping (sweep generations, resume and re-verify positions),
+# and resetting them mid-run can do damage, e.g. a new sweep generation makes a
+# resumed pull_datto delete the assets it stamped before it was interrupted.
+DATA_WATERMARKS = {
+    ('pull_freshservice', 'departments'),
+    ('pull_freshservice', 'requesters'),
+    ('pull_ticket_details', 'tickets'),
+}
+
+
+def ensure_sync_tables(cur):
+    """Creates the sync bookkeeping tables on databases built before they existed."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_checkpoints (
+            job_name TEXT PRIMARY KEY,
+            last_page INTEGER,
+            last_item_id TEXT,
+            watermark TEXT,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            job_name TEXT NOT NULL,
+            resource TEXT NOT NULL,
+            watermark TEXT,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (job_name, resource)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pushed_values (
+            service TEXT NOT NULL,
+            field TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            value TEXT,
+            pushed_at TEXT NOT NULL,
+            PRIMARY KEY (service, field, item_id)
+        )
+    """)
+
+
+def ensure_column(cur, table_name, column_name, column_definition):
+    """Adds a column to an existing table if an older schema is missing it."""
+    cur.execute(f"PRAGMA table_info({table_name})")
+    if column_name not in {row[1] for row in cur.fetchall()}:
+        cur.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}")
+
+
+def get_checkpoint(cur, job_name, max_age_hours=None):
+    """
+    Returns the saved checkpoint for a job as a dict, or None if the last run completed.
+    Checkpoints older than max_age_hours are ignored so a long-dead run does not
+    make the next one skip work.
+    """
+    cur.execute("SELECT last_page, last_item_id, watermark, updated_at FROM sync_checkpoints WHERE job_name = ?", (job_name,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    if max_age_hours is not None:
+        saved_at = datetime.fromisoformat(row[3])
+        if datetime.now(timezone.utc) - saved_at > timedelta(hours=max_age_hours):
+            print(f"Ignoring stale checkpoint for '{job_name}' from {row[3]}.")
+            return None
+    return {'last_page': row[0], 'last_item_id': row[1], 'watermark': row[2], 'updated_at': row[3]}
+
+
+def save_checkpoint(cur, job_name, last_page=None, last_item_id=None, watermark=None):
+    """
+    Records the cursor of an in-flight run. The caller commits, so the checkpoint
+    lands in the same transaction as the rows it describes.
+    """
+    cur.execute("""
+        INSERT INTO sync_checkpoints (job_name, last_page, last_item_id, watermark, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(job_name) DO UPDATE SET
+            last_page = excluded.last_page,
+            last_item_id = excluded.last_item_id,
+            watermark = excluded.watermark,
+            updated_at = excluded.updated_at
+    """, (job_name, last_page, None if last_item_id is None else str(last_item_id), watermark,
+          datetime.now(timezone.utc).isoformat(timespec='seconds')))
+
+
+def clear_checkpoint(cur, job_name):
+    """Removes a job's checkpoint once its run has completed."""
+    cur.execute("DELETE FROM sync_checkpoints WHERE job_name = ?", (job_name,))
+
+
+def get_watermark(cur, job_name, resource):
+    """Returns the stored watermark for a job and resource, or None if it has never run (or was reset)."""
+    cur.execute("SELECT watermark FROM sync_state WHERE job_name = ? AND resource = ?", (job_name, resource))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(cur, job_name, resource, watermark):
+    """Advances a watermark. The caller commits together with the rows the watermark covers."""
+    cur.execute("""
+        INSERT INTO sync_state (job_name, resource, watermark, updated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(job_name, resource) DO UPDATE SET
+            watermark = excluded.watermark,
+            updated_at = excluded.updated_at
+    """, (job_name, resource, watermark, datetime.now(timezone.utc).isoformat(timespec='seconds')))
+
+
+def load_pushed_values(cur, service, field):
+    """Returns {item_id: value} for the values last pushed to a field of an external service."""
+    cur.execute("SELECT item_id, value FROM pushed_values WHERE service = ? AND field = ?", (service, field))
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+
+def record_pushed_values(cur, service, field, values):
+    """Records (item_id, value) pairs as pushed. The caller commits."""
+    pushed_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    with timed('db_write_seconds'):
+        cur.executemany("""
+            INSERT INTO pushed_values (service, field, item_id, value, pushed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(service, field, item_id) DO UPDATE SET
+                value = excluded.value,
+                pushed_at = excluded.pushed_at
+        """, [(service, field, str(item_id), str(value), pushed_at) for item_id, value in values])
+
+
+def row_hash(values):
+    """A stable content hash for one row of values."""
+    return hashlib.sha1(json.dumps(list(values), default=str).encode('utf-8')).hexdigest()
+
+
+def load_row_hashes(cur, table_name, key_column, keys):
+    """Returns {key: row_hash} for the given keys that already exist in the table."""
+    hashes = {}
+    keys = list(keys)
+    for start in range(0, len(keys), SQL_CHUNK_SIZE):
+        chunk = keys[start:start + SQL_CHUNK_SIZE]
+        placeholders = ', '.join(['?'] * len(chunk))
+        cur.execute(f"SELECT {key_column}, row_hash FROM {table_name} WHERE {key_column} IN ({placeholders})", chunk)
+        hashes.update({row[0]: row[1] for row in cur.fetchall()})
+    return hashes
+
+
+def upsert_changed_rows(cur, table_name, key_column, columns, rows, update_columns=None, compress_columns=()):
+    """
+    Upserts only the rows that are new or whose content hash differs from the stored
+    one, so unchanged rows cause no page writes. Returns a dict with the number of
+    rows inserted, updated and left unchanged. Values of compress_columns are written
+    compressed (see text_compression); the hash is always of the plain values.
+    """
+    key_index = columns.index(key_column)
+    if update_columns is None:
+        update_columns = [col for col in columns if col != key_column]
+
+    compress_indexes = {columns.index(column) for column in compress_columns}
+    existing = load_row_hashes(cur, table_name, key_column, [row[key_index] for row in rows])
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    to_write = []
+    for row in rows:
+        digest = row_hash(row)
+        stored = existing.get(row[key_index], False)
+        if stored is False:
+            counts['inserted'] += 1
+        elif stored != digest:
+            counts['updated'] += 1
+        else:
+            counts['unchanged'] += 1
+            continue
+        if compress_indexes:
+            row = [compress_text(value) if index in compress_indexes else value for index, value in enumerate(row)]
+        to_write.append(tuple(row) + (digest,))
+
+    if to_write:
+        all_columns = list(columns) + ['row_hash']
+        placeholders = ', '.join(['?'] * len(all_columns))
+        update_setters = ', '.join(f"{col}=excluded.{col}" for col in list(update_columns) + ['row_hash'])
+        with timed('db_write_seconds'):
+            cur.executemany(f"""
+                INSERT INTO {table_name} ({', '.join(all_columns)})
+                VALUES ({placeholders})
+                ON CONFLICT({key_column}) DO UPDATE SET {update_setters}
+            """, to_write)
+    record_rows(counts)
+    return counts
+
+
+def format_counts(counts):
+    return f"{counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged"
+
+
+def start_generation(cur, job_name, resuming=False):
+    """
+    Returns the generation number rows are stamped with during this run. A resumed
+    run keeps the generation of the run it continues; otherwise a new one is stored.
+    """
+    if resuming:
+        existing = get_watermark(cur, job_name, 'sweep_generation')
+        if existing:
+            return int(existing)
+    previous = int(get_watermark(cur, job_name, 'sweep_generation') or 0)
+    generation = max(int(time.time()), previous + 1)
+    set_watermark(cur, job_name, 'sweep_generation', str(generation))
+    return generation
+
+
+def stamp_generation(cur, table_name, key_column, keys, generation):
+    """Marks the rows with the given keys as seen by this run."""
+    keys = list(keys)
+    for start in range(0, len(keys), SQL_CHUNK_SIZE):
+        chunk = keys[start:start + SQL_CHUNK_SIZE]
+        placeholders = ', '.join(['?'] * len(chunk))
+        with timed('db_write_seconds'):
+            cur.execute(f"""
+                UPDATE {table_name} SET sync_generation = ?
+                WHERE {key_column} IN ({placeholders}) AND sync_generation IS NOT ?
+            """, [generation] + chunk + [generation])
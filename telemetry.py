@@ -0,0 +1,177 @@
+# telemetry.py
+"""
+Daily history of the Datto device readings that each sync overwrites.
+
+pull_datto replaces is_online, last_seen and backup_data_bytes on every run, so
+the assets table only knows the latest values. After writing a site, it records a
+sample of every device of that site (and only that site, as a client can have
+several) in asset_telemetry_daily: one row per device
+per UTC day, with integer columns only (day number, epoch seconds, byte counts),
+so later runs on the same day update that row instead of adding more. The same
+step rolls the day up per client into client_backup_daily.
+
+Asset rows are kept for ASSET_HISTORY_DAYS and client rows for
+CLIENT_HISTORY_DAYS. The backup overage forecast reads only the client rollup:
+the least-squares fit over the last days is computed by a single aggregate query.
+"""
+import calendar
+from datetime import datetime, timezone, timedelta
+
+from job_metrics import timed
+from sync_state import SQL_CHUNK_SIZE
+
+ASSET_HISTORY_DAYS = 180
+CLIENT_HISTORY_DAYS = 3 * 365
+FORECAST_WINDOW_DAYS = 30 # Days of history the backup growth is fitted over
+BYTES_PER_TB = 1099511627776.0 # Same unit as the billing calculation
+
+
+def day_number(moment=None):
+    """Days since the Unix epoch of a UTC datetime (now by default)."""
+    moment = moment or datetime.now(timezone.utc)
+    return (moment.date() - datetime(1970, 1, 1).date()).days
+
+
+def day_date(day):
+    """The date of a day number."""
+    return datetime(1970, 1, 1).date() + timedelta(days=day)
+
+
+def ensure_telemetry_tables(cur):
+    """Creates the history tables on databases built before them."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS asset_telemetry_daily (
+            day INTEGER NOT NULL,
+            asset_id INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            online_samples INTEGER NOT NULL,
+            last_seen INTEGER,
+            backup_bytes INTEGER NOT NULL,
+            PRIMARY KEY (day, asset_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS client_backup_daily (
+            company_account_number TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            backup_bytes INTEGER NOT NULL,
+            backed_up_assets INTEGER NOT NULL,
+            assets INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            online_samples INTEGER NOT NULL,
+            PRIMARY KEY (company_account_number, day)
+        ) WITHOUT ROWID
+    """)
+
+
+def record_client_telemetry(cur, account_number, datto_uids, generation, day=None):
+    """
+    Samples the Datto assets of one site (datto_uids) stamped with this sync
+    generation into today's history rows and refreshes the client's rollup for the
+    day from all of its assets. Each device is sampled once per sync even when the
+    client has several sites. The caller commits.
+    """
+    day = day_number() if day is None else day
+    datto_uids = list(datto_uids)
+    with timed('db_write_seconds'):
+        for start in range(0, len(datto_uids), SQL_CHUNK_SIZE):
+            chunk = datto_uids[start:start + SQL_CHUNK_SIZE]
+            placeholders = ', '.join(['?'] * len(chunk))
+            cur.execute(f"""
+                INSERT INTO asset_telemetry_daily (day, asset_id, samples, online_samples, last_seen, backup_bytes)
+                SELECT ?, id, 1, CASE WHEN is_online THEN 1 ELSE 0 END,
+                       CAST(strftime('%s', last_seen) AS INTEGER), COALESCE(backup_data_bytes, 0)
+                FROM assets
+                WHERE company_account_number = ? AND datto_uid IN ({placeholders}) AND sync_generation = ?
+                ON CONFLICT(day, asset_id) DO UPDATE SET
+                    samples = samples + 1,
+                    online_samples = online_samples + excluded.online_samples,
+                    last_seen = excluded.last_seen,
+                    backup_bytes = excluded.backup_bytes
+            """, [day, account_number] + chunk + [generation])
+        cur.execute("""
+            INSERT INTO client_backup_daily (company_account_number, day, backup_bytes, backed_up_assets, assets, samples, online_samples)
+            SELECT a.company_account_number, t.day, SUM(t.backup_bytes), SUM(CASE WHEN t.backup_bytes > 0 THEN 1 ELSE 0 END),
+                   COUNT(*), SUM(t.samples), SUM(t.online_samples)
+            FROM assets a JOIN asset_telemetry_daily t ON t.day = ? AND t.asset_id = a.id
+            WHERE a.company_account_number = ? AND a.datto_uid IS NOT NULL
+            GROUP BY a.company_account_number, t.day
+            ON CONFLICT(company_account_number, day) DO UPDATE SET
+                backup_bytes = excluded.backup_bytes,
+                backed_up_assets = excluded.backed_up_assets,
+                assets = excluded.assets,
+                samples = excluded.samples,
+                online_samples = excluded.online_samples
+        """, (day, account_number))
+
+
+def prune_telemetry(cur, today=None):
+    """Deletes history older than the retention periods. Returns (asset rows, client rows) removed."""
+    today = day_number() if today is None else today
+    cur.execute("DELETE FROM asset_telemetry_daily WHERE day < ?", (today - ASSET_HISTORY_DAYS,))
+    asset_rows = cur.rowcount
+    cur.execute("DELETE FROM client_backup_daily WHERE day < ?", (today - CLIENT_HISTORY_DAYS,))
+    return asset_rows, cur.rowcount
+
+
+def monthly_backup_history(cur, account_number, months=12):
+    """
+    The client's backup size per month, oldest first: the last reading of each month
+    in TB, with the number of backed-up devices on that day.
+    """
+    since = day_number() - months * 31
+    cur.execute("""
+        SELECT day, backup_bytes, backed_up_assets FROM client_backup_daily
+        WHERE company_account_number = ? AND day IN (
+            SELECT MAX(day) FROM client_backup_daily
+            WHERE company_account_number = ? AND day >= ?
+            GROUP BY strftime('%Y-%m', day * 86400, 'unixepoch'))
+        ORDER BY day
+    """, (account_number, account_number, since))
+    return [{'month': day_date(day).strftime('%B %Y'), 'backup_tb': backup_bytes / BYTES_PER_TB, 'backed_up_assets': backed_up_assets}
+            for day, backup_bytes, backed_up_assets in cur.fetchall()][-months:]
+
+
+def forecast_backup_overage(cur, account_number, included_tb_per_device, per_tb_fee, window_days=FORECAST_WINDOW_DAYS):
+    """
+    Projects the client's backup size to the end of the current month from a
+    least-squares line through its daily rollup rows, and prices the projected
+    overage the way the billing calculation does. Returns None with fewer than two
+    days of history.
+    """
+    today = day_number()
+    # x is the day relative to today, so the sums stay small; everything is aggregated in SQL.
+    cur.execute("""
+        SELECT COUNT(*), SUM(day - :today), SUM((day - :today) * (day - :today)),
+               SUM(backup_bytes * 1.0), SUM((day - :today) * backup_bytes * 1.0), MIN(day), MAX(day)
+        FROM client_backup_daily
+        WHERE company_account_number = :account_number AND day > :today - :window_days
+    """, {'today': today, 'account_number': account_number, 'window_days': window_days})
+    n, sum_x, sum_xx, sum_y, sum_xy, first_day, last_day = cur.fetchone()
+    if not n or n < 2:
+        return None
+    cur.execute("SELECT backup_bytes, backed_up_assets FROM client_backup_daily WHERE company_account_number = ? AND day = ?",
+                (account_number, last_day))
+    latest_bytes, backed_up_assets = cur.fetchone()
+
+    denominator = n * sum_xx - sum_x * sum_x
+    slope = (n * sum_xy - sum_x * sum_y) / denominator if denominator else 0.0
+    intercept = (sum_y - slope * sum_x) / n
+
+    now = datetime.now(timezone.utc)
+    month_end = now.replace(day=calendar.monthrange(now.year, now.month)[1]).date()
+    days_ahead = (month_end - day_date(today)).days
+    projected_tb = max(0.0, intercept + slope * days_ahead) / BYTES_PER_TB
+    included_tb = backed_up_assets * float(included_tb_per_device or 1)
+    projected_overage_tb = max(0.0, projected_tb - included_tb)
+    return {
+        'history_days': n,
+        'since': day_date(first_day),
+        'current_tb': latest_bytes / BYTES_PER_TB,
+        'growth_tb_per_month': slope * 30 / BYTES_PER_TB,
+        'forecast_date': month_end,
+        'projected_tb': projected_tb,
+        'included_tb': included_tb,
+        'projected_overage_tb': projected_overage_tb,
+        'projected_overage_charge': projected_overage_tb * float(per_tb_fee or 0),
+    }
@@ -0,0 +1,52 @@
+# tests/conftest.py
+"""
+Shared fixtures. The modules under test take a DB-API cursor or connection, so the
+tests run them against an in-memory SQLite database instead of the encrypted one.
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def con():
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def cur(con):
+    return con.cursor()
+
+
+@pytest.fixture
+def assets_table(cur):
+    """The assets columns that the rollups read, with a helper to add Datto devices."""
+    cur.execute("""
+        CREATE TABLE assets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            company_account_number TEXT,
+            datto_uid TEXT UNIQUE,
+            is_online BOOLEAN,
+            last_seen TEXT,
+            backup_data_bytes INTEGER,
+            sync_generation INTEGER,
+            antivirus_status TEXT,
+            patch_status TEXT,
+            reboot_required BOOLEAN
+        )
+    """)
+
+    def add_asset(account_number, datto_uid, **values):
+        columns = ['company_account_number', 'datto_uid'] + list(values)
+        cur.execute(f"INSERT INTO assets ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+                    [account_number, datto_uid] + list(values.values()))
+        return cur.lastrowid
+
+    return add_asset
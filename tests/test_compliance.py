@@ -0,0 +1,45 @@
+from datetime import datetime, timezone, timedelta
+
+from compliance import ensure_compliance_table, refresh_client_compliance, refresh_all_compliance
+
+
+def compliance_row(cur, account_number):
+    cur.execute("SELECT * FROM client_compliance WHERE company_account_number = ?", (account_number,))
+    return cur.fetchone()
+
+
+def test_counts_per_client(cur, assets_table):
+    long_ago = (datetime.now(timezone.utc) - timedelta(days=60)).isoformat()
+    recently = datetime.now(timezone.utc).isoformat()
+    assets_table('100', 'a', antivirus_status='RunningAndUpToDate', patch_status='FullyPatched', is_online=1, last_seen=recently)
+    assets_table('100', 'b', antivirus_status=None, patch_status='RebootRequired', is_online=0, last_seen=long_ago)
+    assets_table('100', 'c', antivirus_status='NotRunning', patch_status=None, reboot_required=1, is_online=0, last_seen=recently)
+    assets_table('100', None, antivirus_status='NotRunning') # Not a Datto device
+    assets_table('200', 'd', antivirus_status='NotRunning', patch_status='InstallError')
+    ensure_compliance_table(cur)
+
+    row = compliance_row(cur, '100')
+    assert row['total_assets'] == 3
+    assert (row['av_up_to_date'], row['av_not_detected'], row['av_not_running']) == (1, 1, 1)
+    assert (row['patch_fully_patched'], row['patch_no_data']) == (1, 1)
+    assert row['reboot_pending'] == 2
+    assert row['offline_stale'] == 1
+    assert compliance_row(cur, '200')['patch_install_error'] == 1
+
+
+def test_client_without_datto_assets_loses_its_row(cur, assets_table):
+    assets_table('100', 'a', patch_status='FullyPatched')
+    ensure_compliance_table(cur)
+    cur.execute("DELETE FROM assets")
+    refresh_client_compliance(cur, ['100'])
+    assert compliance_row(cur, '100') is None
+
+
+def test_refresh_all_also_drops_clients_that_are_gone(cur, assets_table):
+    assets_table('100', 'a')
+    assets_table('200', 'b')
+    ensure_compliance_table(cur)
+    cur.execute("DELETE FROM assets WHERE company_account_number = '200'")
+    assert refresh_all_compliance(cur) == 1
+    cur.execute("SELECT company_account_number FROM client_compliance")
+    assert [row[0] for row in cur.fetchall()] == ['100']
@@ -0,0 +1,60 @@
+import threading
+
+from job_log import RingLog
+
+
+def test_lines_are_read_back_from_an_offset(tmp_path):
+    log = RingLog('run', log_dir=str(tmp_path))
+    log.write_line('first')
+    text, offset = log.read_from(0)
+    assert text == 'first\n' and offset == len('first\n')
+    log.write_line('second\n')
+    assert log.read_from(offset) == ('second\n', offset + len('second\n'))
+    log.close()
+
+
+def test_rotation_keeps_the_most_recent_output(tmp_path):
+    log = RingLog('run', max_bytes=40, log_dir=str(tmp_path))
+    for i in range(10):
+        log.write_line(f"line {i}")
+    text, offset = log.read_from(0)
+    lines = text.splitlines()
+    assert lines[-1] == 'line 9'
+    assert 'line 0' not in lines
+    assert offset == 10 * len('line 0\n')
+    assert len(text.encode()) <= 40
+    log.close()
+
+
+def test_reading_from_an_offset_that_rotated_out_skips_ahead(tmp_path):
+    log = RingLog('run', max_bytes=20, log_dir=str(tmp_path))
+    log.write_line('aaaaaaa')
+    for i in range(5):
+        log.write_line(f"line {i}")
+    text, _ = log.read_from(1)
+    assert text.splitlines()[-1] == 'line 4'
+    assert not text.startswith('aaaaaa')
+    log.close()
+
+
+def test_close_stops_writes_and_wakes_waiters(tmp_path):
+    log = RingLog('run', log_dir=str(tmp_path))
+    woke = threading.Event()
+    waiter = threading.Thread(target=lambda: (log.wait(0, timeout=5), woke.set()))
+    waiter.start()
+    log.close()
+    waiter.join(timeout=5)
+    assert woke.is_set()
+    log.write_line('after close')
+    assert log.read_from(0) == ('', 0)
+
+
+def test_a_new_run_starts_with_an_empty_log(tmp_path):
+    first = RingLog('run', max_bytes=20, log_dir=str(tmp_path))
+    for i in range(5):
+        first.write_line(f"line {i}")
+    first.close()
+    second = RingLog('run', max_bytes=20, log_dir=str(tmp_path))
+    assert second.read_from(0) == ('', 0)
+    assert not (tmp_path / 'run.log.1').exists()
+    second.close()
@@ -0,0 +1,43 @@
+from name_matcher import NameMatcher, CompanyMatcher, ensure_alias_table, load_aliases, DEFAULT_NAME_ALIASES
+
+
+def test_longest_name_wins():
+    matcher = NameMatcher(['A', 'A-1 Movers', 'Movers'])
+    assert matcher.longest_match('A-1 Movers - Main Office') == 'A-1 Movers'
+    assert matcher.longest_match('Just A site') == 'A'
+
+
+def test_match_anywhere_in_the_text_and_through_failure_links():
+    matcher = NameMatcher(['he', 'she', 'hers', 'his'])
+    assert matcher.longest_match('ushers') == 'hers'
+    assert matcher.longest_match('this') == 'his'
+
+
+def test_no_match_and_empty_names():
+    matcher = NameMatcher(['', 'Acme'])
+    assert matcher.longest_match('Globex HQ') is None
+    assert NameMatcher([]).longest_match('anything') is None
+
+
+def test_earliest_name_wins_a_tie():
+    matcher = NameMatcher(['Beta', 'Acme'])
+    assert matcher.longest_match('Acme Beta') == 'Beta'
+
+
+def test_alias_wins_over_company_name():
+    matcher = CompanyMatcher(['Redbarn', 'Acme'], [('Redbarn', 'Redbarn Cannabis')])
+    assert matcher.match('Redbarn - Store 2') == 'Redbarn Cannabis'
+    assert matcher.match('Acme Main') == 'Acme'
+    assert matcher.match('Unknown') is None
+
+
+def test_first_duplicate_alias_wins():
+    matcher = CompanyMatcher([], [('Shop', 'First'), ('Shop', 'Second')])
+    assert matcher.match('The Shop') == 'First'
+
+
+def test_alias_table_is_created_once_with_the_defaults(cur):
+    ensure_alias_table(cur)
+    cur.execute("INSERT INTO company_name_aliases (alias, company_name) VALUES ('Kw', 'Company')")
+    ensure_alias_table(cur)
+    assert load_aliases(cur) == DEFAULT_NAME_ALIASES + [('Kw', 'Company')]
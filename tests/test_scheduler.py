@@ -0,0 +1,116 @@
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('flask') # scheduler reaches the database module, which uses Flask's request context
+
+import scheduler
+from scheduler import JobQueue, percentile, job_run_trends, ensure_job_runs_table, due_jobs
+
+
+class FakeRunner:
+    """Records submitted jobs and lets the test finish them."""
+
+    def __init__(self):
+        self.futures = {}
+        self.started = []
+
+    def submit(self, job_id, script_path, password, isolated=False, timeout=None):
+        future = Future()
+        self.futures[job_id] = future
+        self.started.append(job_id)
+        return None, future
+
+    def finish(self, job_id):
+        self.futures[job_id].set_result(('Success', ''))
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    monkeypatch.setattr(scheduler, 'record_result', lambda *args, **kwargs: None)
+    return FakeRunner()
+
+
+def job(job_id, depends_on='', priority=0):
+    return {'id': job_id, 'script_path': f"job{job_id}.py", 'depends_on': depends_on,
+            'priority': priority, 'run_in_subprocess': 0}
+
+
+def test_job_waits_for_its_dependencies(runner):
+    queue = JobQueue(runner, max_concurrent=3)
+    queue.enqueue_all([job(2, depends_on='job1.py'), job(1)], 'pw', 'scheduled')
+    assert runner.started == [1]
+    assert queue.state(2) == 'Queued'
+    runner.finish(1)
+    assert runner.started == [1, 2]
+    assert queue.state(1) is None and queue.state(2) == 'Running'
+
+
+def test_queued_or_running_job_is_not_added_twice(runner):
+    queue = JobQueue(runner, max_concurrent=1)
+    assert queue.enqueue(job(1), 'pw', 'manual')
+    assert queue.enqueue(job(2), 'pw', 'manual')
+    assert not queue.enqueue(job(1), 'pw', 'manual')
+    assert not queue.enqueue(job(2), 'pw', 'manual')
+    runner.finish(1)
+    runner.finish(2)
+    assert runner.started == [1, 2]
+    assert queue.enqueue(job(1), 'pw', 'manual')
+
+
+def test_concurrency_limit_and_priority(runner):
+    queue = JobQueue(runner, max_concurrent=2)
+    queue.enqueue_all([job(1, priority=10), job(2, priority=30), job(3, priority=20)], 'pw', 'scheduled')
+    assert runner.started == [2, 3]
+    runner.finish(2)
+    assert runner.started == [2, 3, 1]
+
+
+def test_dependency_cycle_is_broken_by_priority(runner):
+    queue = JobQueue(runner, max_concurrent=3)
+    queue.enqueue_all([job(1, depends_on='job2.py', priority=10), job(2, depends_on='job1.py', priority=20)], 'pw', 'scheduled')
+    assert runner.started == [2]
+    runner.finish(2)
+    assert runner.started == [2, 1]
+
+
+def test_dequeued_job_is_never_started(runner):
+    queue = JobQueue(runner, max_concurrent=1)
+    queue.enqueue_all([job(1), job(2)], 'pw', 'manual')
+    assert queue.dequeue(2)
+    runner.finish(1)
+    assert runner.started == [1]
+
+
+def test_percentile():
+    assert percentile([], 0.95) is None
+    assert percentile([5], 0.95) == 5
+    assert percentile(list(range(1, 101)), 0.95) == 95
+    assert percentile([3, 1, 2], 0.5) == 2
+
+
+def test_job_run_trends_keeps_the_latest_runs_oldest_first(con):
+    cur = con.cursor()
+    cur.execute("CREATE TABLE scheduler_jobs (id INTEGER PRIMARY KEY)")
+    ensure_job_runs_table(cur)
+    start = datetime(2025, 1, 1)
+    for job_id in (1, 2):
+        for i in range(5):
+            cur.execute("INSERT INTO job_runs (job_id, started_at, duration_seconds, status, api_calls) VALUES (?, ?, ?, ?, ?)",
+                        (job_id, (start + timedelta(hours=i)).isoformat(), 10.0 * job_id + i, 'Success', i))
+    trends = job_run_trends(con, sample_size=3)
+    assert trends[1]['durations'] == [12.0, 13.0, 14.0]
+    assert trends[1]['p95'] == 14.0
+    assert trends[2]['durations'] == [22.0, 23.0, 24.0]
+    assert trends[2]['latest']['api_calls'] == 4
+
+
+def test_due_jobs_start_their_interval_when_first_seen():
+    now = datetime(2025, 1, 1, 12, 0)
+    jobs = [{'id': 1, 'interval_minutes': 60}, {'id': 2, 'interval_minutes': 30}]
+    last_scheduled = {1: now - timedelta(minutes=60)}
+    assert [j['id'] for j in due_jobs(jobs, last_scheduled, now)] == [1]
+    assert last_scheduled[2] == now
+    last_scheduled[1] = now # run_due_jobs records the jobs it queues
+    assert [j['id'] for j in due_jobs(jobs, last_scheduled, now + timedelta(minutes=30))] == [2]
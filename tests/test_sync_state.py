@@ -0,0 +1,91 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from sync_state import (ensure_sync_tables, ensure_column, get_checkpoint, save_checkpoint, clear_checkpoint,
+                        get_watermark, set_watermark, load_pushed_values, record_pushed_values, row_hash,
+                        upsert_changed_rows, start_generation, stamp_generation, SQL_CHUNK_SIZE)
+
+
+@pytest.fixture
+def sync_cur(cur):
+    ensure_sync_tables(cur)
+    return cur
+
+
+def test_checkpoint_round_trip_and_clear(sync_cur):
+    assert get_checkpoint(sync_cur, 'job') is None
+    save_checkpoint(sync_cur, 'job', last_page=3, last_item_id='abc', watermark='2025-01-01T00:00:00Z')
+    checkpoint = get_checkpoint(sync_cur, 'job')
+    assert (checkpoint['last_page'], checkpoint['last_item_id'], checkpoint['watermark']) == (3, 'abc', '2025-01-01T00:00:00Z')
+    clear_checkpoint(sync_cur, 'job')
+    assert get_checkpoint(sync_cur, 'job') is None
+
+
+def test_stale_checkpoint_is_ignored(sync_cur):
+    save_checkpoint(sync_cur, 'job', last_item_id='abc')
+    old = (datetime.now(timezone.utc) - timedelta(hours=13)).isoformat(timespec='seconds')
+    sync_cur.execute("UPDATE sync_checkpoints SET updated_at = ? WHERE job_name = 'job'", (old,))
+    assert get_checkpoint(sync_cur, 'job', max_age_hours=12) is None
+    assert get_checkpoint(sync_cur, 'job', max_age_hours=24)['last_item_id'] == 'abc'
+
+
+def test_watermarks_are_per_job_and_resource(sync_cur):
+    set_watermark(sync_cur, 'job', 'tickets', '1')
+    set_watermark(sync_cur, 'job', 'tickets', '2')
+    set_watermark(sync_cur, 'other', 'tickets', '9')
+    assert get_watermark(sync_cur, 'job', 'tickets') == '2'
+    assert get_watermark(sync_cur, 'job', 'requesters') is None
+
+
+def test_pushed_values_are_overwritten_and_stored_as_text(sync_cur):
+    record_pushed_values(sync_cur, 'datto', 'AccountNumber', [(1, 100), ('2', '200')])
+    record_pushed_values(sync_cur, 'datto', 'AccountNumber', [(1, 101)])
+    assert load_pushed_values(sync_cur, 'datto', 'AccountNumber') == {'1': '101', '2': '200'}
+    assert load_pushed_values(sync_cur, 'freshservice', 'AccountNumber') == {}
+
+
+def test_ensure_column_is_idempotent(cur):
+    cur.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+    ensure_column(cur, 't', 'extra', 'TEXT')
+    ensure_column(cur, 't', 'extra', 'TEXT')
+    cur.execute("PRAGMA table_info(t)")
+    assert [row[1] for row in cur.fetchall()] == ['id', 'extra']
+
+
+def test_row_hash_depends_on_values_and_order():
+    assert row_hash([1, 'a', None]) == row_hash((1, 'a', None))
+    assert row_hash([1, 'a']) != row_hash(['a', 1])
+
+
+def test_upsert_changed_rows_counts_and_skips_unchanged(cur):
+    cur.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, row_hash TEXT)")
+    assert upsert_changed_rows(cur, 'items', 'id', ['id', 'name'], [(1, 'a'), (2, 'b')]) == {'inserted': 2, 'updated': 0, 'unchanged': 0}
+    assert upsert_changed_rows(cur, 'items', 'id', ['id', 'name'], [(1, 'a'), (2, 'c'), (3, 'd')]) == {'inserted': 1, 'updated': 1, 'unchanged': 1}
+    cur.execute("SELECT id, name FROM items ORDER BY id")
+    assert [tuple(row) for row in cur.fetchall()] == [(1, 'a'), (2, 'c'), (3, 'd')]
+
+
+def test_upsert_changed_rows_compresses_but_hashes_plain_values(cur):
+    cur.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, body TEXT, row_hash TEXT)")
+    body = 'x' * 1000
+    upsert_changed_rows(cur, 'items', 'id', ['id', 'body'], [(1, body)], compress_columns=['body'])
+    cur.execute("SELECT body, row_hash FROM items")
+    stored, digest = cur.fetchone()
+    assert isinstance(stored, bytes) and digest == row_hash((1, body))
+    assert upsert_changed_rows(cur, 'items', 'id', ['id', 'body'], [(1, body)], compress_columns=['body'])['unchanged'] == 1
+
+
+def test_generation_advances_and_resumed_runs_keep_it(sync_cur):
+    first = start_generation(sync_cur, 'job')
+    assert start_generation(sync_cur, 'job', resuming=True) == first
+    assert start_generation(sync_cur, 'job') > first
+
+
+def test_stamp_generation_handles_more_keys_than_one_chunk(cur):
+    cur.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, sync_generation INTEGER)")
+    count = SQL_CHUNK_SIZE * 2 + 1
+    cur.executemany("INSERT INTO items (id) VALUES (?)", [(i,) for i in range(count + 5)])
+    stamp_generation(cur, 'items', 'id', range(count), 7)
+    cur.execute("SELECT COUNT(*) FROM items WHERE sync_generation = 7")
+    assert cur.fetchone()[0] == count
@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from telemetry import (ensure_telemetry_tables, record_client_telemetry, prune_telemetry, monthly_backup_history,
+                       forecast_backup_overage, day_number, BYTES_PER_TB, ASSET_HISTORY_DAYS)
+
+
+@pytest.fixture
+def telemetry_cur(cur, assets_table):
+    ensure_telemetry_tables(cur)
+    return cur
+
+
+def client_day(cur, account_number, day):
+    cur.execute("SELECT * FROM client_backup_daily WHERE company_account_number = ? AND day = ?", (account_number, day))
+    return cur.fetchone()
+
+
+def test_each_device_is_sampled_once_across_sites(telemetry_cur, assets_table):
+    cur = telemetry_cur
+    last_seen = datetime(2025, 1, 1, tzinfo=timezone.utc).isoformat()
+    assets_table('100', 'a', is_online=1, backup_data_bytes=100, sync_generation=1, last_seen=last_seen)
+    assets_table('100', 'b', is_online=0, backup_data_bytes=0, sync_generation=1)
+    assets_table('100', 'c', is_online=1, backup_data_bytes=50, sync_generation=1)
+    record_client_telemetry(cur, '100', ['a', 'b'], 1, day=10) # First site of the client
+    record_client_telemetry(cur, '100', ['c'], 1, day=10) # Second site
+    cur.execute("SELECT samples FROM asset_telemetry_daily WHERE day = 10")
+    assert [row[0] for row in cur.fetchall()] == [1, 1, 1]
+    row = client_day(cur, '100', 10)
+    assert (row['backup_bytes'], row['backed_up_assets'], row['assets']) == (150, 2, 3)
+    assert (row['samples'], row['online_samples']) == (3, 2)
+    cur.execute("SELECT last_seen FROM asset_telemetry_daily WHERE asset_id = 1")
+    assert cur.fetchone()[0] == int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+def test_later_syncs_on_the_same_day_update_the_row(telemetry_cur, assets_table):
+    cur = telemetry_cur
+    assets_table('100', 'a', is_online=1, backup_data_bytes=100, sync_generation=1)
+    record_client_telemetry(cur, '100', ['a'], 1, day=10)
+    cur.execute("UPDATE assets SET is_online = 0, backup_data_bytes = 120, sync_generation = 2")
+    record_client_telemetry(cur, '100', ['a'], 2, day=10)
+    record_client_telemetry(cur, '100', ['a'], 1, day=10) # Stale generation: not sampled
+    cur.execute("SELECT samples, online_samples, backup_bytes FROM asset_telemetry_daily")
+    assert tuple(cur.fetchone()) == (2, 1, 120)
+
+
+def test_prune_keeps_the_retention_window(telemetry_cur):
+    cur = telemetry_cur
+    today = 20000
+    for day in (today - ASSET_HISTORY_DAYS - 1, today - ASSET_HISTORY_DAYS, today):
+        cur.execute("INSERT INTO asset_telemetry_daily VALUES (?, 1, 1, 1, NULL, 0)", (day,))
+        cur.execute("INSERT INTO client_backup_daily VALUES ('100', ?, 0, 0, 1, 1, 1)", (day,))
+    assert prune_telemetry(cur, today=today) == (1, 0)
+
+
+def add_client_days(cur, account_number, readings):
+    today = day_number()
+    for days_ago, backup_bytes in readings:
+        cur.execute("INSERT INTO client_backup_daily VALUES (?, ?, ?, 2, 2, 1, 1)", (account_number, today - days_ago, backup_bytes))
+
+
+def test_monthly_history_takes_the_last_reading_of_each_month(telemetry_cur):
+    cur = telemetry_cur
+    add_client_days(cur, '100', [(0, BYTES_PER_TB)])
+    today = day_number()
+    first_of_month = today - (datetime.now(timezone.utc).day - 1)
+    cur.execute("INSERT INTO client_backup_daily VALUES ('100', ?, ?, 1, 1, 1, 1)", (first_of_month - 1, 0))
+    history = monthly_backup_history(cur, '100')
+    assert len(history) == 2
+    assert history[-1]['backup_tb'] == 1.0 and history[-1]['backed_up_assets'] == 2
+
+
+def test_forecast_needs_two_days(telemetry_cur):
+    cur = telemetry_cur
+    assert forecast_backup_overage(cur, '100', 1, 10) is None
+    add_client_days(cur, '100', [(0, BYTES_PER_TB)])
+    assert forecast_backup_overage(cur, '100', 1, 10) is None
+
+
+def test_forecast_projects_growth_and_prices_the_overage(telemetry_cur):
+    cur = telemetry_cur
+    # 0.1 TB a day, reaching 3 TB today, with 2 devices at 1 TB included each
+    add_client_days(cur, '100', [(days_ago, int((3 - 0.1 * days_ago) * BYTES_PER_TB)) for days_ago in range(10)])
+    forecast = forecast_backup_overage(cur, '100', 1, 10)
+    days_ahead = (forecast['forecast_date'] - datetime.now(timezone.utc).date()).days
+    assert forecast['history_days'] == 10
+    assert forecast['growth_tb_per_month'] == pytest.approx(3.0)
+    assert forecast['current_tb'] == pytest.approx(3.0)
+    assert forecast['projected_tb'] == pytest.approx(3 + 0.1 * days_ahead)
+    assert forecast['included_tb'] == 2.0
+    assert forecast['projected_overage_charge'] == pytest.approx((1 + 0.1 * days_ahead) * 10)
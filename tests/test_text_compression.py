@@ -0,0 +1,32 @@
+from text_compression import compress_text, read_text, compression_enabled, ZLIB_MARKER, MIN_COMPRESS_BYTES
+
+
+def test_long_text_round_trips_compressed():
+    text = 'Processing site ...\n' * 100
+    stored = compress_text(text)
+    assert isinstance(stored, bytes) and stored.startswith(ZLIB_MARKER)
+    assert read_text(stored) == text
+    assert read_text(memoryview(stored)) == text
+
+
+def test_short_and_incompressible_values_are_left_alone():
+    assert compress_text('short') == 'short'
+    assert compress_text(None) is None
+    assert compress_text(42) == 42
+    noise = ''.join(chr(0x4e00 + (i * 7919) % 20000) for i in range(MIN_COMPRESS_BYTES))
+    assert read_text(compress_text(noise)) == noise
+
+
+def test_plain_values_read_as_they_are():
+    assert read_text('text') == 'text'
+    assert read_text(None) is None
+    assert read_text(b'plain bytes') == 'plain bytes'
+
+
+def test_compression_setting(cur):
+    cur.execute("CREATE TABLE app_settings (key TEXT PRIMARY KEY, value TEXT)")
+    assert not compression_enabled(cur)
+    cur.execute("INSERT INTO app_settings VALUES ('compress_text_columns', '1')")
+    assert compression_enabled(cur)
+    cur.execute("UPDATE app_settings SET value = '0'")
+    assert not compression_enabled(cur)
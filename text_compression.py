@@ -0,0 +1,51 @@
+# text_compression.py
+"""
+Opt-in compressed storage for large text columns.
+
+The sync output kept in scheduler_jobs.last_run_log and the Datto JSON kept for
+every asset (udf_data, antivirus_data, patch_management_data) are large and
+rarely read, yet every page of them is encrypted and decrypted by SQLCipher.
+Once compression is switched on (by compress_text_columns.py), these values are
+written as a BLOB of one marker byte followed by the compressed text. Plain text
+values are left as they are, so old and new rows can be mixed freely, and a value
+is only decompressed by read_text() where it is actually used.
+"""
+import zlib
+
+ZLIB_MARKER = b'\x01' # First byte of a zlib-compressed value; other formats can get their own marker
+ZLIB_LEVEL = 6
+MIN_COMPRESS_BYTES = 256 # Shorter values are not worth it
+COMPRESSION_SETTING = 'compress_text_columns'
+
+# (table, key column, column) of every column stored this way
+COMPRESSED_COLUMNS = [
+    ('scheduler_jobs', 'id', 'last_run_log'),
+    ('assets', 'id', 'udf_data'),
+    ('assets', 'id', 'antivirus_data'),
+    ('assets', 'id', 'patch_management_data'),
+]
+
+
+def compress_text(text):
+    """Returns the compressed form of a text value, or the value itself if it is short or does not shrink."""
+    if not isinstance(text, str) or len(text) < MIN_COMPRESS_BYTES:
+        return text
+    compressed = ZLIB_MARKER + zlib.compress(text.encode('utf-8'), ZLIB_LEVEL)
+    return compressed if len(compressed) < len(text) else text
+
+
+def read_text(value):
+    """Returns a stored value as text, decompressing it if it was stored compressed."""
+    if isinstance(value, (bytes, memoryview)):
+        value = bytes(value)
+        if value[:1] == ZLIB_MARKER:
+            return zlib.decompress(value[1:]).decode('utf-8')
+        return value.decode('utf-8')
+    return value
+
+
+def compression_enabled(cur):
+    """Whether new values of the compressed columns are to be written compressed."""
+    cur.execute("SELECT value FROM app_settings WHERE key = ?", (COMPRESSION_SETTING,))
+    row = cur.fetchone()
+    return bool(row) and row[0] == '1'